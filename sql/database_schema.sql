@@ -15,6 +15,9 @@ CREATE TABLE IF NOT EXISTS analytics.fact_contrato (
   status         TEXT
 );
 
+-- fact_premio e fact_resgate são convertidas pelo ETL em tabelas particionadas
+-- por mês (data_premio / data_resgate), com PK (id, data); ver PARTITIONED e
+-- FACT_INDEXES em src/etl_capitalizacao.py.
 CREATE TABLE IF NOT EXISTS analytics.fact_premio (
   id            BIGINT PRIMARY KEY,
   contrato_id   BIGINT REFERENCES analytics.fact_contrato(id),
@@ -0,0 +1,288 @@
+"""
+Tabelas agregadas mantidas pelo ETL para o relatório e o Power BI.
+
+- KPI_TABLE: total mensal de contribuições por mês de data_inicio.
+- AGG_CONTRATO / AGG_PREMIO: contratos e prêmios por mês × estado ×
+  faixa_etaria × tipo_titulo × status.
+
+Nas cargas incrementais só os meses tocados são recalculados, somados aos
+meses afetados pelas linhas reescritas registradas em
+analytics.etl_alteracao (ver etl_capitalizacao._log_changes), que
+`refresh_bi_aggregates` consome na mesma transação.
+"""
+from __future__ import annotations
+from typing import Optional
+import pandas as pd
+from sqlalchemy import text
+
+from utils_db import log
+
+
+# ----------------------------- KPI ----------------------------- #
+KPI_TABLE = "analytics.kpi_contribuicoes_mensais"
+
+# mês de data_inicio, antes da alteração, dos contratos reescritos pelo UPSERT
+# (_log_changes): quem mudou de data sai do mês antigo (NULL = data nula)
+SQL_MESES_KPI_ALTERADOS = """
+    SELECT DISTINCT mes FROM analytics.etl_alteracao WHERE tabela = 'fact_contrato'
+"""
+
+
+def create_kpi_table(con, meses: Optional[set] = None, full: bool = False) -> None:
+    """
+    Mantém a tabela de agregação mensal sem DROP: a tabela nunca some para o
+    Power BI/relatório e as mudanças aparecem de uma vez no COMMIT.
+    - full=True (ou tabela nova): recalcula todos os meses.
+    - senão: recalcula só `meses` (os tocados pela carga) mais os meses que
+      contratos reescritos deixaram (analytics.etl_alteracao, que
+      refresh_bi_aggregates consome depois) e faz merge por mês.
+    """
+    existed = con.execute(text(f"SELECT to_regclass('{KPI_TABLE}')")).scalar() is not None
+    con.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {KPI_TABLE} (
+          mes           TIMESTAMPTZ,
+          total_mensal  NUMERIC
+        );
+        CREATE UNIQUE INDEX IF NOT EXISTS kpi_contribuicoes_mensais_mes_uq
+          ON {KPI_TABLE} (mes);
+    """))
+
+    if full or not existed:
+        con.execute(text(f"DELETE FROM {KPI_TABLE}"))
+        con.execute(text(f"""
+            INSERT INTO {KPI_TABLE} (mes, total_mensal)
+            SELECT date_trunc('month', data_inicio) AS mes,
+                   SUM(valor_mensal) AS total_mensal
+            FROM analytics.fact_contrato
+            GROUP BY 1
+            ORDER BY 1;
+        """))
+        log(f" - KPI mensal ({KPI_TABLE}) recalculada por completo.")
+        return
+
+    meses = set(meses or ()) | set(con.execute(text(SQL_MESES_KPI_ALTERADOS)).scalars())
+    datas = sorted(m for m in meses if m is not None)
+    if datas:
+        con.execute(text(f"""
+            WITH alvo AS (
+              SELECT unnest(CAST(:meses AS date[])) AS mes
+            )
+            INSERT INTO {KPI_TABLE} (mes, total_mensal)
+            SELECT date_trunc('month', c.data_inicio) AS mes,
+                   SUM(c.valor_mensal) AS total_mensal
+            FROM alvo a
+            JOIN analytics.fact_contrato c
+              ON c.data_inicio >= a.mes
+             AND c.data_inicio <  a.mes + INTERVAL '1 month'
+            GROUP BY 1
+            ON CONFLICT (mes) DO UPDATE SET total_mensal = EXCLUDED.total_mensal;
+        """), {"meses": datas})
+        # meses que ficaram sem contrato algum saem da KPI
+        con.execute(text(f"""
+            DELETE FROM {KPI_TABLE} k
+            WHERE k.mes::date = ANY(CAST(:meses AS date[]))
+              AND NOT EXISTS (
+                SELECT 1 FROM analytics.fact_contrato c
+                WHERE c.data_inicio >= k.mes::date
+                  AND c.data_inicio <  k.mes::date + INTERVAL '1 month'
+              );
+        """), {"meses": datas})
+    if None in meses:
+        con.execute(text(f"DELETE FROM {KPI_TABLE} WHERE mes IS NULL"))
+        con.execute(text(f"""
+            INSERT INTO {KPI_TABLE} (mes, total_mensal)
+            SELECT NULL, SUM(valor_mensal)
+            FROM analytics.fact_contrato
+            WHERE data_inicio IS NULL
+            HAVING COUNT(*) > 0;
+        """))
+    log(f" - KPI mensal ({KPI_TABLE}) atualizada em {len(meses)} mês(es).")
+
+
+# ----------------------------- AGREGADOS BI ----------------------------- #
+# Grão: mês × estado × faixa_etaria × tipo_titulo × status. Cada contrato cai
+# em exatamente uma linha de AGG_CONTRATO, então contagens de contratos (e de
+# contratos com prêmio/resgate) podem ser somadas em qualquer recorte e
+# equivalem ao DISTINCTCOUNT sobre o fato.
+AGG_CONTRATO = "analytics.agg_contrato_mensal"
+AGG_PREMIO = "analytics.agg_premio_mensal"
+AGG_DIMENSOES = "estado, faixa_etaria, tipo_titulo, status"
+
+AGG_DDL = f"""
+    CREATE TABLE IF NOT EXISTS {AGG_CONTRATO} (
+      mes                    DATE,
+      estado                 TEXT,
+      faixa_etaria           TEXT,
+      tipo_titulo            TEXT,
+      status                 TEXT,
+      contratos              BIGINT NOT NULL,
+      valor_total            NUMERIC,
+      contratos_com_premio   BIGINT NOT NULL,
+      contratos_com_resgate  BIGINT NOT NULL,
+      premios_valor          NUMERIC
+    );
+    CREATE INDEX IF NOT EXISTS agg_contrato_mensal_mes_ix ON {AGG_CONTRATO} (mes);
+
+    CREATE TABLE IF NOT EXISTS {AGG_PREMIO} (
+      mes            DATE NOT NULL,
+      estado         TEXT,
+      faixa_etaria   TEXT,
+      tipo_titulo    TEXT,
+      status         TEXT,
+      premios        BIGINT NOT NULL,
+      premios_valor  NUMERIC
+    );
+    CREATE INDEX IF NOT EXISTS agg_premio_mensal_mes_ix ON {AGG_PREMIO} (mes);
+"""
+
+# {filtro} recorta os contratos (mês de data_inicio) a recalcular
+SQL_AGG_CONTRATO = f"""
+    WITH c AS (
+      SELECT c.id, c.cliente_id, c.data_inicio, c.valor_mensal, c.tipo_titulo, c.status
+      FROM analytics.fact_contrato c
+      WHERE {{filtro}}
+    ),
+    p AS (
+      SELECT contrato_id, SUM(valor) AS valor
+      FROM analytics.fact_premio
+      WHERE contrato_id IN (SELECT id FROM c)
+      GROUP BY contrato_id
+    ),
+    r AS (
+      SELECT DISTINCT contrato_id
+      FROM analytics.fact_resgate
+      WHERE contrato_id IN (SELECT id FROM c)
+    )
+    INSERT INTO {AGG_CONTRATO} (mes, {AGG_DIMENSOES}, contratos, valor_total,
+                                contratos_com_premio, contratos_com_resgate, premios_valor)
+    SELECT CAST(date_trunc('month', c.data_inicio) AS date),
+           d.estado, d.faixa_etaria, c.tipo_titulo, c.status,
+           COUNT(*),
+           SUM(c.valor_mensal),
+           COUNT(p.contrato_id),
+           COUNT(r.contrato_id),
+           COALESCE(SUM(p.valor), 0)
+    FROM c
+    LEFT JOIN analytics.dim_cliente d ON d.id = c.cliente_id
+    LEFT JOIN p ON p.contrato_id = c.id
+    LEFT JOIN r ON r.contrato_id = c.id
+    GROUP BY 1, 2, 3, 4, 5
+"""
+
+# {filtro} recorta os prêmios (mês de data_premio; poda as partições)
+SQL_AGG_PREMIO = f"""
+    INSERT INTO {AGG_PREMIO} (mes, {AGG_DIMENSOES}, premios, premios_valor)
+    SELECT CAST(date_trunc('month', pr.data_premio) AS date),
+           d.estado, d.faixa_etaria, c.tipo_titulo, c.status,
+           COUNT(*),
+           SUM(pr.valor)
+    FROM analytics.fact_premio pr
+    LEFT JOIN analytics.fact_contrato c ON c.id = pr.contrato_id
+    LEFT JOIN analytics.dim_cliente d   ON d.id = c.cliente_id
+    WHERE {{filtro}}
+    GROUP BY 1, 2, 3, 4, 5
+"""
+
+
+def _month_filter(col: str, mes) -> tuple[str, dict]:
+    """Filtro sargável (faixa) para um mês; mes=None pega as datas nulas."""
+    if mes is None:
+        return f"{col} IS NULL", {}
+    fim = (pd.Timestamp(mes) + pd.offsets.MonthBegin(1)).date()
+    return f"{col} >= :lo AND {col} < :hi", {"lo": mes, "hi": fim}
+
+
+def _contract_months_of(con, fact: str, date_col: str, meses) -> set:
+    """Meses de data_inicio dos contratos citados por `fact` nos `meses` carregados."""
+    out = set()
+    for mes in meses:
+        if mes is None:
+            continue
+        filtro, params = _month_filter(f"f.{date_col}", mes)
+        out.update(con.execute(text(f"""
+            SELECT DISTINCT CAST(date_trunc('month', c.data_inicio) AS date)
+            FROM analytics.{fact} f
+            JOIN analytics.fact_contrato c ON c.id = f.contrato_id
+            WHERE {filtro}
+        """), params).scalars())
+    return out
+
+
+# meses afetados pelas linhas reescritas em analytics.etl_alteracao (ver
+# _log_changes/_delete_moved): cliente -> meses dos contratos e dos prêmios
+# dele; contrato -> seu mês atual, o de antes da alteração e os dos seus
+# prêmios; prêmio que mudou de data -> o mês antigo
+SQL_MESES_CONTRATO_ALTERADOS = """
+    SELECT DISTINCT CAST(date_trunc('month', c.data_inicio) AS date)
+    FROM analytics.fact_contrato c
+    WHERE c.cliente_id IN (SELECT id FROM analytics.etl_alteracao WHERE tabela = 'dim_cliente')
+       OR c.id IN (SELECT id FROM analytics.etl_alteracao WHERE tabela = 'fact_contrato')
+    UNION
+    SELECT mes FROM analytics.etl_alteracao WHERE tabela = 'fact_contrato'
+"""
+
+SQL_MESES_PREMIO_ALTERADOS = """
+    SELECT DISTINCT CAST(date_trunc('month', pr.data_premio) AS date)
+    FROM analytics.fact_premio pr
+    JOIN analytics.fact_contrato c ON c.id = pr.contrato_id
+    WHERE c.cliente_id IN (SELECT id FROM analytics.etl_alteracao WHERE tabela = 'dim_cliente')
+       OR c.id IN (SELECT id FROM analytics.etl_alteracao WHERE tabela = 'fact_contrato')
+    UNION
+    SELECT mes FROM analytics.etl_alteracao WHERE tabela = 'fact_premio' AND mes IS NOT NULL
+"""
+
+
+def _changed_months(con) -> tuple[set, set]:
+    """(meses de contrato, meses de prêmio) afetados pelas alterações registradas."""
+    contrato = set(con.execute(text(SQL_MESES_CONTRATO_ALTERADOS)).scalars())
+    premio = set(con.execute(text(SQL_MESES_PREMIO_ALTERADOS)).scalars())
+    return contrato, premio
+
+
+def _rebuild(con, table: str, sql: str, col: str, meses) -> int:
+    """DELETE + INSERT mês a mês (ou tudo, com meses=None) na mesma transação."""
+    if meses is None:
+        con.execute(text(f"DELETE FROM {table}"))
+        return max(con.execute(text(sql.format(filtro="TRUE"))).rowcount, 0)
+    linhas = 0
+    for mes in meses:
+        filtro, params = _month_filter(col, mes)
+        con.execute(text(f"DELETE FROM {table} WHERE {_month_filter('mes', mes)[0]}"), params)
+        linhas += max(con.execute(text(sql.format(filtro=filtro)), params).rowcount, 0)
+    return linhas
+
+
+def refresh_bi_aggregates(con, meses: Optional[dict] = None, full: bool = False) -> int:
+    """
+    Mantém AGG_CONTRATO e AGG_PREMIO, que respondem às medidas do Power BI
+    (Contratos, Títulos Ativos, Valor Total, Prêmios Pagos, Taxa de Resgate)
+    com milhares de linhas em vez de varrer os fatos.
+    - full=True (ou tabelas novas): recalcula tudo.
+    - senão: recalcula os meses de contrato carregados, os meses dos contratos
+      que receberam prêmio/resgate nesta carga, os meses de prêmio carregados
+      e os meses afetados por clientes/contratos reescritos pelo UPSERT
+      (analytics.etl_alteracao, consumida aqui na mesma transação).
+    Retorna o nº de linhas gravadas.
+    """
+    existed = con.execute(text(f"SELECT to_regclass('{AGG_PREMIO}')")).scalar() is not None
+    con.execute(text(AGG_DDL))
+    if full or not existed or meses is None:
+        linhas = (_rebuild(con, AGG_CONTRATO, SQL_AGG_CONTRATO, "c.data_inicio", None)
+                  + _rebuild(con, AGG_PREMIO, SQL_AGG_PREMIO, "pr.data_premio", None))
+        con.execute(text("DELETE FROM analytics.etl_alteracao"))
+        log(f" - Agregados BI recalculados por completo ({linhas} linhas).")
+        return linhas
+
+    meses_contrato, meses_premio = _changed_months(con)
+    meses_contrato |= set(meses.get("fact_contrato", ()))
+    meses_contrato |= _contract_months_of(con, "fact_premio", "data_premio", meses.get("fact_premio", ()))
+    meses_contrato |= _contract_months_of(con, "fact_resgate", "data_resgate", meses.get("fact_resgate", ()))
+    meses_premio |= set(meses.get("fact_premio", ()))
+    meses_premio.discard(None)
+
+    linhas = (_rebuild(con, AGG_CONTRATO, SQL_AGG_CONTRATO, "c.data_inicio", sorted(meses_contrato, key=str))
+              + _rebuild(con, AGG_PREMIO, SQL_AGG_PREMIO, "pr.data_premio", sorted(meses_premio)))
+    con.execute(text("DELETE FROM analytics.etl_alteracao"))
+    log(f" - Agregados BI atualizados ({len(meses_contrato)} mês(es) de contrato, "
+        f"{len(meses_premio)} de prêmio; {linhas} linhas).")
+    return linhas
@@ -1,33 +1,82 @@
 from __future__ import annotations
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
 from typing import List, Dict, Optional
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-BASE = "https://api.bcb.gov.br/dados/serie/bcdata.sgs.{sid}/dados"
+# BCB_SGS_URL permite apontar para um servidor local (testes/homologação)
+BASE = os.getenv("BCB_SGS_URL", "https://api.bcb.gov.br/dados/serie/bcdata.sgs.{sid}/dados")
 
 DEFAULT_HEADERS = {
     "Accept": "application/json",
     "User-Agent": "Brasilcap-Analytics/1.0 (contato: seuemail@exemplo.com)"
 }
 
-def _safe_get(url: str, params: Optional[dict] = None) -> List[Dict]:
+TIMEOUT = 30
+MAX_RETRIES = 3
+BACKOFF = 0.5          # 0.5s, 1s, 2s entre tentativas
+MAX_WORKERS = 4
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """
+    Sessão HTTP única do módulo (keep-alive + pool de conexões) com retentativas
+    limitadas e backoff exponencial para falhas de rede e 429/5xx.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(
+                total=MAX_RETRIES,
+                backoff_factor=BACKOFF,
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=("GET",),
+                respect_retry_after_header=True,
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS,
+                                  max_retries=retry)
+            s = requests.Session()
+            s.headers.update(DEFAULT_HEADERS)
+            s.mount("https://", adapter)
+            s.mount("http://", adapter)
+            _session = s
+        return _session
+
+
+def _safe_get(url: str, params: Optional[dict] = None, strict: bool = False) -> List[Dict]:
     """
     Faz GET com headers/timeout e valida o JSON retornado.
     A API retorna lista de objetos com chaves 'data' e 'valor'.
+    strict=True propaga falhas (após as retentativas) em vez de devolver [];
+    404 continua sendo "sem dados no período".
     """
     try:
-        resp = requests.get(url, headers=DEFAULT_HEADERS, params=params or {}, timeout=30)
+        resp = get_session().get(url, params=params or {}, timeout=TIMEOUT)
+        if strict and resp.status_code == 404:
+            return []
         resp.raise_for_status()
         data = resp.json()
         return data if isinstance(data, list) else []
     except Exception as e:
+        if strict:
+            raise
         print(f"[api_bcb] Erro ao consultar {url}: {e}")
         return []
 
 def _get_series(series_id: int,
                 formato: str = "json",
                 dataInicial: Optional[str] = None,
-                dataFinal: Optional[str] = None) -> pd.DataFrame:
+                dataFinal: Optional[str] = None,
+                strict: bool = False) -> pd.DataFrame:
     params = {"formato": formato}
     if dataInicial:
         params["dataInicial"] = dataInicial
@@ -35,7 +84,7 @@ def _get_series(series_id: int,
         params["dataFinal"] = dataFinal
 
     url = BASE.format(sid=series_id)
-    raw = _safe_get(url, params=params)
+    raw = _safe_get(url, params=params, strict=strict)
     if not raw:
         return pd.DataFrame(columns=["data", "valor"])
 
@@ -48,10 +97,54 @@ def _get_series(series_id: int,
     df = df.dropna(subset=["data", "valor"]).sort_values("data").reset_index(drop=True)
     return df
 
+
+def get_series_incremental(series_id: int, cached: Optional[pd.DataFrame] = None,
+                           strict: bool = False) -> pd.DataFrame:
+    """
+    Histórico completo da série [data, valor], baixando só as datas posteriores
+    à última de `cached` (via dataInicial). Sem cache, baixa tudo.
+    """
+    if cached is None or cached.empty:
+        return _get_series(series_id, strict=strict)
+
+    cached = cached[["data", "valor"]].copy()
+    cached["data"] = pd.to_datetime(cached["data"])
+    inicio = cached["data"].max().date() + timedelta(days=1)
+    if inicio > date.today():
+        return cached.sort_values("data").reset_index(drop=True)
+
+    novos = _get_series(series_id,
+                        dataInicial=inicio.strftime("%d/%m/%Y"),
+                        dataFinal=date.today().strftime("%d/%m/%Y"),
+                        strict=strict)
+    df = pd.concat([cached, novos], ignore_index=True)
+    return df.drop_duplicates("data", keep="last").sort_values("data").reset_index(drop=True)
+
+
+def get_many(series: Dict[int, Optional[pd.DataFrame]], strict: bool = False) -> Dict[int, pd.DataFrame]:
+    """
+    Busca várias séries SGS em paralelo: {id: cache ou None} -> {id: [data, valor]}.
+    strict=True omite do resultado as séries cuja consulta falhou.
+    """
+    workers = max(1, min(MAX_WORKERS, len(series)))
+    out: Dict[int, pd.DataFrame] = {}
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        futures = {sid: ex.submit(get_series_incremental, sid, cached, strict)
+                   for sid, cached in series.items()}
+        for sid, f in futures.items():
+            try:
+                out[sid] = f.result()
+            except Exception as e:
+                if not strict:
+                    raise
+                print(f"[api_bcb] Série {sid} indisponível: {e}")
+    return out
+
+
 def get_cdi(dataInicial: Optional[str] = None, dataFinal: Optional[str] = None) -> pd.DataFrame:
     """
-    CDI anual (% a.a.) — série 12.
-    Retorna colunas: [data, cdi_aa]
+    CDI diário (% a.d.) — série 12.
+    Retorna colunas: [data, cdi_aa] (nome histórico; o valor é a taxa diária)
     """
     df = _get_series(12, dataInicial=dataInicial, dataFinal=dataFinal)
     return df.rename(columns={"valor": "cdi_aa"})
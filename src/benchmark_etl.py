@@ -0,0 +1,222 @@
+"""
+Benchmark ponta a ponta do ETL (etl_capitalizacao) com vazão por etapa.
+
+Para cada escala (nº de contratos) gera um dataset com gerar_dados_fake,
+roda as etapas do ETL contra um Postgres descartável e mede, por etapa,
+linhas, segundos e linhas/s:
+
+    leitura_csv · parse (tipagem/validação de esquema_fontes)
+    · enrich_with_bcb (CDI sintético, sem rede)
+    · load_tables · create_kpi_table · refresh_bi_aggregates
+
+O resultado vai para um JSON; com --baseline ele é comparado com uma
+execução anterior e o script sai com código 1 se alguma etapa ficar mais
+lenta que a tolerância.
+
+    python src/benchmark_etl.py --escalas 10000,1000000 --saida data/bench/atual.json \\
+        --baseline data/bench/base.json --tolerancia 0.2
+
+Sem --dsn, sobe um cluster temporário com initdb/pg_ctl (precisam estar no
+PATH ou em --pg-bin) e o descarta no final.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+import etl_capitalizacao as etl
+from esquema_fontes import ParserFonte
+
+ROOT = Path(__file__).resolve().parents[1]
+SAIDA_PADRAO = ROOT / "data" / "bench" / "etl_benchmark.json"
+CLIENTES_POR_CONTRATO = 250 / 600
+
+
+# ----------------------------- POSTGRES DESCARTÁVEL ----------------------------- #
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextmanager
+def throwaway_postgres(pg_bin: str = None):
+    """Cluster Postgres temporário (initdb + pg_ctl) acessível por socket local."""
+    def exe(nome: str) -> str:
+        path = shutil.which(nome, path=pg_bin) if pg_bin else shutil.which(nome)
+        if not path:
+            raise RuntimeError(f"{nome} não encontrado (use --dsn ou --pg-bin).")
+        return path
+
+    tmp = Path(tempfile.mkdtemp(prefix="etl_bench_pg_"))
+    data, port = tmp / "data", _free_port()
+    subprocess.run([exe("initdb"), "-D", str(data), "-U", "postgres", "--auth=trust"],
+                   check=True, stdout=subprocess.DEVNULL)
+    subprocess.run([exe("pg_ctl"), "-D", str(data), "-w", "-l", str(tmp / "pg.log"),
+                    "-o", f"-p {port} -k {tmp} -c listen_addresses=''", "start"],
+                   check=True, stdout=subprocess.DEVNULL)
+    try:
+        yield f"postgresql+psycopg2://postgres@/postgres?host={tmp}&port={port}"
+    finally:
+        subprocess.run([exe("pg_ctl"), "-D", str(data), "-m", "fast", "stop"],
+                       stdout=subprocess.DEVNULL)
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+# ----------------------------- MEDIÇÃO ----------------------------- #
+@contextmanager
+def _etapa(resultados: list, escala: int, nome: str, linhas: int = 0):
+    """Mede o bloco; o chamador pode ajustar reg["linhas"] dentro dele."""
+    reg = {"linhas": linhas}
+    t0 = time.perf_counter()
+    yield reg
+    dt = time.perf_counter() - t0
+    linhas = reg["linhas"]
+    resultados.append({
+        "escala": escala, "etapa": nome, "linhas": int(linhas),
+        "segundos": round(dt, 4), "linhas_s": round(linhas / dt, 1) if dt > 0 else None,
+    })
+    etl.log(f"   [{escala}] {nome}: {linhas} linhas em {dt:.2f}s")
+
+
+def _cdi_sintetico(desde) -> pd.DataFrame:
+    """
+    Série CDI fictícia nos dias úteis, como a série 12 do SGS: taxa diária
+    (% a.d.) equivalente a ~10,65% a.a.
+    """
+    datas = pd.bdate_range(pd.Timestamp(desde) - pd.Timedelta(days=30), pd.Timestamp.today())
+    rng = np.random.default_rng(12)
+    ao_ano = 10.65 + rng.normal(0, 0.05, len(datas))
+    return pd.DataFrame({"data": datas, "cdi_aa": ((1 + ao_ano / 100) ** (1 / 252) - 1) * 100})
+
+
+def _gerar_dataset(contratos: int, destino: Path, seed: int) -> None:
+    clientes = max(1, round(contratos * CLIENTES_POR_CONTRATO))
+    subprocess.run([sys.executable, str(Path(__file__).with_name("gerar_dados_fake.py")),
+                    "--clientes", str(clientes), "--contratos", str(contratos),
+                    "--seed", str(seed), "--out", str(destino)],
+                   check=True, stdout=subprocess.DEVNULL)
+
+
+def run_scale(escala: int, eng, seed: int = 42) -> list[dict]:
+    """Roda todas as etapas para uma escala; eng=None mede só as etapas locais."""
+    resultados: list[dict] = []
+    with tempfile.TemporaryDirectory(prefix="etl_bench_raw_") as raw:
+        etl.log(f" - Gerando dataset com {escala} contratos...")
+        _gerar_dataset(escala, Path(raw), seed)
+        etl.RAW = Path(raw)
+
+        # leitura do CSV como texto e parse tipado medidos em separado
+        # (no ETL os dois acontecem em read_csv_or_fail)
+        brutos, frames = {}, {}
+        with _etapa(resultados, escala, "leitura_csv") as reg:
+            for arquivo, table, _ in etl.FONTES:
+                brutos[table] = pd.read_csv(etl.RAW / arquivo, **ParserFonte.read_kwargs)
+                reg["linhas"] += len(brutos[table])
+
+        with _etapa(resultados, escala, "parse", reg["linhas"]):
+            for arquivo, table, _ in etl.FONTES:
+                frames[table] = ParserFonte(table, arquivo).parse(brutos.pop(table))
+        total = sum(len(df) for df in frames.values())
+
+        contratos = frames["fact_contrato"]
+        with _etapa(resultados, escala, "enrich_with_bcb", len(contratos)):
+            idx = etl.build_cdi_index(_cdi_sintetico(contratos["data_inicio"].min()))
+            frames["fact_contrato"] = etl.enrich_with_bcb(contratos, idx)
+
+        if eng is not None:
+            with eng.begin() as con:
+                con.exec_driver_sql("DROP SCHEMA IF EXISTS analytics CASCADE")
+                etl.apply_schema(con)
+            with eng.begin() as con:
+                with _etapa(resultados, escala, "load_tables", total):
+                    etl.load_tables(con, frames["dim_cliente"], frames["fact_contrato"],
+                                    frames["fact_premio"], frames["fact_resgate"])
+                with _etapa(resultados, escala, "create_kpi_table", len(contratos)):
+                    etl.create_kpi_table(con, full=True)
+                with _etapa(resultados, escala, "refresh_bi_aggregates", total):
+                    etl.refresh_bi_aggregates(con, full=True)
+    return resultados
+
+
+# ----------------------------- BASELINE ----------------------------- #
+def compare(atual: list[dict], baseline: list[dict], tolerancia: float) -> list[str]:
+    """Etapas (escala/etapa) mais lentas que baseline * (1 + tolerancia)."""
+    base = {(r["escala"], r["etapa"]): r["segundos"] for r in baseline}
+    regressoes = []
+    for r in atual:
+        ref = base.get((r["escala"], r["etapa"]))
+        if ref and r["segundos"] > ref * (1 + tolerancia):
+            regressoes.append(f"{r['escala']}/{r['etapa']}: {r['segundos']:.2f}s "
+                              f"vs {ref:.2f}s (+{r['segundos'] / ref - 1:.0%})")
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do ETL por etapa.")
+    parser.add_argument("--escalas", default="10000,1000000",
+                        help="Nº de contratos por execução, separados por vírgula (ex.: 10000,1000000,10000000).")
+    parser.add_argument("--dsn", default=None,
+                        help="URL SQLAlchemy de um Postgres descartável (padrão: sobe um com initdb).")
+    parser.add_argument("--pg-bin", default=None, help="Diretório com initdb/pg_ctl.")
+    parser.add_argument("--no-db", action="store_true",
+                        help="Mede só as etapas locais (leitura, parse, BCB).")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--saida", type=Path, default=SAIDA_PADRAO)
+    parser.add_argument("--baseline", type=Path, default=None)
+    parser.add_argument("--tolerancia", type=float, default=0.2,
+                        help="Regressão = etapa mais lenta que baseline * (1 + tolerancia).")
+    args = parser.parse_args()
+    escalas = [int(x) for x in args.escalas.split(",") if x.strip()]
+
+    resultados: list[dict] = []
+    if args.no_db:
+        for escala in escalas:
+            resultados += run_scale(escala, None, args.seed)
+    else:
+        from sqlalchemy import create_engine
+        with (nullcontext(args.dsn) if args.dsn else throwaway_postgres(args.pg_bin)) as dsn:
+            eng = create_engine(dsn)
+            try:
+                for escala in escalas:
+                    resultados += run_scale(escala, eng, args.seed)
+            finally:
+                eng.dispose()
+
+    args.saida.parent.mkdir(parents=True, exist_ok=True)
+    args.saida.write_text(json.dumps({
+        "meta": {
+            "quando": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "cpus": os.cpu_count(),
+            "escalas": escalas,
+        },
+        "resultados": resultados,
+    }, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f">>> Resultados em {args.saida}")
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))["resultados"]
+        regressoes = compare(resultados, baseline, args.tolerancia)
+        if regressoes:
+            print(f" ! Regressões acima de {args.tolerancia:.0%}:")
+            for r in regressoes:
+                print(f"   · {r}")
+            sys.exit(1)
+        print(f" - Sem regressões acima de {args.tolerancia:.0%} em relação a {args.baseline}.")
+
+
+if __name__ == "__main__":
+    main()
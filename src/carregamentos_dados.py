@@ -1,9 +1,17 @@
+import argparse
 import os
+import time
+from datetime import date, timedelta
 from pathlib import Path
 import pandas as pd
 from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
 from dotenv import load_dotenv
 
+from esquema_fontes import ParserFonte
+from staging_cache import file_sha256, read_staged
+from utils_db import copy_frame
+
 load_dotenv()
 
 PG_HOST = os.getenv("PG_HOST", "localhost")
@@ -70,66 +78,185 @@ def create_schema_and_tables():
       primeiro_dia_mes date, ultimo_dia_mes date,
       ano_mes text, mes_abrev text
     );
+    ALTER TABLE bi.dim_calendario
+      ADD COLUMN IF NOT EXISTS eh_feriado boolean,
+      ADD COLUMN IF NOT EXISTS feriado text,
+      ADD COLUMN IF NOT EXISTS eh_dia_util boolean;
     """
     with engine.begin() as conn:
         conn.execute(text(ddl))
     print("✅ Schema e tabelas 'bi' verificados/criados.")
 
-def load_raw_csvs_into_bi():
-    df = pd.read_csv(RAW / "clientes.csv")
-    df = to_date(df, ["data_inicio"])
-    with engine.begin() as conn:
-        conn.execute(text("TRUNCATE bi.clientes RESTART IDENTITY;"))
-    df.to_sql("clientes", engine, schema="bi", if_exists="append", index=False)
-    print(f"[ok] bi.clientes: {len(df)}")
-
-    df = pd.read_csv(RAW / "contratos.csv")
-    df = to_date(df, ["data_inicio"])
-    if "valor_mensal" in df.columns:
-        df = df.rename(columns={"valor_mensal": "valor"})
-    with engine.begin() as conn:
-        conn.execute(text("TRUNCATE bi.contratos RESTART IDENTITY;"))
-    df.to_sql("contratos", engine, schema="bi", if_exists="append", index=False)
-    print(f"[ok] bi.contratos: {len(df)}")
-
-    df = pd.read_csv(RAW / "premios.csv")
-    df = to_date(df, ["data_premio"])
-    if "valor" in df.columns:
-        df = df.rename(columns={"valor": "valor_premio"})
-    with engine.begin() as conn:
-        conn.execute(text("TRUNCATE bi.premios RESTART IDENTITY;"))
-    df.to_sql("premios", engine, schema="bi", if_exists="append", index=False)
-    print(f"[ok] bi.premios: {len(df)}")
+# arquivo bruto -> (tabela em bi, esquema em esquema_fontes, colunas de data,
+# renomeações para o layout bi)
+BI_FONTES = [
+    ("clientes.csv",  "clientes",  "dim_cliente",   ["data_inicio"],  {}),
+    ("contratos.csv", "contratos", "fact_contrato", ["data_inicio"],  {"valor_mensal": "valor"}),
+    ("premios.csv",   "premios",   "fact_premio",   ["data_premio"],  {"valor": "valor_premio"}),
+    ("resgates.csv",  "resgates",  "fact_resgate",  ["data_resgate"], {"data_resgate": "data_ref",
+                                                                       "valor": "valor_resgate"}),
+]
+SWAP_LOCK_TIMEOUT = "2s"
+SWAP_TENTATIVAS = 5
+
+def _read_bi_source(arquivo, esquema, date_cols, renomear) -> pd.DataFrame:
+    """
+    Mesma leitura tipada/validada do ETL (parser de esquema_fontes), então o
+    Parquet de data/staging e a quarentena (por SHA do arquivo) são
+    compartilhados entre os dois; reprovadas não entram em bi.*.
+    """
+    sha = file_sha256(RAW / arquivo)
+    parser = ParserFonte(esquema, arquivo, sha=sha)
+    df = read_staged(RAW / arquivo, date_cols, sha=sha, parser=parser)
+    if parser.quarentena.linhas:
+        print(f"⚠️  {arquivo}: {parser.quarentena.linhas} linha(s) em quarentena -> {parser.quarentena.path}")
+    df = to_date(df, date_cols)
+    return df.rename(columns=renomear)
+
+def _copy_into(conn, df: pd.DataFrame, dest: str, schema: str, table: str) -> None:
+    """COPY ... FROM STDIN do DataFrame para `dest` (layout de schema.table)."""
+    tipos = dict(conn.execute(text("""
+        SELECT column_name, data_type FROM information_schema.columns
+        WHERE table_schema = :sch AND table_name = :tab
+    """), {"sch": schema, "tab": table}).fetchall())
+    cur = conn.connection.cursor()
+    try:
+        copy_frame(cur, df, dest, list(df.columns), tipos)
+    finally:
+        cur.close()
+
+def _load_truncate() -> None:
+    """Modo legado: TRUNCATE + to_sql por tabela (leitores veem a tabela vazia)."""
+    for arquivo, table, esquema, date_cols, renomear in BI_FONTES:
+        df = _read_bi_source(arquivo, esquema, date_cols, renomear)
+        with engine.begin() as conn:
+            conn.execute(text(f"TRUNCATE bi.{table} RESTART IDENTITY;"))
+        df.to_sql(table, engine, schema="bi", if_exists="append", index=False)
+        print(f"[ok] bi.{table}: {len(df)}")
 
-    df = pd.read_csv(RAW / "resgates.csv")
-    df = to_date(df, ["data_resgate"])
-    df = df.rename(columns={"data_resgate": "data_ref", "valor": "valor_resgate"})
+def _fill_shadow(table: str, df: pd.DataFrame) -> None:
+    """Cria bi.<table>__novo sem índices, carrega via COPY e só então cria PK/índices."""
+    shadow = f"bi.{table}__novo"
     with engine.begin() as conn:
-        conn.execute(text("TRUNCATE bi.resgates RESTART IDENTITY;"))
-    df.to_sql("resgates", engine, schema="bi", if_exists="append", index=False)
-    print(f"[ok] bi.resgates: {len(df)}")
+        conn.execute(text(f"DROP TABLE IF EXISTS {shadow}"))
+        conn.execute(text(f"CREATE TABLE {shadow} (LIKE bi.{table} INCLUDING DEFAULTS)"))
+        _copy_into(conn, df, shadow, "bi", table)
+        conn.execute(text(f"ALTER TABLE {shadow} ADD CONSTRAINT {table}__novo_pkey PRIMARY KEY (id)"))
+        conn.execute(text(f"ANALYZE {shadow}"))
+    print(f"[ok] bi.{table}__novo: {len(df)}")
 
-def refresh_dim_calendario():
+def _swap_shadows(tables) -> None:
     """
-    Cria/popula o calendário cobrindo:
-    - do menor entre data_inicio (contratos), data_premio (prêmios), data_ref (resgates)
-    - até hoje + 365 dias
+    Troca as quatro tabelas pelas sombras numa única transação: renomeia,
+    recria as views analytics.* (que apontam para a tabela, não para o nome)
+    e descarta as antigas. Com lock_timeout curto a troca desiste em vez de
+    enfileirar leitores atrás dela, e é tentada de novo.
     """
-    sql = """
-    WITH limites AS (
-      SELECT
-        COALESCE(
-          LEAST(
-            (SELECT MIN(data_inicio) FROM bi.contratos),
-            (SELECT MIN(data_premio) FROM bi.premios),
-            (SELECT MIN(data_ref)    FROM bi.resgates)
-          ),
-          DATE '2018-01-01'
-        )::date                                           AS start_date,
-        (CURRENT_DATE + INTERVAL '365 days')::date        AS end_date
-    )
+    for tentativa in range(1, SWAP_TENTATIVAS + 1):
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'"))
+                for t in tables:
+                    conn.execute(text(f"""
+                        ALTER TABLE bi.{t} RENAME TO {t}__antigo;
+                        ALTER TABLE bi.{t}__antigo RENAME CONSTRAINT {t}_pkey TO {t}__antigo_pkey;
+                        ALTER TABLE bi.{t}__novo RENAME TO {t};
+                        ALTER TABLE bi.{t} RENAME CONSTRAINT {t}__novo_pkey TO {t}_pkey;
+                    """))
+                conn.execute(text(_analytics_views_ddl()))
+                for t in tables:
+                    conn.execute(text(f"DROP TABLE bi.{t}__antigo"))
+            print(f"🔁 Troca atômica concluída: {', '.join(f'bi.{t}' for t in tables)}")
+            return
+        except OperationalError as e:
+            if "lock timeout" not in str(e) or tentativa == SWAP_TENTATIVAS:
+                raise
+            print(f"⏳ Tabelas em uso, nova tentativa da troca ({tentativa}/{SWAP_TENTATIVAS})...")
+            time.sleep(tentativa)
+
+def _load_swap() -> None:
+    """Carga sem janela vazia: sombras cheias via COPY e troca atômica das quatro."""
+    tables = []
+    try:
+        for arquivo, table, esquema, date_cols, renomear in BI_FONTES:
+            _fill_shadow(table, _read_bi_source(arquivo, esquema, date_cols, renomear))
+            tables.append(table)
+        _swap_shadows(tables)
+    except Exception:
+        with engine.begin() as conn:
+            for t in tables:
+                conn.execute(text(f"DROP TABLE IF EXISTS bi.{t}__novo"))
+        raise
+
+def load_raw_csvs_into_bi(modo: str = "swap"):
+    """
+    modo="swap": carrega tabelas-sombra e troca as quatro de uma vez (leitores
+    continuam vendo a carga anterior até o COMMIT); modo="truncate": legado.
+    """
+    if modo == "truncate":
+        _load_truncate()
+    else:
+        _load_swap()
+
+CALENDARIO_INICIO_PADRAO = date(2018, 1, 1)
+CALENDARIO_HORIZONTE_DIAS = 365
+
+# feriados nacionais fixos (mês, dia); 20/11 é nacional desde 2024 (Lei 14.759/2023)
+FERIADOS_FIXOS = [
+    ((1, 1), "Confraternização Universal"),
+    ((4, 21), "Tiradentes"),
+    ((5, 1), "Dia do Trabalho"),
+    ((9, 7), "Independência do Brasil"),
+    ((10, 12), "Nossa Senhora Aparecida"),
+    ((11, 2), "Finados"),
+    ((11, 15), "Proclamação da República"),
+    ((11, 20), "Dia Nacional de Zumbi e da Consciência Negra"),
+    ((12, 25), "Natal"),
+]
+# móveis, em dias a partir da Páscoa (calendário bancário: Carnaval não é dia útil)
+FERIADOS_MOVEIS = [(-48, "Carnaval"), (-47, "Carnaval"), (-2, "Sexta-feira Santa"),
+                   (60, "Corpus Christi")]
+
+def _pascoa(ano: int) -> date:
+    """Domingo de Páscoa (algoritmo de Meeus/Jones/Butcher)."""
+    a, b, c = ano % 19, ano // 100, ano % 100
+    d, e = b // 4, b % 4
+    g = (8 * b + 13) // 25
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = c // 4, c % 4
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 19 * l) // 433
+    mes = (h + l - 7 * m + 90) // 25
+    return date(ano, mes, (h + l - 7 * m + 33 * mes + 19) % 32)
+
+def feriados_nacionais(ano_ini: int, ano_fim: int) -> dict:
+    """{data: nome} dos feriados nacionais entre ano_ini e ano_fim (inclusive)."""
+    out = {}
+    for ano in range(ano_ini, ano_fim + 1):
+        for (mes, dia), nome in FERIADOS_FIXOS:
+            if (mes, dia) == (11, 20) and ano < 2024:
+                continue
+            out[date(ano, mes, dia)] = nome
+        pascoa = _pascoa(ano)
+        for delta, nome in FERIADOS_MOVEIS:
+            out[pascoa + timedelta(days=delta)] = nome
+    return out
+
+def _faixas_faltantes(inicio: date, fim: date, atual_min, atual_max) -> list:
+    """Intervalos [lo, hi] que faltam para o calendário cobrir [inicio, fim]."""
+    if atual_min is None:
+        return [(inicio, fim)]
+    faixas = []
+    if inicio < atual_min:
+        faixas.append((inicio, atual_min - timedelta(days=1)))
+    if fim > atual_max:
+        faixas.append((atual_max + timedelta(days=1), fim))
+    return faixas
+
+SQL_CALENDARIO = """
     INSERT INTO bi.dim_calendario (dt, ano, mes_num, dia, trimestre, semana_ano, eh_fim_de_semana,
-                                   primeiro_dia_mes, ultimo_dia_mes, ano_mes, mes_abrev)
+                                   primeiro_dia_mes, ultimo_dia_mes, ano_mes, mes_abrev,
+                                   eh_feriado, feriado, eh_dia_util)
     SELECT
       d::date                                           AS dt,
       EXTRACT(YEAR  FROM d)::int                        AS ano,
@@ -141,17 +268,62 @@ def refresh_dim_calendario():
       date_trunc('month', d)::date                      AS primeiro_dia_mes,
       (date_trunc('month', d) + INTERVAL '1 month - 1 day')::date AS ultimo_dia_mes,
       to_char(d, 'YYYY-MM')                             AS ano_mes,
-      to_char(d, 'Mon')                                 AS mes_abrev
-    FROM limites l
-    CROSS JOIN generate_series(l.start_date, l.end_date, INTERVAL '1 day') AS gs(d)
+      to_char(d, 'Mon')                                 AS mes_abrev,
+      f.nome IS NOT NULL                                AS eh_feriado,
+      f.nome                                            AS feriado,
+      (EXTRACT(ISODOW FROM d) NOT IN (6,7) AND f.nome IS NULL) AS eh_dia_util
+    FROM generate_series(CAST(:lo AS date), CAST(:hi AS date), INTERVAL '1 day') AS gs(d)
+    LEFT JOIN unnest(CAST(:fer_dt AS date[]), CAST(:fer_nome AS text[])) AS f(dt, nome)
+      ON f.dt = d::date
     ON CONFLICT (dt) DO NOTHING;
+"""
+
+def refresh_dim_calendario():
+    """
+    Mantém o calendário cobrindo, sem buracos:
+    - do menor entre data_inicio (contratos), data_premio (prêmios), data_ref (resgates)
+    - até hoje + 365 dias
+    Só as faixas que faltam em cada ponta são geradas; dias já existentes não
+    são recalculados. Feriados nacionais e dia útil vêm junto.
     """
     with engine.begin() as conn:
-        conn.execute(text(sql))
-    print("🗓️  bi.dim_calendario atualizado.")
+        inicio, fim = conn.execute(text("""
+            SELECT
+              COALESCE(LEAST(
+                (SELECT MIN(data_inicio) FROM bi.contratos),
+                (SELECT MIN(data_premio) FROM bi.premios),
+                (SELECT MIN(data_ref)    FROM bi.resgates)
+              ), CAST(:padrao AS date)),
+              CURRENT_DATE + :horizonte
+        """), {"padrao": CALENDARIO_INICIO_PADRAO, "horizonte": CALENDARIO_HORIZONTE_DIAS}).one()
+        atual_min, atual_max, n, sem_atributos = conn.execute(text("""
+            SELECT MIN(dt), MAX(dt), COUNT(*), COUNT(*) FILTER (WHERE eh_dia_util IS NULL)
+            FROM bi.dim_calendario
+        """)).one()
 
-def create_analytics_views():
-    ddl = f"""
+        faixas = _faixas_faltantes(inicio, fim, atual_min, atual_max)
+        # buraco no meio (ex.: deleção manual) ou dias gravados antes das
+        # colunas de feriado/dia útil existirem: refaz o intervalo atual
+        buraco = atual_min is not None and n != (atual_max - atual_min).days + 1
+        if sem_atributos:
+            conn.execute(text("DELETE FROM bi.dim_calendario WHERE eh_dia_util IS NULL"))
+        if buraco or sem_atributos:
+            faixas.append((atual_min, atual_max))
+
+        novos = 0
+        for lo, hi in faixas:
+            feriados = feriados_nacionais(lo.year, hi.year)
+            novos += conn.execute(text(SQL_CALENDARIO), {
+                "lo": lo, "hi": hi,
+                "fer_dt": list(feriados), "fer_nome": list(feriados.values()),
+            }).rowcount
+    if novos:
+        print(f"🗓️  bi.dim_calendario atualizado (+{novos} dias).")
+    else:
+        print("🗓️  bi.dim_calendario já completo.")
+
+def _analytics_views_ddl() -> str:
+    return f"""
     CREATE SCHEMA IF NOT EXISTS analytics AUTHORIZATION {PG_USER};
 
     CREATE OR REPLACE VIEW analytics.dim_calendario AS
@@ -160,7 +332,8 @@ def create_analytics_views():
       dt,
       ano, mes_num, dia, trimestre, semana_ano,
       eh_fim_de_semana, primeiro_dia_mes, ultimo_dia_mes,
-      ano_mes, mes_abrev
+      ano_mes, mes_abrev,
+      eh_feriado, feriado, eh_dia_util
     FROM bi.dim_calendario;
 
     CREATE OR REPLACE VIEW analytics.dim_cliente AS
@@ -197,13 +370,20 @@ def create_analytics_views():
     GRANT SELECT ON ALL TABLES IN SCHEMA analytics TO {PG_USER};
     ALTER DEFAULT PRIVILEGES IN SCHEMA analytics GRANT SELECT ON TABLES TO {PG_USER};
     """
+
+def create_analytics_views():
     with engine.begin() as conn:
-        conn.execute(text(ddl))
+        conn.execute(text(_analytics_views_ddl()))
     print("🧭 Views 'analytics.*' criadas/atualizadas.")
 
 def main():
+    parser = argparse.ArgumentParser(description="Carga dos CSVs em bi.* + views analytics.*")
+    parser.add_argument("--modo", choices=["swap", "truncate"], default="swap",
+                        help="swap: tabelas-sombra + troca atômica (padrão); truncate: TRUNCATE + to_sql.")
+    args = parser.parse_args()
+
     create_schema_and_tables()
-    load_raw_csvs_into_bi()
+    load_raw_csvs_into_bi(args.modo)
     refresh_dim_calendario()
     create_analytics_views()
     print("✅ Carga completa! bi.* + analytics.* prontos para o Power BI.")
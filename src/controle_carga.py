@@ -0,0 +1,218 @@
+"""
+Controle da carga incremental e retomável em analytics.
+
+- Marcas d'água (analytics.etl_watermark): SHA-256, tamanho e maiores id/data
+  de cada arquivo bruto carregado. `plan_source` compara o arquivo com a
+  marca e decide se ele é pulado, lido a partir do byte já carregado (append
+  puro) ou relido inteiro; `save_watermark` grava o plano ao fim da carga.
+- Checkpoints (analytics.etl_checkpoint): blocos já confirmados de uma carga
+  retomável, gravados na mesma transação dos seus dados, para que uma nova
+  execução pule o que já entrou.
+"""
+from __future__ import annotations
+import hashlib
+from pathlib import Path
+from typing import Optional
+import pandas as pd
+from sqlalchemy import text
+
+from utils_db import log
+
+
+# ----------------------------- WATERMARKS ----------------------------- #
+HASH_BLOCK = 1 << 20
+
+
+WATERMARK_DDL = """
+    CREATE TABLE IF NOT EXISTS analytics.etl_watermark (
+      fonte          TEXT PRIMARY KEY,
+      sha256         TEXT NOT NULL,
+      tamanho        BIGINT NOT NULL,
+      max_id         BIGINT,
+      max_data       DATE,
+      atualizado_em  TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+"""
+
+
+def _fingerprint(path: Path, prefix_len: int = 0) -> tuple[str, int, Optional[str]]:
+    """
+    SHA-256 e tamanho do arquivo numa única leitura; se prefix_len > 0 devolve
+    também o hash dos primeiros prefix_len bytes (para detectar append puro).
+    """
+    h = hashlib.sha256()
+    size = 0
+    prefix = None
+    with path.open("rb") as f:
+        while True:
+            want = HASH_BLOCK
+            if 0 < prefix_len and size < prefix_len:
+                want = min(HASH_BLOCK, prefix_len - size)
+            block = f.read(want)
+            if not block:
+                break
+            h.update(block)
+            size += len(block)
+            if size == prefix_len:
+                prefix = h.hexdigest()
+    return h.hexdigest(), size, prefix
+
+
+def _ends_line_at(path: Path, offset: int) -> bool:
+    with path.open("rb") as f:
+        f.seek(offset - 1)
+        return f.read(1) == b"\n"
+
+
+def load_watermarks(con) -> dict[str, dict]:
+    """Todas as marcas d'água, por fonte (para planejar fora da conexão)."""
+    rows = con.execute(text("""
+        SELECT fonte, sha256, tamanho, max_id, max_data FROM analytics.etl_watermark
+    """)).mappings()
+    return {r["fonte"]: dict(r) for r in rows}
+
+
+def plan_source(con, raw: Path, arquivo: str, incremental: bool,
+                marcas: Optional[dict] = None) -> Optional[dict]:
+    """
+    Decide o que ler de `arquivo` (relativo a `raw`) comparando com analytics.etl_watermark.
+    - None: arquivo inalterado (modo incremental) — nada a fazer.
+    - dict com offset (bytes já carregados, se o arquivo só cresceu). Um
+      arquivo alterado é relido inteiro: o row_hash decide o que é gravado
+      (linhas antigas alteradas também precisam entrar).
+    O dict acumula max_id/max_data e é gravado por save_watermark.
+    Com `marcas` (load_watermarks) não consulta o banco.
+    """
+    path = raw / arquivo
+    if not path.exists():
+        raise FileNotFoundError(f"Arquivo não encontrado: {path}")
+    wm = None
+    if incremental and marcas is not None:
+        wm = marcas.get(arquivo)
+    elif incremental:
+        wm = con.execute(text("""
+            SELECT sha256, tamanho, max_id, max_data
+            FROM analytics.etl_watermark WHERE fonte = :f
+        """), {"f": arquivo}).mappings().first()
+
+    sha, size, prefix = _fingerprint(path, wm["tamanho"] if wm else 0)
+    plan = {"fonte": arquivo, "sha256": sha, "tamanho": size,
+            "offset": 0, "max_id": None, "max_data": None}
+    if wm is None:
+        return plan
+
+    if sha == wm["sha256"] and size == wm["tamanho"]:
+        log(f"   · {arquivo}: inalterado desde a última carga. Pulando.")
+        return None
+
+    plan.update(max_id=wm["max_id"], max_data=wm["max_data"])
+    # append num .gz não dá para retomar por offset: relê o arquivo inteiro
+    if prefix == wm["sha256"] and not arquivo.endswith(".gz") and _ends_line_at(path, wm["tamanho"]):
+        plan["offset"] = wm["tamanho"]
+        log(f"   · {arquivo}: {size - wm['tamanho']} bytes novos (append).")
+    else:
+        log(f"   · {arquivo}: alterado; relendo (só linhas com row_hash diferente são gravadas).")
+    return plan
+
+
+def apply_watermark(df: pd.DataFrame, plan: dict, date_cols) -> pd.DataFrame:
+    """Atualiza max_id/max_data do plano com as linhas lidas."""
+    if df.empty:
+        return df
+    if "id" in df.columns:
+        max_id = pd.to_numeric(df["id"], errors="coerce").max()
+        if pd.notna(max_id):
+            plan["max_id"] = int(max(max_id, plan["max_id"] or max_id))
+    for col in date_cols:
+        if col in df.columns:
+            max_data = pd.to_datetime(df[col], errors="coerce").max()
+            if pd.notna(max_data):
+                max_data = max_data.date()
+                plan["max_data"] = max(max_data, plan["max_data"] or max_data)
+    return df
+
+
+def save_watermark(con, plan: dict) -> None:
+    con.execute(text("""
+        INSERT INTO analytics.etl_watermark (fonte, sha256, tamanho, max_id, max_data, atualizado_em)
+        VALUES (:fonte, :sha256, :tamanho, :max_id, :max_data, now())
+        ON CONFLICT (fonte) DO UPDATE SET
+          sha256 = EXCLUDED.sha256,
+          tamanho = EXCLUDED.tamanho,
+          max_id = EXCLUDED.max_id,
+          max_data = EXCLUDED.max_data,
+          atualizado_em = EXCLUDED.atualizado_em
+    """), {k: plan[k] for k in ("fonte", "sha256", "tamanho", "max_id", "max_data")})
+
+
+# ----------------------------- CHECKPOINTS ----------------------------- #
+# Carga retomável: cada bloco confirmado fica registrado aqui, na mesma
+# transação dos seus dados. O bloco é identificado pelo arquivo (e seu hash),
+# pelo byte em que a leitura começou (offset do append) e pelo intervalo de
+# linhas; bloco_sha256 confere que o conteúdo tratado é o mesmo.
+CHECKPOINT_DDL = """
+    CREATE TABLE IF NOT EXISTS analytics.etl_checkpoint (
+      fonte             TEXT NOT NULL,
+      arquivo_sha256    TEXT NOT NULL,
+      byte_inicio       BIGINT NOT NULL,
+      linha_inicio      BIGINT NOT NULL,
+      linha_fim         BIGINT NOT NULL,
+      bloco_sha256      TEXT NOT NULL,
+      linhas            BIGINT NOT NULL,
+      inseridas         BIGINT NOT NULL,
+      confirmado_em     TIMESTAMPTZ NOT NULL DEFAULT now(),
+      PRIMARY KEY (fonte, arquivo_sha256, byte_inicio, linha_inicio)
+    );
+"""
+
+
+def frame_sha256(df: pd.DataFrame) -> str:
+    """Hash do conteúdo do bloco (vetorizado, independe do índice)."""
+    h = hashlib.sha256(",".join(map(str, df.columns)).encode())
+    h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def committed_blocks(con, plans: list[dict]) -> dict[tuple, tuple[int, str]]:
+    """{(fonte, byte_inicio, linha_inicio): (linha_fim, bloco_sha256)} já confirmados dos arquivos."""
+    if not plans:
+        return {}
+    rows = con.execute(text("""
+        SELECT fonte, arquivo_sha256, byte_inicio, linha_inicio, linha_fim, bloco_sha256
+        FROM analytics.etl_checkpoint
+        WHERE fonte = ANY(:fontes)
+    """), {"fontes": [p["fonte"] for p in plans]}).mappings()
+    sha = {p["fonte"]: p["sha256"] for p in plans}
+    return {(r["fonte"], r["byte_inicio"], r["linha_inicio"]): (r["linha_fim"], r["bloco_sha256"])
+            for r in rows if sha[r["fonte"]] == r["arquivo_sha256"]}
+
+
+def record_checkpoint(con, plan: dict, inicio: int, fim: int, bloco_sha: str,
+                      linhas: int, inseridas: int) -> None:
+    con.execute(text("""
+        INSERT INTO analytics.etl_checkpoint
+          (fonte, arquivo_sha256, byte_inicio, linha_inicio, linha_fim, bloco_sha256, linhas, inseridas)
+        VALUES (:fonte, :sha, :byte, :inicio, :fim, :bloco, :linhas, :inseridas)
+        ON CONFLICT (fonte, arquivo_sha256, byte_inicio, linha_inicio) DO UPDATE SET
+          linha_fim = EXCLUDED.linha_fim,
+          bloco_sha256 = EXCLUDED.bloco_sha256,
+          linhas = EXCLUDED.linhas,
+          inseridas = EXCLUDED.inseridas,
+          confirmado_em = now()
+    """), {"fonte": plan["fonte"], "sha": plan["sha256"], "byte": plan["offset"],
+           "inicio": inicio, "fim": fim, "bloco": bloco_sha, "linhas": linhas, "inseridas": inseridas})
+
+
+def pending_checkpoints(con) -> bool:
+    """True se há blocos confirmados de uma carga retomável que não terminou."""
+    return bool(con.execute(text("SELECT EXISTS (SELECT 1 FROM analytics.etl_checkpoint)")).scalar())
+
+
+def ensure_control_tables(con) -> None:
+    con.execute(text(WATERMARK_DDL))
+    con.execute(text(CHECKPOINT_DDL))
+
+
+def clear_checkpoints(con, fontes) -> None:
+    con.execute(text("DELETE FROM analytics.etl_checkpoint WHERE fonte = ANY(:fontes)"),
+                {"fontes": list(fontes)})
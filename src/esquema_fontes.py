@@ -0,0 +1,280 @@
+"""
+Esquema declarado de cada CSV bruto e parser vetorizado guiado por ele.
+
+Cada coluna tem um tipo (int, texto, categoria, data, dinheiro) e regras
+(obrigatória, domínio, faixa). `parse` recebe o CSV lido como texto e
+devolve as linhas válidas já em tipos compactos:
+
+- categoria -> pandas Categorical com as categorias do domínio;
+- int       -> largura declarada (int32/int64; Int* anulável se opcional);
+- dinheiro  -> ponto fixo decimal(12,2) (pyarrow) ou float64 arredondado,
+               como o NUMERIC(12,2) das tabelas (até 10 dígitos inteiros);
+- data      -> datetime64 normalizado;
+- texto     -> strings sem espaços nas pontas, nulos continuam nulos.
+
+As linhas reprovadas não seguem para o banco: vão para
+data/quarantine/<fonte>/<shard>.<sha>.csv com o arquivo/shard de origem e o
+código do motivo (ex.: "data_invalida:data_premio;fora_do_dominio:status").
+Um CSV por versão (SHA-256) de cada arquivo lido: reler o mesmo arquivo
+(--no-cache, retomada, arquivo alterado relido inteiro) regrava o mesmo CSV
+em vez de acrescentar as mesmas linhas de novo.
+"""
+from __future__ import annotations
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # pyarrow é opcional: dinheiro cai para float64
+    pa = pc = None
+
+ROOT = Path(__file__).resolve().parents[1]
+QUARANTINE_DIR = ROOT / "data" / "quarantine"
+
+# entra na chave do cache colunar: mudou o esquema, o Parquet antigo é ignorado
+VERSAO = 2
+
+UFS = ("AC", "AL", "AM", "AP", "BA", "CE", "DF", "ES", "GO", "MA", "MG", "MS", "MT", "PA",
+       "PB", "PE", "PI", "PR", "RJ", "RN", "RO", "RR", "RS", "SC", "SE", "SP", "TO")
+FAIXAS_ETARIAS = ("18–25", "26–35", "36–45", "46–60", "60+")
+STATUS_CONTRATO = ("ATIVO", "RESGATADO", "CANCELADO")
+TIPOS_TITULO = ("Mensal", "Trimestral", "Anual")
+
+# NUMERIC(12,2) no banco: valor maior estouraria no COPY e derrubaria a carga
+DINHEIRO_PRECISAO, DINHEIRO_ESCALA = 12, 2
+DINHEIRO_RE = rf"-?\d{{1,{DINHEIRO_PRECISAO - DINHEIRO_ESCALA}}}(?:\.\d{{1,{DINHEIRO_ESCALA}}})?"
+
+
+@dataclass(frozen=True)
+class Coluna:
+    nome: str
+    tipo: str                       # int | texto | categoria | data | dinheiro
+    obrigatoria: bool = False
+    bits: int = 64                  # largura dos inteiros
+    dominio: tuple = ()             # valores aceitos (categoria)
+    minimo: Optional[float] = None
+    maximo: Optional[float] = None
+
+
+# tabela destino -> colunas do CSV bruto
+ESQUEMAS: dict[str, tuple[Coluna, ...]] = {
+    "dim_cliente": (
+        Coluna("id", "int", obrigatoria=True, minimo=1),
+        Coluna("nome", "texto"),
+        Coluna("estado", "categoria", dominio=UFS),
+        Coluna("idade", "int", bits=16, minimo=0, maximo=130),
+        Coluna("faixa_etaria", "categoria", dominio=FAIXAS_ETARIAS),
+        Coluna("renda_mensal", "dinheiro", minimo=0),
+        Coluna("data_inicio", "data"),
+    ),
+    "fact_contrato": (
+        Coluna("id", "int", obrigatoria=True, minimo=1),
+        Coluna("cliente_id", "int", obrigatoria=True, minimo=1),
+        Coluna("valor_mensal", "dinheiro", minimo=0),
+        Coluna("data_inicio", "data"),
+        Coluna("status", "categoria", dominio=STATUS_CONTRATO),
+        Coluna("tipo_titulo", "categoria", dominio=TIPOS_TITULO),
+    ),
+    "fact_premio": (
+        Coluna("id", "int", obrigatoria=True, minimo=1),
+        Coluna("contrato_id", "int", obrigatoria=True, minimo=1),
+        Coluna("data_premio", "data", obrigatoria=True),
+        Coluna("valor", "dinheiro", minimo=0),
+    ),
+    "fact_resgate": (
+        Coluna("id", "int", obrigatoria=True, minimo=1),
+        Coluna("contrato_id", "int", obrigatoria=True, minimo=1),
+        Coluna("data_resgate", "data", obrigatoria=True),
+        Coluna("valor", "dinheiro", minimo=0),
+    ),
+}
+
+# leitura do CSV para o parser: tudo como texto, "" vira nulo
+READ_KWARGS = {"dtype": str}
+
+
+def _dinheiro_dtype():
+    return pd.ArrowDtype(pa.decimal128(DINHEIRO_PRECISAO, DINHEIRO_ESCALA)) if pa is not None else "float64"
+
+
+def _dtype(col: Coluna):
+    if col.tipo == "int":
+        return f"int{col.bits}" if col.obrigatoria else f"Int{col.bits}"
+    if col.tipo == "categoria":
+        return pd.CategoricalDtype(list(col.dominio))
+    if col.tipo == "dinheiro":
+        return _dinheiro_dtype()
+    if col.tipo == "data":
+        return "datetime64[ns]"
+    return object
+
+
+def _to_dinheiro(txt: pd.Series, ok: pd.Series) -> pd.Series:
+    """Texto já validado -> ponto fixo sem passar por float (quando há pyarrow)."""
+    if pa is None:
+        return pd.to_numeric(txt.where(ok), errors="coerce").round(2)
+    arr = pc.cast(pa.array(txt.where(ok), type=pa.string(), from_pandas=True),
+                  pa.decimal128(DINHEIRO_PRECISAO, DINHEIRO_ESCALA))
+    return pd.Series(pd.arrays.ArrowExtensionArray(arr), index=txt.index)
+
+
+def parse(table: str, raw: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    (válidas tipadas, reprovadas) do bloco `raw` lido como texto. As
+    reprovadas mantêm os valores originais e ganham a coluna `motivo`.
+    Colunas fora do esquema seguem como texto.
+    """
+    esquema = ESQUEMAS[table]
+    faltando = [c.nome for c in esquema if c.obrigatoria and c.nome not in raw.columns]
+    if faltando:
+        raise ValueError(f"{table}: coluna(s) obrigatória(s) ausente(s) no CSV: {faltando}")
+
+    n = len(raw)
+    motivo = np.full(n, "", dtype=object)
+
+    def reprova(mask, codigo: str) -> None:
+        mask = np.asarray(mask, dtype=bool)
+        if mask.any():
+            motivo[mask] = motivo[mask] + f"{codigo};"
+
+    out = {}
+    for nome in raw.columns:
+        s = raw[nome]
+        if s.dtype == object:
+            s = s.str.strip()
+            s = s.mask(s == "")
+        out[nome] = s
+
+    for col in esquema:
+        if col.nome not in out:
+            continue
+        txt, presente = out[col.nome], out[col.nome].notna()
+        if col.obrigatoria:
+            reprova(~presente, f"obrigatorio_ausente:{col.nome}")
+
+        valor = txt
+        num = None
+        if col.tipo == "int":
+            num = pd.to_numeric(txt, errors="coerce")
+            ruim = presente & (num.isna() | (num % 1 != 0))
+            reprova(ruim, f"int_invalido:{col.nome}")
+            info = np.iinfo(f"int{col.bits}")
+            num = num.where(~ruim)
+            reprova((num < info.min) | (num > info.max), f"fora_da_faixa:{col.nome}")
+            valor = num
+        elif col.tipo == "dinheiro":
+            ok = txt.str.fullmatch(DINHEIRO_RE, na=False)
+            reprova(presente & ~ok, f"valor_invalido:{col.nome}")
+            num = pd.to_numeric(txt.where(ok), errors="coerce")
+            valor = _to_dinheiro(txt, ok)
+        elif col.tipo == "data":
+            valor = pd.to_datetime(txt, format="ISO8601", errors="coerce").dt.normalize()
+            reprova(presente & valor.isna(), f"data_invalida:{col.nome}")
+        elif col.tipo == "categoria":
+            reprova(presente & ~txt.isin(col.dominio), f"fora_do_dominio:{col.nome}")
+
+        if num is not None:
+            if col.minimo is not None:
+                reprova(num < col.minimo, f"fora_da_faixa:{col.nome}")
+            if col.maximo is not None:
+                reprova(num > col.maximo, f"fora_da_faixa:{col.nome}")
+        out[col.nome] = valor
+
+    ruins = motivo != ""
+    boas = ~ruins
+    df = pd.DataFrame(out, index=raw.index).loc[boas]
+    for col in esquema:
+        if col.nome in df.columns:
+            df[col.nome] = df[col.nome].astype(_dtype(col))
+
+    rejeitadas = raw.loc[ruins].copy()
+    rejeitadas.insert(0, "motivo", pd.Series(motivo[ruins], index=rejeitadas.index).str.rstrip(";"))
+    return df, rejeitadas
+
+
+def restore(table: str, df: pd.DataFrame) -> pd.DataFrame:
+    """Reaplica os dtypes do esquema (ex.: decimal que volta do Parquet como objeto)."""
+    for col in ESQUEMAS[table]:
+        if col.nome in df.columns:
+            dtype = _dtype(col)
+            if df[col.nome].dtype != dtype:
+                df[col.nome] = df[col.nome].astype(dtype)
+    return df
+
+
+class Quarentena:
+    """
+    Linhas reprovadas de uma fonte, em `path` (um diretório por fonte), num
+    CSV por arquivo/shard e SHA-256 do arquivo. A 1ª gravação de cada CSV
+    nesta instância o sobrescreve (é o mesmo conteúdo relido); as seguintes,
+    dos blocos seguintes do mesmo parse, acrescentam. Sem sha o CSV fica só
+    com a leitura mais recente.
+    """
+
+    def __init__(self, arquivo: str):
+        self.path = QUARANTINE_DIR / Path(arquivo).name.split(".")[0]
+        self.linhas = 0
+        self.motivos: dict[str, int] = {}
+        self._gravados: set[Path] = set()
+
+    def destino(self, origem: str, sha: Optional[str] = None) -> Path:
+        nome = re.sub(r"[^0-9A-Za-z_-]", "_", origem.removesuffix(".gz").removesuffix(".csv"))
+        return self.path / f"{nome}{'.' + sha[:16] if sha else ''}.csv"
+
+    def write(self, rejeitadas: pd.DataFrame, origem: str, sha: Optional[str] = None) -> None:
+        if rejeitadas.empty:
+            return
+        dest = self.destino(origem, sha)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        rejeitadas = rejeitadas.copy()
+        rejeitadas.insert(0, "arquivo", origem)
+        rejeitadas.insert(0, "quarentena_em", datetime.now().isoformat(timespec="seconds"))
+        novo = dest not in self._gravados
+        rejeitadas.to_csv(dest, mode="w" if novo else "a", header=novo, index=False)
+        self._gravados.add(dest)
+        self.linhas += len(rejeitadas)
+        for m in rejeitadas["motivo"].str.split(";").explode():
+            self.motivos[m] = self.motivos.get(m, 0) + 1
+
+
+class ParserFonte:
+    """
+    parse + quarentena de uma fonte; é o `parser` aceito pelo staging_cache.
+    `origem` é o arquivo/shard sendo lido agora (padrão: o próprio `arquivo`)
+    e `sha` o SHA-256 dele, que nomeia o CSV da quarentena.
+    Com coletar=True (parse num processo do pool) as reprovadas ficam em
+    memória, em `coletadas()`, e quem grava a quarentena é o processo pai.
+    """
+
+    read_kwargs = READ_KWARGS
+
+    def __init__(self, table: str, arquivo: str, origem: Optional[str] = None,
+                 coletar: bool = False, sha: Optional[str] = None):
+        self.table = table
+        self.tag = f"e{VERSAO}"
+        self.origem = origem or arquivo
+        self.sha = sha
+        self.quarentena = None if coletar else Quarentena(arquivo)
+        self._coletadas: list[pd.DataFrame] = []
+
+    def parse(self, raw: pd.DataFrame) -> pd.DataFrame:
+        df, rejeitadas = parse(self.table, raw)
+        if self.quarentena is not None:
+            self.quarentena.write(rejeitadas, self.origem, self.sha)
+        elif not rejeitadas.empty:
+            self._coletadas.append(rejeitadas)
+        return df
+
+    def coletadas(self) -> pd.DataFrame:
+        if not self._coletadas:
+            return pd.DataFrame(columns=["motivo"])
+        return pd.concat(self._coletadas)
+
+    def restore(self, df: pd.DataFrame) -> pd.DataFrame:
+        return restore(self.table, df)
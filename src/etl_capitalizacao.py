@@ -1,11 +1,36 @@
 import argparse
+import csv
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Optional
+import numpy as np
 import pandas as pd
 from dotenv import load_dotenv
-from sqlalchemy import text, Table, MetaData
+from sqlalchemy import text, literal_column, func, Table, MetaData
 from sqlalchemy.dialects.postgresql import insert as pg_insert
 
-from utils_db import get_engine
+import metricas
+import pipeline
+from pipeline import Etapa
+from utils_db import copy_frame, get_engine, log
+from particoes import (PARTITIONED, FACT_INDEXES, conflict_key, delete_moved, drop_partitions_before,
+                       ensure_fact_indexes, ensure_partitioned, forget_partitions, partition_ready,
+                       prepare_staged_partitions, touched_months)
+from controle_carga import (WATERMARK_DDL, CHECKPOINT_DDL, apply_watermark, clear_checkpoints,
+                            committed_blocks, ensure_control_tables, frame_sha256, load_watermarks,
+                            pending_checkpoints, plan_source, record_checkpoint, save_watermark)
+from agregados import create_kpi_table, refresh_bi_aggregates
+from indice_cdi import CdiIndex, build_cdi_index, save_cdi_index
+from esquema_fontes import ESQUEMAS, ParserFonte
+from staging_cache import read_staged, iter_staged
 
 ROOT = Path(__file__).resolve().parents[1]
 load_dotenv(ROOT / ".env")
@@ -17,27 +42,210 @@ STAGING = ROOT / "data" / "staging"
 STAGING.mkdir(parents=True, exist_ok=True)
 
 
-def log(msg: str) -> None:
-    print(msg, flush=True)
+# arquivo bruto -> (tabela destino em analytics, colunas de data), em ordem de FK
+FONTES = [
+    ("clientes.csv",  "dim_cliente",   ["data_inicio"]),
+    ("contratos.csv", "fact_contrato", ["data_inicio"]),
+    ("premios.csv",   "fact_premio",   ["data_premio"]),
+    ("resgates.csv",  "fact_resgate",  ["data_resgate"]),
+]
 
 
-def read_csv_or_fail(filename: str) -> pd.DataFrame:
-    path = RAW / filename
-    if not path.exists():
-        raise FileNotFoundError(f"Arquivo não encontrado: {path}")
-    df = pd.read_csv(path)
-    for c in df.columns:
-        if df[c].dtype == "object":
-            df[c] = df[c].astype(str).str.strip()
-    return df
+# fonte entregue em shards: "contratos.csv" ausente -> contratos_*.csv,
+# contratos/*.csv (e as versões .gz), nesta ordem de busca
+GLOB_CHARS = frozenset("*?[")
+SHARD_PATTERNS = ("{stem}_*.csv", "{stem}_*.csv.gz", "{stem}/*.csv", "{stem}/*.csv.gz")
+
+
+def resolve_source(filename: str) -> list[str]:
+    """
+    Arquivos de uma fonte, relativos a RAW e em ordem. `filename` pode ser o
+    nome exato, um glob ("contratos_*.csv", "contratos/*.csv.gz") ou o nome
+    de uma fonte que só existe em shards (ver SHARD_PATTERNS).
+    """
+    if GLOB_CHARS & set(filename):
+        patterns = [filename]
+    elif (RAW / filename).exists():
+        return [filename]
+    else:
+        stem = filename.split(".")[0]
+        patterns = [p.format(stem=stem) for p in SHARD_PATTERNS]
+    for pat in patterns:
+        found = sorted(p for p in RAW.glob(pat) if p.is_file())
+        if found:
+            break
+    else:
+        raise FileNotFoundError(f"Arquivo não encontrado: {RAW / filename}")
+    return [p.relative_to(RAW).as_posix() for p in found]
+
+
+def _source_of(filename: str) -> tuple[str, str]:
+    """(fonte em FONTES, tabela) a que pertence um arquivo, shard ou glob."""
+    for arquivo, table, _ in FONTES:
+        stem = arquivo.split(".")[0]
+        if filename == stem or filename.startswith((stem + ".", stem + "_", stem + "/")):
+            return arquivo, table
+    raise ValueError(f"{filename}: não corresponde a nenhuma fonte de FONTES.")
+
+
+def _report_quarantine(filename: str, parser: ParserFonte) -> None:
+    q = parser.quarentena
+    if q.linhas:
+        motivos = ", ".join(f"{m}={n}" for m, n in sorted(q.motivos.items(), key=lambda kv: -kv[1]))
+        log(f" ! {filename}: {q.linhas} linha(s) em quarentena ({motivos}) -> {q.path}")
+
+
+@contextmanager
+def _open_csv(path: Path, offset: int = 0, **kwargs):
+    """
+    Abre o CSV com pandas (.gz descomprimido pelo próprio pandas). offset > 0
+    pula os bytes já carregados (arquivo só cresceu), mantendo os nomes de
+    colunas do cabeçalho original.
+    """
+    if not offset:
+        yield pd.read_csv(path, **kwargs)
+        return
+    with path.open("rb") as f:
+        names = next(csv.reader([f.readline().decode("utf-8-sig")]))
+        f.seek(offset)
+        kwargs.update(header=None, names=names)
+        yield pd.read_csv(f, **kwargs)
+
+
+def _parse_file(path: Path, parser: ParserFonte, offset: int = 0, date_cols=(),
+                sha: Optional[str] = None) -> pd.DataFrame:
+    if sha and not offset:
+        return read_staged(path, date_cols, sha=sha, parser=parser)
+    with _open_csv(path, offset, **parser.read_kwargs) as raw:
+        return parser.parse(raw)
+
+
+def _parse_shard(path: Path, table: str, arquivo: str, origem: str, offset: int,
+                 date_cols, sha: Optional[str]) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Roda num processo do pool: (válidas, reprovadas) de um shard."""
+    parser = ParserFonte(table, arquivo, origem=origem, coletar=True)
+    return _parse_file(path, parser, offset, date_cols, sha), parser.coletadas()
+
+
+def _shard_plans(filename: str, offset: int = 0, sha: Optional[str] = None) -> list[dict]:
+    """Planos mínimos (sem marca d'água); offset/sha só valem para arquivo único."""
+    shards = resolve_source(filename)
+    if len(shards) == 1:
+        return [{"fonte": shards[0], "offset": offset, "sha256": sha}]
+    return [{"fonte": s, "offset": 0, "sha256": None} for s in shards]
+
+
+def iter_parsed_shards(arquivo: str, table: str, plans: list[dict], date_cols=(),
+                       cache: bool = True, workers: int = 1):
+    """
+    (plano, DataFrame tipado) de cada shard de uma fonte, na ordem de `plans`.
+    Com workers > 1 e mais de um shard o parse roda num pool de processos,
+    com no máximo `workers` shards em voo (o pico de memória fica em
+    ~workers shards); a quarentena é gravada aqui, no processo pai.
+    """
+    parser = ParserFonte(table, arquivo)
+
+    def sha(plan):
+        return plan["sha256"] if cache else None
+
+    if workers <= 1 or len(plans) <= 1:
+        for plan in plans:
+            parser.origem, parser.sha = plan["fonte"], plan["sha256"]
+            yield plan, _parse_file(RAW / plan["fonte"], parser, plan["offset"], date_cols, sha(plan))
+    else:
+        # spawn: o pool pode nascer com outras etapas do pipeline rodando em
+        # threads, e fork de processo com threads pode herdar locks presos
+        with ProcessPoolExecutor(max_workers=min(workers, len(plans)),
+                                 mp_context=multiprocessing.get_context("spawn")) as ex:
+            pendentes, fila = iter(plans), deque()
+
+            def submit():
+                plan = next(pendentes, None)
+                if plan is not None:
+                    fila.append((plan, ex.submit(_parse_shard, RAW / plan["fonte"], table, arquivo,
+                                                 plan["fonte"], plan["offset"], date_cols, sha(plan))))
+
+            for _ in range(workers):
+                submit()
+            while fila:
+                plan, fut = fila.popleft()
+                df, rejeitadas = fut.result()
+                submit()
+                parser.quarentena.write(rejeitadas, plan["fonte"], plan["sha256"])
+                yield plan, df
+    _report_quarantine(arquivo, parser)
+
+
+def read_csv_or_fail(filename: str, offset: int = 0, date_cols=(),
+                     sha: Optional[str] = None, workers: int = 1) -> pd.DataFrame:
+    """
+    Lê o CSV bruto e o tipa/valida pelo esquema declarado (esquema_fontes);
+    linhas reprovadas vão para a quarentena. Com `sha` (hash do arquivo) e
+    leitura completa, passa pelo cache colunar em data/staging: se o arquivo
+    não mudou, não há parse de CSV.
+    `filename` também aceita glob ou fonte em shards (ver resolve_source):
+    os shards são lidos em até `workers` processos e concatenados.
+    """
+    arquivo, table = _source_of(filename)
+    partes = [df for _, df in iter_parsed_shards(arquivo, table, _shard_plans(filename, offset, sha),
+                                                 date_cols, cache=sha is not None, workers=workers)]
+    return partes[0] if len(partes) == 1 else pd.concat(partes, ignore_index=True)
+
+
+def iter_shard_chunks(arquivo: str, table: str, plans: list[dict], chunk_rows: int,
+                      date_cols=(), cache: bool = True, workers: int = 1):
+    """
+    (plano, bloco de até `chunk_rows` linhas) de cada shard. Em série cada
+    shard é lido em blocos; com o pool (workers > 1) cada shard chega
+    inteiro e é fatiado aqui antes de seguir para a carga.
+    """
+    if workers > 1 and len(plans) > 1:
+        for plan, df in iter_parsed_shards(arquivo, table, plans, date_cols, cache, workers):
+            for start in range(0, len(df), chunk_rows):
+                yield plan, df.iloc[start:start + chunk_rows].copy()
+        return
+
+    parser = ParserFonte(table, arquivo)
+    for plan in plans:
+        path, parser.origem, parser.sha = RAW / plan["fonte"], plan["fonte"], plan["sha256"]
+        if cache and plan["sha256"] and not plan["offset"]:
+            for chunk in iter_staged(path, chunk_rows, date_cols, sha=plan["sha256"], parser=parser):
+                yield plan, chunk
+        else:
+            with _open_csv(path, plan["offset"], chunksize=chunk_rows, **parser.read_kwargs) as reader, reader:
+                for chunk in reader:
+                    yield plan, parser.parse(chunk)
+    _report_quarantine(arquivo, parser)
+
 
+def iter_csv_chunks(filename: str, chunk_rows: int, offset: int = 0, date_cols=(),
+                    sha: Optional[str] = None, workers: int = 1):
+    """Lê o CSV em blocos de `chunk_rows` linhas (memória independe do tamanho do arquivo)."""
+    arquivo, table = _source_of(filename)
+    for _, chunk in iter_shard_chunks(arquivo, table, _shard_plans(filename, offset, sha), chunk_rows,
+                                      date_cols, cache=sha is not None, workers=workers):
+        yield chunk
 
-def coerce_dates(df: pd.DataFrame, cols) -> pd.DataFrame:
+
+def coerce_dates(df: pd.DataFrame, cols, as_date: bool = True) -> pd.DataFrame:
+    """
+    Converte as colunas para data. as_date=False mantém datetime64 (vetorizado,
+    sem objetos `date` por linha) — suficiente para a carga via COPY.
+    """
     for col in cols:
         if col in df.columns:
-            df[col] = pd.to_datetime(df[col], errors="coerce").dt.date
+            parsed = pd.to_datetime(df[col], errors="coerce")
+            df[col] = parsed.dt.date if as_date else parsed.dt.normalize()
     return df
 
+
+def _dates_for_load(df: pd.DataFrame, cols, bulk: bool) -> pd.DataFrame:
+    """
+    coerce_dates no formato de cada carga: o INSERT em lotes precisa de
+    objetos date; o COPY aceita datetime64.
+    """
+    return coerce_dates(df, cols, as_date=not bulk)
+
 def _create_min_schema(con) -> None:
     con.execute(text("""
         CREATE SCHEMA IF NOT EXISTS analytics;
@@ -74,8 +282,115 @@ def _create_min_schema(con) -> None:
     log(" - Schema mínimo criado (fallback).")
 
 
-def apply_schema(con) -> None:
-    """Aplica schema SQL do arquivo (se existir) e garante colunas opcionais."""
+# colunas opcionais (versões anteriores do schema não tinham)
+OPTIONAL_COLUMNS_DDL = [
+    """
+        ALTER TABLE analytics.dim_cliente
+        ADD COLUMN IF NOT EXISTS idade INT,
+        ADD COLUMN IF NOT EXISTS faixa_etaria TEXT,
+        ADD COLUMN IF NOT EXISTS renda_mensal NUMERIC(12,2);
+    """,
+    """
+        ALTER TABLE analytics.fact_contrato
+        ADD COLUMN IF NOT EXISTS tipo_titulo TEXT,
+        ADD COLUMN IF NOT EXISTS rentabilidade_estim NUMERIC(10,6);
+    """,
+    # hash do conteúdo da linha (with_row_hash): o UPSERT só reescreve o que mudou
+    *[f"ALTER TABLE analytics.{t} ADD COLUMN IF NOT EXISTS row_hash BIGINT;"
+      for t in ("dim_cliente", "fact_contrato", "fact_premio", "fact_resgate")],
+]
+
+# Versão do DDL aplicado pelo ETL: incremente ao mudar database_schema.sql,
+# _create_min_schema ou os DDLs deste módulo (o hash pega edições esquecidas).
+SCHEMA_VERSION = 4
+SCHEMA_LOCK_KEY = 7_301_016  # pg_advisory_xact_lock: um ETL aplica DDL por vez
+
+SCHEMA_META_DDL = """
+    CREATE TABLE IF NOT EXISTS analytics.etl_schema (
+      versao       INT NOT NULL,
+      sha256       TEXT NOT NULL,
+      colunas      JSONB NOT NULL,
+      aplicado_em  TIMESTAMPTZ NOT NULL DEFAULT now(),
+      PRIMARY KEY (versao, sha256)
+    );
+"""
+
+# reflexão por execução: {(schema, tabela): {coluna: data_type}} e Table do SQLAlchemy
+_columns_cache: dict[tuple[str, str], dict[str, str]] = {}
+_table_cache: dict[tuple[str, str], Table] = {}
+
+
+def forget_schema_cache() -> None:
+    _columns_cache.clear()
+    _table_cache.clear()
+    forget_partitions()
+
+
+def schema_fingerprint() -> str:
+    """SHA-256 de todo o DDL que apply_schema executa (+ SCHEMA_VERSION)."""
+    ddl = DDL_FILE.read_text(encoding="utf-8").strip() if DDL_FILE.exists() else ""
+    h = hashlib.sha256(f"v{SCHEMA_VERSION}".encode())
+    for part in (ddl, *OPTIONAL_COLUMNS_DDL, WATERMARK_DDL, CHECKPOINT_DDL, ALTERACAO_DDL, SCHEMA_META_DDL,
+                 repr(sorted(PARTITIONED.items())), repr(FACT_INDEXES)):
+        h.update(b"\0" + part.strip().encode("utf-8"))
+    return h.hexdigest()
+
+
+def _applied_schema(con) -> Optional[tuple[int, str, dict]]:
+    """(versao, sha256, colunas) do último DDL aplicado, ou None."""
+    if con.execute(text("SELECT to_regclass('analytics.etl_schema')")).scalar() is None:
+        return None
+    row = con.execute(text("""
+        SELECT versao, sha256, colunas FROM analytics.etl_schema
+        ORDER BY aplicado_em DESC LIMIT 1
+    """)).first()
+    return tuple(row) if row else None
+
+
+def _record_schema(con, sha: str) -> None:
+    """Registra versão/hash aplicados e o mapa de colunas (reflexão entre execuções)."""
+    rows = con.execute(text("""
+        SELECT table_name, column_name, data_type
+        FROM information_schema.columns
+        WHERE table_schema = 'analytics'
+          AND table_name NOT IN (
+            SELECT c.relname FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = 'analytics' AND c.relispartition
+          )
+    """)).fetchall()
+    colunas: dict[str, dict[str, str]] = {}
+    for tabela, coluna, tipo in rows:
+        colunas.setdefault(tabela, {})[coluna] = tipo
+    con.execute(text("""
+        INSERT INTO analytics.etl_schema (versao, sha256, colunas)
+        VALUES (:v, :sha, CAST(:cols AS JSONB))
+        ON CONFLICT (versao, sha256) DO UPDATE
+        SET colunas = EXCLUDED.colunas, aplicado_em = now()
+    """), {"v": SCHEMA_VERSION, "sha": sha, "cols": json.dumps(colunas)})
+    _load_columns(colunas)
+
+
+def _load_columns(colunas: dict) -> None:
+    for tabela, cols in colunas.items():
+        _columns_cache[("analytics", tabela)] = dict(cols)
+
+
+def apply_schema(con, force: bool = False) -> None:
+    """
+    Aplica o DDL (database_schema.sql + colunas opcionais + tabelas de
+    controle) só quando o hash dele mudou desde a última aplicação, evitando
+    os locks de ALTER/CREATE em toda execução. force=True reaplica sempre.
+    """
+    sha = schema_fingerprint()
+    applied = None if force else _applied_schema(con)
+    if applied and applied[:2] == (SCHEMA_VERSION, sha):
+        _load_columns(applied[2])
+        log(f" - Schema inalterado (v{SCHEMA_VERSION}, {sha[:12]}); DDL ignorado.")
+        return
+
+    con.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": SCHEMA_LOCK_KEY})
+    forget_schema_cache()
     if DDL_FILE.exists():
         ddl = DDL_FILE.read_text(encoding="utf-8").strip()
         if ddl:
@@ -88,18 +403,17 @@ def apply_schema(con) -> None:
         log(" ! Aviso: database_schema.sql não encontrado. Criando schema mínimo...")
         _create_min_schema(con)
 
-    con.execute(text("""
-        ALTER TABLE analytics.dim_cliente
-        ADD COLUMN IF NOT EXISTS idade INT,
-        ADD COLUMN IF NOT EXISTS faixa_etaria TEXT,
-        ADD COLUMN IF NOT EXISTS renda_mensal NUMERIC(12,2);
-    """))
+    for ddl in OPTIONAL_COLUMNS_DDL:
+        con.execute(text(ddl))
+    for table, col in PARTITIONED.items():
+        ensure_partitioned(con, table, col)
+    ensure_fact_indexes(con)
 
-    con.execute(text("""
-        ALTER TABLE analytics.fact_contrato
-        ADD COLUMN IF NOT EXISTS tipo_titulo TEXT,
-        ADD COLUMN IF NOT EXISTS rentabilidade_estim NUMERIC(10,6);
-    """))
+    ensure_control_tables(con)
+    con.execute(text(ALTERACAO_DDL))
+    con.execute(text(SCHEMA_META_DDL))
+    _record_schema(con, sha)
+    log(f" - Versão do schema registrada (v{SCHEMA_VERSION}, {sha[:12]}).")
 
 
 def truncate_dev(con) -> None:
@@ -109,158 +423,903 @@ def truncate_dev(con) -> None:
           analytics.fact_premio,
           analytics.fact_resgate,
           analytics.fact_contrato,
-          analytics.dim_cliente
+          analytics.dim_cliente,
+          analytics.etl_watermark,
+          analytics.etl_checkpoint,
+          analytics.etl_alteracao
         RESTART IDENTITY CASCADE;
     """))
     log(" - Tabelas limpas (TRUNCATE + RESTART IDENTITY).")
 
 
-def _columns_in_db(con, schema: str, table: str) -> set[str]:
-    rows = con.execute(text("""
-        SELECT column_name
-        FROM information_schema.columns
-        WHERE table_schema = :sch AND table_name = :tab
-    """), {"sch": schema, "tab": table}).fetchall()
-    return {r[0] for r in rows}
+def _columns_in_db(con, schema: str, table: str) -> dict[str, str]:
+    """Retorna {coluna: data_type} da tabela de destino (cacheado por execução)."""
+    key = (schema, table)
+    if key not in _columns_cache:
+        rows = con.execute(text("""
+            SELECT column_name, data_type
+            FROM information_schema.columns
+            WHERE table_schema = :sch AND table_name = :tab
+        """), {"sch": schema, "tab": table}).fetchall()
+        if not rows:
+            return {}
+        _columns_cache[key] = {r[0]: r[1] for r in rows}
+    return _columns_cache[key]
+
+
+def _reflected_table(con, schema: str, table: str) -> Table:
+    key = (schema, table)
+    if key not in _table_cache:
+        _table_cache[key] = Table(table, MetaData(), schema=schema, autoload_with=con)
+    return _table_cache[key]
+
+
+# ----------------------------- ROW HASH (CDC) ----------------------------- #
+ROW_HASH = "row_hash"
+NUMERIC_TYPES = {"smallint", "integer", "bigint", "numeric", "real", "double precision"}
+DATE_TYPES = {"date", "timestamp without time zone", "timestamp with time zone"}
+
+
+def _canonical(s: pd.Series, tipo: str) -> pd.Series:
+    """Valor normalizado pelo tipo no banco: date/datetime64, Decimal/float, categoria/texto."""
+    if tipo in NUMERIC_TYPES:
+        if isinstance(s.dtype, pd.ArrowDtype) or pd.api.types.is_numeric_dtype(s.dtype):
+            return s.astype("float64")
+        return pd.to_numeric(s, errors="coerce").astype("float64")
+    if tipo in DATE_TYPES:
+        return pd.to_datetime(s, errors="coerce")
+    return s.astype("string")
+
+
+def _source_columns(table: str) -> set[str]:
+    """Colunas que vêm da fonte (ESQUEMAS); as demais do destino são derivadas."""
+    return {c.nome for c in ESQUEMAS.get(table, ())}
 
 
-def _upsert_df(con, df: pd.DataFrame, schema: str, table: str, conflict_cols=("id",)) -> None:
+def with_row_hash(df: pd.DataFrame, table: str, types: dict[str, str]) -> pd.DataFrame:
     """
-    Upsert (INSERT ... ON CONFLICT DO NOTHING) para evitar erro de PK duplicada.
+    Acrescenta row_hash (BIGINT): hash de 64 bits, vetorizado, das colunas de
+    origem (ESQUEMAS) que existem no bloco e no destino. Colunas derivadas
+    (ex.: rentabilidade_estim, que anda com o CDI) ficam de fora: o hash
+    muda só quando a fonte muda, com ou sem --bcb. Sem a coluna no destino,
+    devolve df intacto.
+    """
+    fonte = _source_columns(table)
+    cols = sorted(c for c in df.columns if c in types and c in fonte)
+    if ROW_HASH not in types or not cols:
+        return df
+    canon = pd.DataFrame({c: _canonical(df[c], types[c]) for c in cols}, index=df.index)
+    h = pd.util.hash_pandas_object(canon, index=False).to_numpy().view(np.int64)
+    return df.assign(**{ROW_HASH: h})
+
+
+def _last_per_id(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Uma linha por id, a última na ordem de carga (shards em ordem): o mesmo
+    INSERT ... ON CONFLICT DO UPDATE não pode afetar uma linha duas vezes.
+    Pelo id, não pela chave do ON CONFLICT: nas particionadas (id, data) um
+    id repetido com outra data também é uma versão antiga da mesma linha.
+    """
+    if "id" not in df.columns or not df["id"].duplicated().any():
+        return df
+    return df.drop_duplicates("id", keep="last")
+
+
+def _update_set(table: str, cols: list[str], conflict_cols) -> dict[str, bool]:
+    """
+    {coluna: derivada} do SET do UPSERT. Derivada (fora de ESQUEMAS) usa
+    COALESCE(EXCLUDED.x, x): carga sem o dado (ex.: sem --bcb ou CDI fora do
+    ar) não apaga o valor gravado.
+    """
+    fonte = _source_columns(table) | {ROW_HASH}
+    return {c: c not in fonte for c in cols if c not in conflict_cols}
+
+
+# tabelas cujas linhas alteradas são registradas para a KPI e os agregados
+# (mudar um cliente/contrato muda meses que não foram lidos) -> coluna cujo
+# mês, antes da alteração, vai junto com o id (mes NULL = data nula)
+CHANGE_LOG_TABLES = {"dim_cliente": None, "fact_contrato": "data_inicio"}
+
+ALTERACAO_DDL = """
+    CREATE TABLE IF NOT EXISTS analytics.etl_alteracao (
+      tabela  TEXT NOT NULL,
+      id      BIGINT NOT NULL,
+      mes     DATE
+    );
+"""
+
+
+def _log_changes(con, schema: str, table: str, origem: str, params: Optional[dict] = None) -> None:
+    """
+    Registra os ids que o UPSERT vai reescrever (row_hash diferente), antes
+    dele: o mês sai da linha ainda gravada, então um contrato que mudou de
+    data_inicio deixa o mês antigo para create_kpi_table e
+    refresh_bi_aggregates. `origem` como em delete_moved, com id e row_hash.
+    """
+    if table not in CHANGE_LOG_TABLES:
+        return
+    col = CHANGE_LOG_TABLES[table]
+    mes = f"CAST(date_trunc('month', t.{col}) AS date)" if col else "NULL"
+    con.execute(text(f"""
+        INSERT INTO analytics.etl_alteracao (tabela, id, mes)
+        SELECT :tabela, t.id, {mes}
+        FROM {schema}.{table} t
+        JOIN {origem} ON s.id = t.id
+        WHERE t.{ROW_HASH} IS DISTINCT FROM s.{ROW_HASH}
+    """), {**(params or {}), "tabela": table})
+
+
+def _upsert_df(con, df: pd.DataFrame, schema: str, table: str,
+               conflict_cols=("id",)) -> tuple[int, int]:
+    """
+    Upsert (INSERT ... ON CONFLICT) para evitar erro de PK duplicada.
     - Só insere colunas que existem no destino.
-    - Ignora linhas cujo id já existe.
+    - Linha já existente só é reescrita se o row_hash mudou.
+    Caminho legado (fallback do COPY). Retorna (inseridas, atualizadas).
     """
     if df.empty:
-        return
+        return 0, 0
 
     cols_db = _columns_in_db(con, schema, table)
+    df = with_row_hash(df, table, cols_db)
     cols_keep = [c for c in df.columns if c in cols_db]
     if not cols_keep:
         log(f" ! Aviso: nenhum campo de {schema}.{table} encontrado no DataFrame. Nada a inserir.")
-        return
+        return 0, 0
+    df = _last_per_id(partition_ready(con, table, df))
 
-    md = MetaData()
-    tbl = Table(table, md, schema=schema, autoload_with=con)
+    tbl = _reflected_table(con, schema, table)
 
-    records = df.loc[:, cols_keep].to_dict(orient="records")
+    # NaN/NaT viram None (NULL); datetime64 chega aqui vindo do cache colunar
+    sub = df.loc[:, cols_keep].astype(object)
+    records = sub.where(sub.notna(), None).to_dict(orient="records")
     CHUNK = 1000
+    inserted = updated = 0
+    update_cols = _update_set(table, cols_keep, conflict_cols)
+
+    col = PARTITIONED.get(table)
+    moves = col is not None and {"id", col} <= set(cols_keep)
 
     for i in range(0, len(records), CHUNK):
         chunk = records[i:i + CHUNK]
         if not chunk:
             continue
-        stmt = pg_insert(tbl).values(chunk).on_conflict_do_nothing(
-            index_elements=list(conflict_cols)
+        movidas = 0
+        if moves:
+            movidas = delete_moved(
+                con, schema, table,
+                f"unnest(CAST(:ids AS bigint[]), CAST(:datas AS date[])) AS s(id, {col})",
+                {"ids": [r["id"] for r in chunk], "datas": [r[col] for r in chunk]})
+        stmt = pg_insert(tbl).values(chunk)
+        if update_cols and ROW_HASH in cols_keep:
+            _log_changes(con, schema, table,
+                         "unnest(CAST(:ids AS bigint[]), CAST(:hashes AS bigint[])) AS s(id, row_hash)",
+                         {"ids": [r["id"] for r in chunk], "hashes": [r[ROW_HASH] for r in chunk]})
+            stmt = stmt.on_conflict_do_update(
+                index_elements=list(conflict_cols),
+                set_={c: func.coalesce(stmt.excluded[c], tbl.c[c]) if derivada else stmt.excluded[c]
+                      for c, derivada in update_cols.items()},
+                where=tbl.c[ROW_HASH].is_distinct_from(stmt.excluded[ROW_HASH]),
+            )
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=list(conflict_cols))
+        stmt = stmt.returning(literal_column("(xmax = 0)"))
+        with metricas.span("upsert_bloco", agregar=True, tabela=table) as m:
+            novas = con.execute(stmt).scalars().all()
+            # linha que mudou de data: removida e regravada, conta como atualizada
+            movidas = min(movidas, sum(novas))
+            ins, upd = sum(novas) - movidas, len(novas) - sum(novas) + movidas
+            m.update(linhas_in=len(chunk), inseridas=ins, atualizadas=upd,
+                     ignoradas=len(chunk) - ins - upd)
+        inserted += ins
+        updated += upd
+    return inserted, updated
+
+
+# ----------------------------- CARGA VIA COPY ----------------------------- #
+def _merge_staging(con, staging: str, schema: str, table: str, cols: list[str],
+                   conflict_cols=("id",), where: str = "TRUE",
+                   ordem: Optional[str] = None) -> tuple[int, int]:
+    """
+    INSERT ... SELECT ... ON CONFLICT set-based da staging para o destino.
+    Com row_hash, a linha existente só é reescrita se o hash mudou; nas
+    particionadas, a que mudou de data é removida antes (delete_moved).
+    `ordem` (coluna da staging com a ordem de carga) lê só a última linha de
+    cada id (ver _last_per_id); sem ela a staging já não repete ids.
+    Retorna (inseridas, atualizadas).
+    """
+    col_list = ", ".join(cols)
+    origem = staging
+    if ordem:
+        origem = f"(SELECT DISTINCT ON (id) {col_list} FROM {staging} ORDER BY id, {ordem} DESC)"
+    movidas = 0
+    if "id" in cols and PARTITIONED.get(table) in cols:
+        movidas = delete_moved(con, schema, table, f"{origem} s")
+    dest = f"{schema}.{table}"
+    update_cols = _update_set(table, cols, conflict_cols)
+    if update_cols and ROW_HASH in cols:
+        sets = ", ".join(f"{c} = COALESCE(EXCLUDED.{c}, {dest}.{c})" if derivada else f"{c} = EXCLUDED.{c}"
+                         for c, derivada in update_cols.items())
+        acao = f"DO UPDATE SET {sets} WHERE {dest}.{ROW_HASH} IS DISTINCT FROM EXCLUDED.{ROW_HASH}"
+        _log_changes(con, schema, table, f"{origem} s")
+    else:
+        acao = "DO NOTHING"
+    ins, upd = con.execute(text(f"""
+        WITH m AS (
+          INSERT INTO {dest} ({col_list})
+          SELECT {col_list} FROM {origem} s
+          WHERE {where}
+          ON CONFLICT ({", ".join(conflict_cols)}) {acao}
+          RETURNING (xmax = 0) AS nova
         )
-        con.execute(stmt)
+        SELECT COUNT(*) FILTER (WHERE nova), COUNT(*) FILTER (WHERE NOT nova) FROM m
+    """)).one()
+    # linha que mudou de data: removida e regravada, conta como atualizada
+    movidas = min(movidas, ins)
+    return ins - movidas, upd + movidas
 
 
-def load_tables(con, clientes, contratos, premios, resgates) -> None:
-    """Carrega as tabelas tratadas com UPSERT (evita duplicadas)."""
-    _upsert_df(con, clientes,  "analytics", "dim_cliente",   conflict_cols=("id",))
-    _upsert_df(con, contratos, "analytics", "fact_contrato", conflict_cols=("id",))
-    _upsert_df(con, premios,   "analytics", "fact_premio",   conflict_cols=("id",))
-    _upsert_df(con, resgates,  "analytics", "fact_resgate",  conflict_cols=("id",))
-    log(" - Carga (UPSERT) concluída nas tabelas analytics.*")
+def _copy_upsert_df(con, df: pd.DataFrame, schema: str, table: str,
+                    conflict_cols=("id",)) -> tuple[int, int]:
+    """
+    Carga em massa: COPY para uma tabela temporária (sem WAL, descartada no
+    COMMIT) e um único INSERT ... SELECT ... ON CONFLICT no destino (só
+    reescreve linhas com row_hash diferente).
+    Retorna (inseridas, atualizadas).
+    """
+    if df.empty:
+        return 0, 0
 
+    cols_db = _columns_in_db(con, schema, table)
+    df = with_row_hash(df, table, cols_db)
+    cols_keep = [c for c in df.columns if c in cols_db]
+    if not cols_keep:
+        log(f" ! Aviso: nenhum campo de {schema}.{table} encontrado no DataFrame. Nada a inserir.")
+        return 0, 0
+    df = _last_per_id(partition_ready(con, table, df))
 
-# ----------------------------- KPI ----------------------------- #
-def create_kpi_table(con) -> None:
-    """Cria tabela de agregação mensal."""
-    con.execute(text("DROP TABLE IF EXISTS analytics.kpi_contribuicoes_mensais"))
-    con.execute(text("""
-        CREATE TABLE analytics.kpi_contribuicoes_mensais AS
-        SELECT date_trunc('month', data_inicio) AS mes,
-               SUM(valor_mensal) AS total_mensal
-        FROM analytics.fact_contrato
-        GROUP BY 1
-        ORDER BY 1;
+    staging = f"_stg_{table}"
+    col_list = ", ".join(cols_keep)
+    con.execute(text(f"DROP TABLE IF EXISTS pg_temp.{staging}"))
+    con.execute(text(f"""
+        CREATE TEMP TABLE {staging} ON COMMIT DROP AS
+        SELECT {col_list} FROM {schema}.{table} WITH NO DATA
     """))
-    log(" - KPI mensal (analytics.kpi_contribuicoes_mensais) recriada.")
+
+    with metricas.span("copy_bloco", agregar=True, tabela=table) as m:
+        cur = con.connection.cursor()
+        try:
+            copy_frame(cur, df, staging, cols_keep, cols_db)
+        finally:
+            cur.close()
+        ins, upd = _merge_staging(con, staging, schema, table, cols_keep, conflict_cols)
+        m.update(linhas_in=len(df), inseridas=ins, atualizadas=upd, ignoradas=len(df) - ins - upd)
+    con.execute(text(f"DROP TABLE IF EXISTS pg_temp.{staging}"))
+    return ins, upd
+
+
+def _supports_copy(con) -> bool:
+    cur = con.connection.cursor()
+    try:
+        return hasattr(cur, "copy_expert")
+    finally:
+        cur.close()
+
+
+def _log_rate(table: str, rows: int, dt: float, written: int) -> None:
+    rate = rows / dt if dt > 0 else 0.0
+    log(f"   · analytics.{table}: {rows} linhas em {dt:.2f}s "
+        f"({rate:,.0f} linhas/s), {written} gravadas (novas ou alteradas)")
+
+
+def _pick_upsert(con, bulk: bool):
+    if bulk and not _supports_copy(con):
+        log(" ! Driver sem suporte a COPY. Usando INSERT em lotes.")
+        bulk = False
+    return bulk, (_copy_upsert_df if bulk else _upsert_df)
+
+
+def load_table(con, df: pd.DataFrame, table: str, bulk: bool = True) -> int:
+    """UPSERT de uma tabela tratada em analytics.<table> (ver load_tables)."""
+    bulk, upsert = _pick_upsert(con, bulk)
+    t0 = time.perf_counter()
+    with metricas.span("carga", tabela=table) as m:
+        ins, upd = upsert(con, df, "analytics", table, conflict_cols=conflict_key(table))
+        m.update(linhas_in=len(df), inseridas=ins, atualizadas=upd, ignoradas=len(df) - ins - upd)
+    _log_rate(table, len(df), time.perf_counter() - t0, ins + upd)
+    return ins + upd
+
+
+def load_tables(con, clientes, contratos, premios, resgates, bulk: bool = True) -> None:
+    """
+    Carrega as tabelas tratadas com UPSERT (evita duplicadas).
+    bulk=True usa COPY + merge set-based; bulk=False (ou driver sem COPY)
+    usa o INSERT em lotes de 1000 linhas.
+    """
+    bulk, _ = _pick_upsert(con, bulk)
+
+    for df, table in [
+        (clientes,  "dim_cliente"),
+        (contratos, "fact_contrato"),
+        (premios,   "fact_premio"),
+        (resgates,  "fact_resgate"),
+    ]:
+        load_table(con, df, table, bulk)
+
+    modo = "COPY" if bulk else "UPSERT"
+    log(f" - Carga ({modo}) concluída nas tabelas analytics.*")
+
+
+def _stream_blocks(arquivo: str, table: str, date_cols, chunk_rows: int, plans: list[dict],
+                   bulk: bool, bcb: bool, cdi, meses: dict, cache: bool = True,
+                   parse_workers: int = 1):
+    """
+    Gera (plano, linha_inicio, linha_fim, bloco) dos shards de uma fonte, com
+    o bloco já tratado (datas, marca d'água, CDI). O intervalo conta as
+    linhas válidas do shard antes do corte pela marca d'água.
+    """
+    inicio = {}
+    for plan, chunk in iter_shard_chunks(arquivo, table, plans, chunk_rows, date_cols,
+                                         cache=cache, workers=parse_workers):
+        lo = inicio.get(plan["fonte"], 0)
+        inicio[plan["fonte"]] = hi = lo + len(chunk)
+        chunk = _dates_for_load(chunk, date_cols, bulk)
+        chunk = apply_watermark(chunk, plan, date_cols)
+        meses.setdefault(table, set()).update(touched_months(chunk[date_cols[0]]))
+        if table == "fact_contrato" and bcb:
+            chunk = _apply_cdi(chunk, cdi)
+        yield plan, lo, hi, chunk
+
+
+def _stream_source(*args, **kwargs):
+    """Só os blocos tratados de _stream_blocks."""
+    for *_, chunk in _stream_blocks(*args, **kwargs):
+        yield chunk
+
+
+def load_streaming(con, chunk_rows: int, bcb: bool = False, bulk: bool = True,
+                   incremental: bool = False, eng=None, workers: int = 1,
+                   staged: Optional[list] = None, cache: bool = True,
+                   cdi: Optional[CdiIndex] = None, parse_workers: int = 1,
+                   resumable: bool = False) -> dict:
+    """
+    Modo streaming: lê, limpa, converte datas e carrega cada arquivo em blocos
+    de `chunk_rows` linhas. O pico de memória depende só de chunk_rows
+    (vezes o nº de workers, quando workers > 1) — exceto com fontes em shards
+    e parse_workers > 1, em que até parse_workers shards inteiros ficam em
+    memória por fonte.
+    resumable=True confirma cada bloco em transação própria e o registra em
+    analytics.etl_checkpoint (ver load_resumable).
+    Retorna {tabela: meses das datas lidas} (para a KPI e os agregados).
+    """
+    bulk, upsert = _pick_upsert(con, bulk)
+    meses: dict[str, set] = {}
+    if resumable:
+        return load_resumable(con, chunk_rows, upsert, bulk=bulk, bcb=bcb, incremental=incremental,
+                              cache=cache, cdi=cdi, parse_workers=parse_workers)
+
+    sources, plans = {}, []
+    for arquivo, table, date_cols in FONTES:
+        shard_plans = plan_sources(con, arquivo, incremental)
+        if not shard_plans:
+            continue
+        if table == "fact_contrato" and bcb and cdi is None:
+            cdi = _fetch_cdi()
+        sources[table] = _stream_source(arquivo, table, date_cols, chunk_rows, shard_plans,
+                                        bulk, bcb, cdi, meses, cache, parse_workers)
+        plans.extend(shard_plans)
+
+    if bulk and workers > 1:
+        load_tables_parallel(eng, con, sources, workers, staged)
+    else:
+        for table, chunks in sources.items():
+            t0 = time.perf_counter()
+            rows = inserted = updated = 0
+            with metricas.span("carga", tabela=table) as m:
+                for chunk in chunks:
+                    ins, upd = upsert(con, chunk, "analytics", table, conflict_cols=conflict_key(table))
+                    rows += len(chunk)
+                    inserted += ins
+                    updated += upd
+                m.update(linhas_in=rows, inseridas=inserted, atualizadas=updated,
+                         ignoradas=rows - inserted - updated)
+            _log_rate(table, rows, time.perf_counter() - t0, inserted + updated)
+    for plan in plans:
+        save_watermark(con, plan)
+
+    modo = "COPY" if bulk else "UPSERT"
+    log(f" - Carga em streaming ({modo}, blocos de {chunk_rows} linhas) concluída.")
+    return meses
+
+
+# ----------------------------- CARGA PARALELA ----------------------------- #
+def fk_parents(con, schema: str, tables) -> dict[str, set[str]]:
+    """Grafo de FKs entre `tables`: {tabela: {tabelas que ela referencia}}."""
+    rows = con.execute(text("""
+        SELECT ch.relname AS tabela, pa.relname AS referencia
+        FROM pg_constraint c
+        JOIN pg_class ch     ON ch.oid = c.conrelid
+        JOIN pg_class pa     ON pa.oid = c.confrelid
+        JOIN pg_namespace n  ON n.oid = ch.relnamespace
+        WHERE c.contype = 'f' AND n.nspname = :sch
+    """), {"sch": schema}).fetchall()
+    parents = {t: set() for t in tables}
+    for tabela, referencia in rows:
+        if tabela in parents and referencia in parents and tabela != referencia:
+            parents[tabela].add(referencia)
+    return parents
+
+
+def load_order(parents: dict[str, set[str]]) -> list[list[str]]:
+    """Níveis topológicos: cada nível só depende dos anteriores (Kahn)."""
+    pending = {t: set(p) for t, p in parents.items()}
+    levels = []
+    while pending:
+        ready = sorted(t for t, p in pending.items() if not p & pending.keys())
+        if not ready:
+            raise RuntimeError(f"Ciclo de FK entre {sorted(pending)}")
+        levels.append(ready)
+        for t in ready:
+            del pending[t]
+    return levels
+
+
+# espera máxima por lock nas conexões da staging: um lock preso vira erro, não trava
+STAGING_LOCK_TIMEOUT = "10s"
+
+# schema próprio das stagings, criado e confirmado antes das conexões do pool:
+# na 1ª execução o schema analytics ainda não foi confirmado por `con`
+STAGING_SCHEMA = "etl_staging"
+
+# tipos do information_schema sem o tamanho/typmod: na staging ficam como texto
+# (o INSERT ... SELECT do merge converte para o tipo do destino)
+_STAGING_AS_TEXT = {"character", "character varying", "USER-DEFINED", "ARRAY"}
+
+# ordem de chegada na staging (identity preenchida pelo COPY, bloco a bloco):
+# o merge fica com a última linha de cada id
+STAGING_ORDEM = "_ordem"
+
+
+def _staging_ddl(staging: str, cols: list[str], types: dict[str, str]) -> str:
+    """
+    CREATE da staging a partir dos tipos já refletidos. Não referencia
+    analytics.<tabela>: a transação principal pode estar com ACCESS EXCLUSIVE
+    nela (TRUNCATE, DDL do schema, partições) até o merge.
+    """
+    defs = ", ".join(f"{c} {'text' if types[c] in _STAGING_AS_TEXT else types[c]}" for c in cols)
+    return (f"CREATE UNLOGGED TABLE {staging} "
+            f"({defs}, {STAGING_ORDEM} BIGINT GENERATED ALWAYS AS IDENTITY)")
+
+
+def _stage_table(eng, table: str, staging: str, frames,
+                 types: dict[str, str]) -> tuple[Optional[list[str]], int, float]:
+    """
+    COPY de todos os blocos de `frames` para uma tabela UNLOGGED em conexão
+    própria. `types` vem da conexão principal (ver _staging_ddl).
+    """
+    t0 = time.perf_counter()
+    cols, rows = None, 0
+    with eng.begin() as wcon:
+        wcon.execute(text(f"SET LOCAL lock_timeout = '{STAGING_LOCK_TIMEOUT}'"))
+        cur = wcon.connection.cursor()
+        try:
+            for df in frames:
+                if df.empty:
+                    continue
+                df = with_row_hash(df, table, types)
+                if cols is None:
+                    cols = [c for c in df.columns if c in types]
+                    wcon.execute(text(_staging_ddl(staging, cols, types)))
+                with metricas.span("copy_staging_bloco", agregar=True, tabela=table) as m:
+                    copy_frame(cur, df, staging, cols, types)
+                    m["linhas_in"] = m["linhas_out"] = len(df)
+                rows += len(df)
+        finally:
+            cur.close()
+    return cols, rows, time.perf_counter() - t0
+
+
+def load_tables_parallel(eng, con, sources: dict, workers: int,
+                         staged: Optional[list] = None) -> None:
+    """
+    Carga paralela com tudo-ou-nada:
+    1. cada tabela é copiada (COPY) para uma staging UNLOGGED própria em
+       STAGING_SCHEMA, em paralelo, cada uma numa conexão do pool — staging
+       não tem FK, então nenhuma espera pela outra;
+    2. o merge para analytics.* roda na transação principal `con`, nível a
+       nível do grafo de FKs (dim_cliente → fact_contrato → prêmios/resgates),
+       com a última linha de cada id na ordem dos blocos (STAGING_ORDEM).
+    Se algo falhar, nada chega às tabelas finais. As stagings são listadas em
+    `staged` e removidas por drop_staging depois que `con` termina.
+    As conexões da staging nunca tocam analytics.<tabela>, que `con` pode
+    estar travando (TRUNCATE/DDL ainda sem COMMIT) enquanto espera por elas.
+    """
+    run_id = uuid.uuid4().hex[:8]
+    staging = {t: f"{STAGING_SCHEMA}._stg_{t}_{run_id}" for t in sources}
+    if staged is not None:
+        staged.extend(staging.values())
+    types = {t: _columns_in_db(con, "analytics", t) for t in sources}
+    with eng.begin() as scon:
+        scon.execute(text(f"CREATE SCHEMA IF NOT EXISTS {STAGING_SCHEMA}"))
+
+    n = max(1, min(workers, len(sources)))
+    with ThreadPoolExecutor(max_workers=n) as ex:
+        futures = {t: ex.submit(_stage_table, eng, t, staging[t], frames, types[t])
+                   for t, frames in sources.items()}
+        results = {t: f.result() for t, f in futures.items()}
+
+    for level in load_order(fk_parents(con, "analytics", list(sources))):
+        for table in level:
+            cols, rows, dt_copy = results[table]
+            if not cols:
+                continue
+            t0 = time.perf_counter()
+            with metricas.span("merge", tabela=table) as m:
+                where = prepare_staged_partitions(con, table, staging[table])
+                ins, upd = _merge_staging(con, staging[table], "analytics", table, cols,
+                                          conflict_key(table), where, ordem=STAGING_ORDEM)
+                m.update(linhas_in=rows, inseridas=ins, atualizadas=upd, ignoradas=rows - ins - upd)
+            _log_rate(table, rows, dt_copy + time.perf_counter() - t0, ins + upd)
+    log(f" - Carga paralela (COPY, {n} conexões) concluída nas tabelas analytics.*")
+
+
+def drop_staging(eng, staged: list) -> None:
+    """Remove as stagings da carga paralela (roda fora da transação principal)."""
+    if not staged:
+        return
+    with eng.begin() as con:
+        for name in staged:
+            con.execute(text(f"DROP TABLE IF EXISTS {name}"))
+
+
+def plan_sources(con, arquivo: str, incremental: bool,
+                 marcas: Optional[dict] = None) -> list[dict]:
+    """plan_source de cada shard da fonte (ver resolve_source), sem os inalterados."""
+    plans = [plan_source(con, RAW, shard, incremental, marcas) for shard in resolve_source(arquivo)]
+    return [p for p in plans if p is not None]
+
+
+def load_resumable(con, chunk_rows: int, upsert, bulk: bool = True, bcb: bool = False,
+                   incremental: bool = False, cache: bool = True,
+                   cdi: Optional[CdiIndex] = None, parse_workers: int = 1) -> dict:
+    """
+    Carga em streaming retomável. Cada bloco é gravado e confirmado (COMMIT
+    em `con`) junto com sua linha em analytics.etl_checkpoint. Numa nova
+    execução após falha, os blocos já confirmados (mesmo arquivo, intervalo
+    e conteúdo) são pulados e a carga segue do primeiro incompleto —
+    recarregar um bloco é inofensivo (UPSERT por chave).
+    As marcas d'água e a limpeza do checkpoint ficam para o fim, na
+    transação corrente, que só é confirmada pela etapa "commit". Até lá as
+    fontes já carregadas continuam sendo planejadas (e seus blocos, pulados)
+    em cada nova tentativa, então os meses delas chegam à KPI e aos
+    agregados mesmo que a falha tenha sido numa tabela posterior.
+    Retorna {tabela: meses das datas lidas}, inclusive dos blocos pulados.
+    """
+    meses: dict[str, set] = {}
+    planos: list[dict] = []
+    for arquivo, table, date_cols in FONTES:
+        plans = plan_sources(con, arquivo, incremental)
+        if not plans:
+            continue
+        if table == "fact_contrato" and bcb and cdi is None:
+            cdi = _fetch_cdi()
+        feitos = committed_blocks(con, plans)
+        t0 = time.perf_counter()
+        rows = inserted = updated = pulados = 0
+        with metricas.span("carga", tabela=table) as m:
+            for plan, lo, hi, chunk in _stream_blocks(arquivo, table, date_cols, chunk_rows, plans,
+                                                      bulk, bcb, cdi, meses, cache, parse_workers):
+                bloco = frame_sha256(chunk)
+                if feitos.get((plan["fonte"], plan["offset"], lo)) == (hi, bloco):
+                    pulados += 1
+                    continue
+                ins, upd = upsert(con, chunk, "analytics", table, conflict_cols=conflict_key(table))
+                record_checkpoint(con, plan, lo, hi, bloco, len(chunk), ins)
+                con.commit()
+                rows += len(chunk)
+                inserted += ins
+                updated += upd
+            m.update(linhas_in=rows, inseridas=inserted, atualizadas=updated,
+                     ignoradas=rows - inserted - updated)
+        _log_rate(table, rows, time.perf_counter() - t0, inserted + updated)
+        if pulados:
+            log(f"   · {table}: {pulados} bloco(s) já confirmados numa execução anterior; pulados.")
+        planos += plans
+
+    for plan in planos:
+        save_watermark(con, plan)
+    clear_checkpoints(con, [p["fonte"] for p in planos])
+    modo = "COPY" if bulk else "UPSERT"
+    log(f" - Carga retomável ({modo}, blocos de {chunk_rows} linhas, COMMIT por bloco) concluída.")
+    return meses
 
 
 # ----------------------------- BCB ENRICH ----------------------------- #
-def _save_macro_cache(cdi_df: pd.DataFrame, ipca_df: pd.DataFrame) -> None:
-    if not cdi_df.empty:
-        cdi_df.to_csv(STAGING / "cdi.csv", index=False)
-    if not ipca_df.empty:
-        ipca_df.to_csv(STAGING / "ipca.csv", index=False)
+MACRO_SERIES = {"cdi": (12, "cdi_aa"), "ipca": (433, "ipca_am")}
 
 
-def _load_macro_cache() -> tuple[pd.DataFrame, pd.DataFrame]:
-    cdi_path = STAGING / "cdi.csv"
-    ipca_path = STAGING / "ipca.csv"
-    cdi = pd.read_csv(cdi_path, parse_dates=["data"]) if cdi_path.exists() else pd.DataFrame()
-    ipca = pd.read_csv(ipca_path, parse_dates=["data"]) if ipca_path.exists() else pd.DataFrame()
-    return cdi, ipca
+def _import_legacy_macro_cache() -> None:
+    """Migra uma vez os antigos data/staging/cdi.csv e ipca.csv para o serie_store."""
+    from serie_store import append_series, last_date
+    for nome, (sid, col) in MACRO_SERIES.items():
+        path = STAGING / f"{nome}.csv"
+        if path.exists() and last_date(sid) is None:
+            df = pd.read_csv(path, parse_dates=["data"])
+            if col in df:
+                append_series(sid, df.rename(columns={col: "valor"}), fetched=False)
 
 
-def enrich_with_bcb(contratos: pd.DataFrame) -> pd.DataFrame:
-    """Adiciona 'rentabilidade_estim' baseada em CDI (usa cache se API falhar)."""
+def _fetch_cdi() -> Optional[CdiIndex]:
+    """
+    CDI/IPCA a partir do serie_store local; o BCB só é consultado para séries
+    com TTL vencido, e apenas para as datas posteriores às armazenadas.
+    Devolve o índice acumulado do CDI. None quando não há dado algum.
+    """
     try:
-        from api_bcb import get_cdi, get_ipca
+        from api_bcb import get_many
+        from serie_store import append_series, is_fresh, read_series
     except Exception:
         log(" ! Módulo api_bcb não encontrado. Pulei enriquecimento BCB.")
-        contratos["rentabilidade_estim"] = None
-        return contratos
+        return None
 
-    log(" - Buscando CDI/IPCA no BCB...")
-    cdi = pd.DataFrame()
-    ipca = pd.DataFrame()
-    try:
-        cdi = get_cdi()
-        ipca = get_ipca()
-    except Exception as e:
-        log(f" ! Falha ao consultar BCB ({e}). Tentando cache local...")
+    _import_legacy_macro_cache()
+    stale = {sid: read_series(sid) for sid, _ in MACRO_SERIES.values() if not is_fresh(sid)}
+    if stale:
+        log(f" - Buscando séries {sorted(stale)} no BCB (incremental)...")
+        try:
+            for sid, df in get_many(stale, strict=True).items():
+                append_series(sid, df)
+        except Exception as e:
+            log(f" ! Falha ao consultar BCB ({e}). Usando armazenamento local...")
+    else:
+        log(" - CDI/IPCA locais dentro do TTL. BCB não consultado.")
 
+    sid, col = MACRO_SERIES["cdi"]
+    cdi = read_series(sid).rename(columns={"valor": col})
     if cdi.empty:
-        log(" ! CDI vazio (BCB fora do ar ou 406). Tentando cache local...")
-        cdi, ipca = _load_macro_cache()
-        if cdi.empty:
-            log(" ! Cache local ausente. Pulei enriquecimento.")
-            contratos["rentabilidade_estim"] = None
-            return contratos
+        log(" ! CDI indisponível (BCB fora do ar e sem dados locais). Pulei enriquecimento.")
+        return None
+    return build_cdi_index(cdi)
 
-    _save_macro_cache(cdi, ipca)
 
-    # CDI ao mês a partir do CDI ao ano
-    cdi["cdi_am"] = (1 + cdi["cdi_aa"] / 100.0) ** (1 / 12) - 1
-    cdi["competencia"] = cdi["data"].dt.to_period("M").dt.to_timestamp()
+def _apply_cdi(contratos: pd.DataFrame, cdi: Optional[CdiIndex]) -> pd.DataFrame:
+    """
+    'rentabilidade_estim' = CDI acumulado de data_inicio até a última data do
+    índice: duas consultas ao índice por contrato, sem merge nem linhas extras.
+    """
+    if cdi is None:
+        contratos["rentabilidade_estim"] = None
+        return contratos
 
     contratos = contratos.copy()
-    contratos["competencia"] = pd.to_datetime(
-        contratos["data_inicio"], errors="coerce"
-    ).to_period("M").dt.to_timestamp()
-
-    contratos = contratos.merge(
-        cdi[["competencia", "cdi_am"]],
-        on="competencia",
-        how="left"
-    )
+    contratos["rentabilidade_estim"] = cdi.accrued(contratos["data_inicio"]).round(6)
+    return contratos
 
-    contratos["rentabilidade_estim"] = (1 + contratos["cdi_am"].fillna(0)) ** 12 - 1
-    contratos.drop(columns=["competencia", "cdi_am"], inplace=True, errors="ignore")
 
-    log(" - Enriquecimento com CDI/IPCA concluído.")
+def enrich_with_bcb(contratos: pd.DataFrame, cdi: Optional[CdiIndex] = None) -> pd.DataFrame:
+    """Adiciona 'rentabilidade_estim' baseada em CDI (usa armazenamento local se API falhar)."""
+    if cdi is None:
+        cdi = _fetch_cdi()
+    contratos = _apply_cdi(contratos, cdi)
+    if cdi is not None:
+        log(" - Enriquecimento com CDI/IPCA concluído.")
     return contratos
 
 
 # ----------------------------- RELATÓRIO ----------------------------- #
-def maybe_generate_report(enable: bool) -> None:
-    """Gera relatório PDF final se flag --report estiver ativa."""
+def maybe_generate_report(enable: bool, agregados: Optional[dict] = None) -> None:
+    """
+    Gera relatório PDF final se flag --report estiver ativa, no mesmo processo,
+    reaproveitando os agregados calculados na transação do ETL.
+    """
     if not enable:
         return
-    import subprocess, sys
-    rel_path = ROOT / "src" / "gerar_relatorio.py"
-    if rel_path.exists():
-        log(" - Gerando relatório PDF...")
+    log(" - Gerando relatório PDF...")
+    try:
+        from gerar_relatorio import gerar_pdf
+        with metricas.span("relatorio"):
+            path = gerar_pdf(agregados)
+        log(f" - Relatório PDF gerado em {path.relative_to(ROOT)}")
+    except Exception as e:
+        log(f" ! Aviso: falha ao gerar relatório PDF ({e})")
+
+
+# ----------------------------- MÉTRICAS ----------------------------- #
+def export_metrics(json_path: Optional[Path], prom_path: Optional[Path]) -> None:
+    """Exporta os spans de metricas; falha de escrita não derruba o ETL."""
+    for path, export in ((json_path, metricas.export_json), (prom_path, metricas.export_prometheus)):
+        if path is None:
+            continue
         try:
-            subprocess.run([sys.executable, str(rel_path)], check=True)
-            log(" - Relatório PDF gerado em report/report_brasilcap.pdf")
-        except Exception as e:
-            log(f" ! Aviso: falha ao gerar relatório PDF ({e})")
+            export(path)
+            log(f" - Métricas gravadas em {path}")
+        except OSError as e:
+            log(f" ! Aviso: falha ao gravar métricas em {path} ({e})")
+
+
+# ----------------------------- PIPELINE ----------------------------- #
+def load_levels(con, tabelas) -> list[list[str]]:
+    """
+    Níveis de carga pelo grafo de FKs do banco (fk_parents + load_order).
+    Sem conexão ou sem FK entre as tabelas (ex.: 1ª execução, schema ainda
+    não aplicado), uma tabela por nível na ordem de FONTES.
+    """
+    parents = fk_parents(con, "analytics", tabelas) if con is not None else {}
+    if not any(parents.values()):
+        return [[t] for t in tabelas]
+    return load_order(parents)
+
+
+def build_pipeline(args, niveis: Optional[list[list[str]]] = None) -> list[Etapa]:
+    """
+    O ETL como DAG de etapas (ver pipeline.py). O contexto traz "eng", "con"
+    (conexão cuja transação a etapa "commit" confirma) e "staged". Leituras,
+    BCB e enriquecimento não tocam a conexão e rodam em paralelo entre si e
+    com a carga das tabelas já lidas. `niveis` (load_levels) ordena a carga
+    por tabela: cada uma espera as dos níveis anteriores do grafo de FKs.
+    """
+    tabelas = [t for _, t, _ in FONTES]
+    niveis = niveis or load_levels(None, tabelas)
+    etapas: list[Etapa] = []
+    preparo = ("schema", "truncate", "particoes")
+    full = args.kpi_full or args.truncate
+
+    def etapa(nome, fn, **kw):
+        etapas.append(Etapa(nome, fn, **kw))
+
+    def schema(ctx):
+        with metricas.span("schema"):
+            apply_schema(ctx["con"], force=args.schema_force)
+    etapa("schema", schema, banco=True)
+
+    if args.truncate:
+        def truncate(ctx):
+            with metricas.span("truncate"):
+                # o 1º bloco confirmado já tornou o TRUNCATE durável: retomando, não limpa de novo
+                if args.resumable and pending_checkpoints(ctx["con"]):
+                    log(" - Carga retomável pendente (analytics.etl_checkpoint): TRUNCATE pulado.")
+                    return
+                truncate_dev(ctx["con"])
+        etapa("truncate", truncate, apos=("schema",), banco=True)
+
+    if args.drop_partitions_before:
+        def particoes(ctx):
+            with metricas.span("particoes"):
+                drop_partitions_before(ctx["con"], args.drop_partitions_before + "-01")
+        etapa("particoes", particoes, apos=("schema", "truncate"), banco=True)
+
+    # Índice acumulado do CDI (rede/disco; a dimensão é gravada à parte)
+    if args.bcb:
+        def bcb(ctx):
+            with metricas.span("bcb") as m:
+                cdi = _fetch_cdi()
+                m["linhas_out"] = len(cdi.fator) if cdi is not None else 0
+            return {"cdi": cdi}
+        etapa("bcb", bcb, saidas=("cdi",))
+
+        def cdi_indice(ctx):
+            if ctx["cdi"] is not None:
+                save_cdi_index(ctx["con"], ctx["cdi"])
+        etapa("cdi_indice", cdi_indice, entradas=("cdi",), apos=("schema",), banco=True)
+
+    meses_saidas = tuple(f"meses_{t}" for t in tabelas)
+    if args.chunk_rows:
+        # Leitura + datas + BCB + carga em blocos de tamanho fixo
+        def carga_streaming(ctx):
+            meses = load_streaming(ctx["con"], args.chunk_rows, bcb=args.bcb, bulk=not args.no_copy,
+                                   incremental=args.incremental, eng=ctx["eng"],
+                                   workers=args.workers, staged=ctx["staged"],
+                                   cache=not args.no_cache, cdi=ctx.get("cdi"),
+                                   parse_workers=args.parse_workers, resumable=args.resumable)
+            return {f"meses_{t}": meses.get(t, set()) for t in tabelas}
+        etapa("carga", carga_streaming, entradas=("cdi",) if args.bcb else (),
+              saidas=meses_saidas, apos=preparo, banco=True)
+        cargas = leituras = ("carga",)
     else:
-        log(" ! Script de relatório não encontrado (src/gerar_relatorio.py).")
+        def marcas(ctx):
+            return {"marcas": load_watermarks(ctx["con"]) if args.incremental else {}}
+        etapa("marcas", marcas, saidas=("marcas",), apos=preparo, banco=True)
+
+        # Leitura + datas (+ corte pela marca d'água), uma etapa por fonte
+        for arquivo, table, date_cols in FONTES:
+            def leitura(ctx, arquivo=arquivo, table=table, date_cols=date_cols):
+                with metricas.span("leitura", arquivo=arquivo) as m:
+                    plans = plan_sources(None, arquivo, args.incremental, ctx["marcas"])
+                    partes = []
+                    for plan, df in iter_parsed_shards(arquivo, table, plans, date_cols,
+                                                       cache=not args.no_cache,
+                                                       workers=args.parse_workers):
+                        m["linhas_in"] += len(df)
+                        df = _dates_for_load(df, date_cols, bulk=not args.no_copy)
+                        partes.append(apply_watermark(df, plan, date_cols))
+                    df = (pd.DataFrame() if not partes else partes[0] if len(partes) == 1
+                          else pd.concat(partes, ignore_index=True))
+                    m["linhas_out"] = len(df)
+                return {f"frame_{table}": df, f"planos_{table}": plans,
+                        f"meses_{table}": touched_months(df.get(date_cols[0], []))}
+            etapa(f"leitura_{table}", leitura, entradas=("marcas",),
+                  saidas=(f"frame_{table}", f"planos_{table}", f"meses_{table}"))
+        leituras = tuple(f"leitura_{t}" for t in tabelas)
+
+        # Enriquecimento BCB (opcional)
+        frame = {t: f"frame_{t}" for t in tabelas}
+        if args.bcb:
+            def enriquecimento(ctx):
+                df = ctx["frame_fact_contrato"]
+                if not df.empty:
+                    with metricas.span("enriquecimento") as m:
+                        df = enrich_with_bcb(df, ctx["cdi"])
+                        m["linhas_in"] = m["linhas_out"] = len(df)
+                return {"contratos_bcb": df}
+            etapa("enriquecimento", enriquecimento, entradas=("frame_fact_contrato", "cdi"),
+                  saidas=("contratos_bcb",))
+            frame["fact_contrato"] = "contratos_bcb"
+
+        # Carga (COPY + merge; --no-copy volta ao INSERT em lotes)
+        if args.workers > 1:
+            def carga_paralela(ctx):
+                load_tables_parallel(ctx["eng"], ctx["con"], {t: [ctx[frame[t]]] for t in tabelas},
+                                     args.workers, ctx["staged"])
+                return {f"carregado_{t}": True for t in tabelas}
+            etapa("carga", carga_paralela, entradas=tuple(frame.values()),
+                  saidas=tuple(f"carregado_{t}" for t in tabelas), apos=preparo, banco=True)
+            cargas = ("carga",)
+        else:
+            anteriores: tuple[str, ...] = ()
+            for nivel in niveis:
+                for table in nivel:
+                    def carga(ctx, table=table):
+                        load_table(ctx["con"], ctx[frame[table]], table, bulk=not args.no_copy)
+                        return {f"carregado_{table}": True}
+                    etapa(f"carga_{table}", carga, entradas=(frame[table],),
+                          saidas=(f"carregado_{table}",), apos=preparo + anteriores, banco=True)
+                anteriores += tuple(f"carga_{t}" for t in nivel)
+            cargas = tuple(f"carga_{t}" for t in tabelas)
+
+        def watermark(ctx):
+            for t in tabelas:
+                if ctx.get(f"carregado_{t}"):
+                    for plan in ctx.get(f"planos_{t}", ()):
+                        save_watermark(ctx["con"], plan)
+        etapa("watermark", watermark, apos=cargas, banco=True)
+
+    # KPIs (após --truncate não há base para merge; sem os meses lidos, recalcula tudo)
+    def kpi(ctx):
+        meses = ctx.get("meses_fact_contrato")
+        with metricas.span("kpi") as m:
+            create_kpi_table(ctx["con"], meses, full=full or meses is None)
+            m["linhas_in"] = len(meses or ())
+    etapa("kpi", kpi, apos=cargas + leituras, banco=True)
+
+    # Agregados mensais que alimentam as medidas do Power BI; depois da KPI,
+    # que também lê analytics.etl_alteracao (consumida aqui)
+    def agregados_bi(ctx):
+        meses = {t: ctx[f"meses_{t}"] for t in tabelas if f"meses_{t}" in ctx}
+        with metricas.span("agregados_bi") as m:
+            m["linhas_out"] = refresh_bi_aggregates(ctx["con"], meses if len(meses) == len(tabelas) else None,
+                                                    full=full)
+    etapa("agregados_bi", agregados_bi, apos=cargas + leituras + ("kpi",), banco=True)
+
+    # Agregados do relatório, lidos na mesma transação (sem 2º engine)
+    if args.report:
+        def relatorio_agregados(ctx):
+            from gerar_relatorio import consultar_agregados
+            with metricas.span("relatorio_agregados"):
+                return {"agregados": consultar_agregados(ctx["con"])}
+        etapa("relatorio_agregados", relatorio_agregados, saidas=("agregados",),
+              apos=("kpi", "agregados_bi", "watermark"), banco=True)
+
+    def commit(ctx):
+        ctx["con"].commit()
+        drop_staging(ctx["eng"], ctx["staged"])
+        ctx["staged"].clear()
+    etapa("commit", commit, apos=tuple(e.nome for e in etapas if e.banco), banco=True)
+
+    if args.report:
+        def relatorio(ctx):
+            maybe_generate_report(True, ctx.get("agregados"))
+        etapa("relatorio", relatorio, apos=("commit", "relatorio_agregados"))
+    return etapas
 
 
 # ----------------------------- MAIN ----------------------------- #
@@ -272,41 +1331,87 @@ def main():
                         help="Gera relatório PDF ao final.")
     parser.add_argument("--bcb", action="store_true",
                         help="Enriquece contratos com CDI/IPCA do Banco Central.")
+    parser.add_argument("--no-copy", action="store_true",
+                        help="Desliga a carga via COPY e usa INSERT em lotes (fallback).")
+    parser.add_argument("--chunk-rows", type=int, default=None, metavar="N",
+                        help="Modo streaming: lê e carrega os CSVs em blocos de N linhas.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Pula arquivos inalterados e carrega só linhas após a última marca.")
+    parser.add_argument("--kpi-full", action="store_true",
+                        help="Recalcula a KPI mensal inteira (padrão: só os meses carregados).")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Não usa o cache colunar (Parquet) de data/staging.")
+    parser.add_argument("--workers", type=int, default=1, metavar="N",
+                        help="Carrega as tabelas em paralelo usando até N conexões (requer COPY).")
+    parser.add_argument("--parse-workers", type=int, default=os.cpu_count() or 1, metavar="N",
+                        help="Processos para ler/validar fontes em shards (padrão: nº de CPUs).")
+    parser.add_argument("--resumable", action="store_true",
+                        help="Com --chunk-rows: confirma cada bloco e registra checkpoints; "
+                             "uma nova execução após falha continua do primeiro bloco incompleto "
+                             "(com --truncate, só limpa as tabelas se não houver checkpoints pendentes).")
+    parser.add_argument("--drop-partitions-before", default=None, metavar="AAAA-MM",
+                        help="Remove as partições mensais de prêmios/resgates anteriores ao mês.")
+    parser.add_argument("--schema-force", action="store_true",
+                        help="Reaplica o DDL mesmo que a versão/hash registrados não tenham mudado.")
+    parser.add_argument("--metrics-json", type=Path, default=None, metavar="ARQ",
+                        help="Grava as métricas por etapa (tempo, linhas, memória) em JSON.")
+    parser.add_argument("--metrics-prom", type=Path, default=None, metavar="ARQ",
+                        help="Grava as métricas no formato textfile do Prometheus (.prom).")
+    parser.add_argument("--only", default=None, metavar="ETAPAS",
+                        help="Roda só estas etapas (vírgulas; aceita curingas, ex.: 'leitura_*,kpi').")
+    parser.add_argument("--from", dest="desde", default=None, metavar="ETAPA",
+                        help="Roda a etapa e tudo que depende dela.")
+    parser.add_argument("--list-stages", action="store_true",
+                        help="Lista as etapas do pipeline (com as flags dadas) e sai.")
     args = parser.parse_args()
+    if args.chunk_rows is not None and args.chunk_rows <= 0:
+        parser.error("--chunk-rows deve ser maior que zero.")
+    if args.workers < 1 or args.parse_workers < 1:
+        parser.error("--workers e --parse-workers devem ser maiores que zero.")
+    if args.resumable and not args.chunk_rows:
+        parser.error("--resumable requer --chunk-rows.")
+    if args.workers > 1 and args.no_copy:
+        log(" ! --workers ignorado com --no-copy (a carga paralela usa COPY).")
+        args.workers = 1
+    if args.workers > 1 and args.resumable:
+        log(" ! --workers ignorado com --resumable (cada bloco é confirmado em sequência).")
+        args.workers = 1
 
-    print(">>> Iniciando ETL")
-
-    eng = get_engine()
-    with eng.begin() as con:
-        apply_schema(con)
-        if args.truncate:
-            truncate_dev(con)
-
-        # Leitura
-        clientes  = read_csv_or_fail("clientes.csv")
-        contratos = read_csv_or_fail("contratos.csv")
-        premios   = read_csv_or_fail("premios.csv")
-        resgates  = read_csv_or_fail("resgates.csv")
-
-        # Datas
-        clientes  = coerce_dates(clientes,  ["data_inicio"])
-        contratos = coerce_dates(contratos, ["data_inicio"])
-        premios   = coerce_dates(premios,   ["data_premio"])
-        resgates  = coerce_dates(resgates,  ["data_resgate"])
-
-        # Enriquecimento BCB (opcional)
-        if args.bcb:
-            contratos = enrich_with_bcb(contratos)
+    only = [p.strip() for p in args.only.split(",") if p.strip()] if args.only else None
 
-        # Carga (UPSERT)
-        load_tables(con, clientes, contratos, premios, resgates)
+    def etapas_do_run(niveis=None) -> list[Etapa]:
+        return pipeline.select(build_pipeline(args, niveis), only, args.desde, fixas=("commit",))
 
-        # KPIs
-        create_kpi_table(con)
+    try:
+        etapas = etapas_do_run()
+    except ValueError as e:
+        parser.error(str(e))
+    if args.list_stages:
+        print("\n".join(pipeline.describe(etapas)))
+        return
 
-    print(">>> ETL finalizado")
-    maybe_generate_report(args.report)
+    print(">>> Iniciando ETL")
+    if args.metrics_json or args.metrics_prom:
+        metricas.enable(trace_memory=True)
 
+    eng = get_engine()
+    ctx = {"eng": eng, "staged": []}
+    try:
+        with metricas.span("etl"):
+            try:
+                # a transação é confirmada pela etapa "commit"; falha = rollback no close
+                with eng.connect() as con:
+                    ctx["con"] = con
+                    # ordem de carga pelo grafo de FKs do banco (só leitura do catálogo)
+                    etapas = etapas_do_run(load_levels(con, [t for _, t, _ in FONTES]))
+                    pipeline.run(etapas, ctx, log=log)
+            finally:
+                drop_staging(eng, ctx["staged"])
+            print(">>> ETL finalizado")
+    finally:
+        # exporta também quando o ETL falha (a etapa com erro fica marcada)
+        export_metrics(args.metrics_json, args.metrics_prom)
 
 if __name__ == "__main__":
     main()
+
@@ -1,86 +1,222 @@
-import random
-import pandas as pd
-from faker import Faker
+"""
+Gera CSVs fictícios (clientes, contratos, prêmios e resgates) em data/raw.
+
+As colunas são montadas em bloco com NumPy, em lotes de --chunk-rows linhas,
+e cada tabela/shard é escrito por um processo próprio. Com --shards 1 saem os
+arquivos únicos de sempre (clientes.csv, ...); com --shards N saem
+clientes_000.csv ... clientes_{N-1}.csv, etc. A mesma combinação de
+parâmetros e --seed gera sempre os mesmos dados.
+
+    python src/gerar_dados_fake.py --clientes 1000000 --contratos 20000000 --shards 8
+"""
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from datetime import date
+import numpy as np
+import pandas as pd
 
 ROOT = Path(__file__).resolve().parents[1]
 RAW = ROOT / "data" / "raw"
-RAW.mkdir(parents=True, exist_ok=True)
-
-fake = Faker("pt_BR")
-random.seed(42)
 
 ESTADOS = ["RJ", "SP", "MG", "RS", "BA", "PR", "PE", "SC", "DF", "GO"]
 TIPOS_TITULO = ["Mensal", "Trimestral", "Anual"]
+STATUS = ["ATIVO", "RESGATADO", "CANCELADO"]
+STATUS_PESOS = [0.65, 0.25, 0.10]
+RENDAS = [2000, 3000, 4000, 5000, 7000, 10000, 15000, 20000]
+VALORES_MENSAIS = [50, 90, 120, 150, 200, 300, 400, 500, 800, 1000]
+FAIXAS = ["18–25", "26–35", "36–45", "46–60", "60+"]
+FAIXAS_LIMITES = [25, 35, 45, 60]  # idade <= limite -> faixa correspondente
+
+# proporções da amostra original (250 clientes, 600 contratos, 249 prêmios, 199 resgates)
+PREMIOS_POR_CONTRATO = 249 / 600
+RESGATES_POR_CONTRATO = 199 / 600
+ID_CONTRATO_BASE = 1000
+
+# janelas de datas (em dias até hoje), as mesmas do Faker na versão anterior
+DIAS_CLIENTE = 730     # -2y
+DIAS_CONTRATO = 540    # -18m
+DIAS_PREMIO = 365      # -1y
+DIAS_RESGATE = 240     # -8m
+
+TABELA_CODIGO = {"clientes": 1, "contratos": 2, "premios": 3}
+
+PRIMEIROS_NOMES = [
+    "Ana", "Maria", "Julia", "Beatriz", "Mariana", "Camila", "Larissa", "Fernanda",
+    "Gabriela", "Leticia", "Joao", "Pedro", "Lucas", "Gabriel", "Rafael", "Gustavo",
+    "Felipe", "Bruno", "Thiago", "Matheus", "Carlos", "Paulo", "Luiz", "Marcos",
+]
+SOBRENOMES = [
+    "Silva", "Santos", "Oliveira", "Souza", "Rodrigues", "Ferreira", "Alves",
+    "Pereira", "Lima", "Gomes", "Costa", "Ribeiro", "Martins", "Carvalho",
+    "Almeida", "Lopes", "Soares", "Fernandes", "Vieira", "Barbosa", "Rocha",
+]
+
+
+def _name_pools(seed: int) -> tuple[np.ndarray, np.ndarray]:
+    """Pools de nomes/sobrenomes (Faker pt_BR se instalado; senão lista fixa)."""
+    try:
+        from faker import Faker
+    except ImportError:
+        return np.array(PRIMEIROS_NOMES), np.array(SOBRENOMES)
+    fake = Faker("pt_BR")
+    fake.seed_instance(seed)
+    return (np.array(sorted({fake.first_name() for _ in range(2000)})),
+            np.array(sorted({fake.last_name() for _ in range(2000)})))
+
+
+def _rng(seed: int, tabela: str, bloco: int) -> np.random.Generator:
+    return np.random.default_rng([seed, TABELA_CODIGO[tabela], bloco])
+
+
+def _datas(rng: np.random.Generator, n: int, dias: int) -> np.ndarray:
+    hoje = np.datetime64("today", "D")
+    return hoje - rng.integers(0, dias + 1, size=n).astype("timedelta64[D]")
+
+
+def _blocks(total: int, shards: int, chunk_rows: int) -> list[tuple[int, int, int]]:
+    """Todos os lotes (shard, início, fim) da tabela, em ordem global."""
+    out = []
+    for s in range(shards):
+        lo, hi = total * s // shards, total * (s + 1) // shards
+        for start in range(lo, hi, chunk_rows):
+            out.append((s, start, min(start + chunk_rows, hi)))
+    return out
+
+
+# ----------------------------- TABELAS ----------------------------- #
+def _clientes(rng, start: int, stop: int, nomes, sobrenomes) -> pd.DataFrame:
+    n = stop - start
+    idade = rng.integers(18, 76, size=n)
+    return pd.DataFrame({
+        "id": np.arange(start + 1, stop + 1),
+        "nome": np.char.add(np.char.add(rng.choice(nomes, n), " "), rng.choice(sobrenomes, n)),
+        "estado": rng.choice(ESTADOS, n),
+        "idade": idade,
+        "faixa_etaria": np.array(FAIXAS)[np.searchsorted(FAIXAS_LIMITES, idade, side="left")],
+        "renda_mensal": rng.choice(RENDAS, n) + rng.integers(-500, 501, size=n),
+        "data_inicio": _datas(rng, n, DIAS_CLIENTE),
+    })
+
+
+def _contratos(rng, start: int, stop: int, n_clientes: int) -> pd.DataFrame:
+    n = stop - start
+    return pd.DataFrame({
+        "id": ID_CONTRATO_BASE + np.arange(start + 1, stop + 1),
+        "cliente_id": rng.integers(1, n_clientes + 1, size=n),
+        "valor_mensal": rng.choice(VALORES_MENSAIS, n),
+        "data_inicio": _datas(rng, n, DIAS_CONTRATO),
+        "status": rng.choice(STATUS, n, p=STATUS_PESOS),
+        "tipo_titulo": rng.choice(TIPOS_TITULO, n),
+    })
+
+
+def _resgates(rng, contratos: pd.DataFrame, n: int, primeiro_id: int) -> pd.DataFrame:
+    """Resgates do lote, sempre apontando para contratos RESGATADO do mesmo lote."""
+    elegiveis = contratos.loc[contratos["status"] == "RESGATADO", "id"].to_numpy()
+    if not len(elegiveis):
+        n = 0
+    return pd.DataFrame({
+        "id": np.arange(primeiro_id, primeiro_id + n),
+        "contrato_id": rng.choice(elegiveis, n) if n else np.empty(0, dtype=np.int64),
+        "data_resgate": _datas(rng, n, DIAS_RESGATE),
+        "valor": rng.uniform(200, 8000, size=n).round(2),
+    })
+
+
+def _premios(rng, start: int, stop: int, n_contratos: int) -> pd.DataFrame:
+    n = stop - start
+    return pd.DataFrame({
+        "id": np.arange(start + 1, stop + 1),
+        "contrato_id": ID_CONTRATO_BASE + rng.integers(1, n_contratos + 1, size=n),
+        "data_premio": _datas(rng, n, DIAS_PREMIO),
+        "valor": rng.uniform(1000, 150000, size=n).round(2),
+    })
+
+
+# ----------------------------- ESCRITA ----------------------------- #
+def _arquivo(out: Path, nome: str, shard: int, shards: int) -> Path:
+    return out / (f"{nome}.csv" if shards == 1 else f"{nome}_{shard:03d}.csv")
+
+
+def _write(df: pd.DataFrame, path: Path, first: bool) -> None:
+    df.to_csv(path, mode="w" if first else "a", header=first, index=False)
+
+
+def _gerar_shard(tabela: str, shard: int, cfg: dict) -> dict[str, int]:
+    """Gera e escreve todos os lotes de um shard de `tabela` (roda num processo)."""
+    out, shards, chunk = cfg["out"], cfg["shards"], cfg["chunk_rows"]
+    total = {"clientes": cfg["clientes"], "contratos": cfg["contratos"],
+             "premios": cfg["premios"]}[tabela]
+    blocos = _blocks(total, shards, chunk)
+    contagem: dict[str, int] = {}
+
+    if tabela == "clientes":
+        nomes, sobrenomes = _name_pools(cfg["seed"])
+    if tabela == "contratos":
+        # ids de resgate contíguos: deslocamento = resgates dos lotes anteriores
+        n_res = [round((b[2] - b[1]) * RESGATES_POR_CONTRATO) for b in blocos]
+        offsets = np.concatenate([[1], 1 + np.cumsum(n_res)[:-1]]) if blocos else []
+
+    first = True
+    for i, (s, start, stop) in enumerate(blocos):
+        if s != shard:
+            continue
+        rng = _rng(cfg["seed"], tabela, i)
+        if tabela == "clientes":
+            parts = {"clientes": _clientes(rng, start, stop, nomes, sobrenomes)}
+        elif tabela == "contratos":
+            con = _contratos(rng, start, stop, cfg["clientes"])
+            parts = {"contratos": con,
+                     "resgates": _resgates(rng, con, n_res[i], int(offsets[i]))}
+        else:
+            parts = {"premios": _premios(rng, start, stop, cfg["contratos"])}
+        for nome, df in parts.items():
+            _write(df, _arquivo(out, nome, shard, shards), first)
+            contagem[nome] = contagem.get(nome, 0) + len(df)
+        first = False
+    return contagem
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera CSVs fictícios de capitalização.")
+    parser.add_argument("--clientes", type=int, default=250)
+    parser.add_argument("--contratos", type=int, default=600)
+    parser.add_argument("--premios", type=int, default=None,
+                        help="Padrão: proporcional a --contratos (249 para 600).")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--shards", type=int, default=1,
+                        help="Nº de arquivos por tabela (1 = clientes.csv, ...).")
+    parser.add_argument("--chunk-rows", type=int, default=1_000_000,
+                        help="Linhas geradas por lote (limita a memória por processo).")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--out", type=Path, default=RAW)
+    args = parser.parse_args()
+    if min(args.clientes, args.contratos, args.shards, args.chunk_rows, args.workers) < 1:
+        parser.error("--clientes, --contratos, --shards, --chunk-rows e --workers devem ser > 0.")
+
+    args.out.mkdir(parents=True, exist_ok=True)
+    cfg = {
+        "out": args.out, "seed": args.seed, "shards": args.shards,
+        "chunk_rows": args.chunk_rows, "clientes": args.clientes,
+        "contratos": args.contratos,
+        "premios": args.premios if args.premios is not None
+        else round(args.contratos * PREMIOS_POR_CONTRATO),
+    }
+
+    tarefas = [(t, s) for t in ("clientes", "contratos", "premios") for s in range(args.shards)]
+    total: dict[str, int] = {}
+    with ProcessPoolExecutor(max_workers=min(args.workers, len(tarefas))) as ex:
+        for contagem in ex.map(_gerar_shard, *zip(*tarefas), [cfg] * len(tarefas)):
+            for nome, n in contagem.items():
+                total[nome] = total.get(nome, 0) + n
+
+    print(f"✅ CSVs gerados com sucesso em {args.out}")
+    print(f" - Clientes:  {total.get('clientes', 0)} registros")
+    print(f" - Contratos: {total.get('contratos', 0)} registros")
+    print(f" - Prêmios:   {total.get('premios', 0)} registros")
+    print(f" - Resgates:  {total.get('resgates', 0)} registros")
+
 
-n_clientes = 250
-clientes = []
-for i in range(1, n_clientes + 1):
-    nome = fake.name()
-    estado = random.choice(ESTADOS)
-    idade = random.randint(18, 75)
-    if idade <= 25:
-        faixa = "18–25"
-    elif idade <= 35:
-        faixa = "26–35"
-    elif idade <= 45:
-        faixa = "36–45"
-    elif idade <= 60:
-        faixa = "46–60"
-    else:
-        faixa = "60+"
-    renda = random.choice([2000, 3000, 4000, 5000, 7000, 10000, 15000, 20000]) + random.randint(-500, 500)
-    data_inicio = fake.date_between(start_date="-2y", end_date="today")
-    clientes.append((i, nome, estado, idade, faixa, renda, data_inicio))
-
-df_clientes = pd.DataFrame(
-    clientes,
-    columns=["id", "nome", "estado", "idade", "faixa_etaria", "renda_mensal", "data_inicio"],
-)
-df_clientes.to_csv(RAW / "clientes.csv", index=False)
-
-n_contratos = 600
-contratos = []
-for i in range(1, n_contratos + 1):
-    cliente_id = random.randint(1, n_clientes)
-    valor_mensal = random.choice([50, 90, 120, 150, 200, 300, 400, 500, 800, 1000])
-    data_inicio = fake.date_between(start_date="-18m", end_date="today")
-    status = random.choices(["ATIVO", "RESGATADO", "CANCELADO"], weights=[0.65, 0.25, 0.1])[0]
-    tipo = random.choice(TIPOS_TITULO)
-    contratos.append((1000 + i, cliente_id, valor_mensal, data_inicio, status, tipo))
-
-df_contratos = pd.DataFrame(
-    contratos,
-    columns=["id", "cliente_id", "valor_mensal", "data_inicio", "status", "tipo_titulo"],
-)
-df_contratos.to_csv(RAW / "contratos.csv", index=False)
-
-premios = []
-for i in range(1, 250):
-    contrato_id = random.choice(df_contratos["id"].tolist())
-    valor = round(random.uniform(1000, 150000), 2)
-    data_premio = fake.date_between(start_date="-1y", end_date="today")
-    premios.append((i, contrato_id, data_premio, valor))
-
-df_premios = pd.DataFrame(premios, columns=["id", "contrato_id", "data_premio", "valor"])
-df_premios.to_csv(RAW / "premios.csv", index=False)
-
-resgates = []
-contratos_resgatados = df_contratos[df_contratos["status"] == "RESGATADO"]["id"].tolist()
-for i in range(1, 200):
-    if not contratos_resgatados:
-        break
-    contrato_id = random.choice(contratos_resgatados)
-    valor = round(random.uniform(200, 8000), 2)
-    data_resgate = fake.date_between(start_date="-8m", end_date="today")
-    resgates.append((i, contrato_id, data_resgate, valor))
-
-df_resgates = pd.DataFrame(resgates, columns=["id", "contrato_id", "data_resgate", "valor"])
-df_resgates.to_csv(RAW / "resgates.csv", index=False)
-
-print(f"✅ CSVs gerados com sucesso em {RAW}")
-print(f" - Clientes:  {len(df_clientes)} registros")
-print(f" - Contratos: {len(df_contratos)} registros")
-print(f" - Prêmios:   {len(df_premios)} registros")
-print(f" - Resgates:  {len(df_resgates)} registros")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
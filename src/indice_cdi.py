@@ -0,0 +1,93 @@
+"""
+Índice acumulado do CDI (série 12 do SGS) para calcular rentabilidades.
+
+`build_cdi_index` transforma a série diária em um vetor de fatores por dia
+corrido (`CdiIndex`): o acumulado entre duas datas sai de duas consultas por
+posição, vetorizadas para colunas inteiras de contratos. `save_cdi_index`
+mantém a série com os fatores em analytics.dim_cdi_indice.
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from utils_db import log
+
+
+@dataclass(frozen=True)
+class CdiIndex:
+    """
+    Fator acumulado do CDI por dia corrido: fator[k] é o acumulado de todas
+    as taxas diárias anteriores ao dia `inicio + k`. O retorno entre duas
+    datas é fator[fim] / fator[início] - 1, com acesso direto por posição.
+    Datas fora do intervalo usam a ponta mais próxima do índice.
+    """
+    inicio: np.datetime64
+    fator: np.ndarray
+    serie: pd.DataFrame  # [data, cdi_aa, fator_diario, fator_acumulado] por observação
+
+    @property
+    def fim(self) -> np.datetime64:
+        return self.inicio + np.timedelta64(len(self.fator) - 1, "D")
+
+    def lookup(self, datas) -> np.ndarray:
+        d = pd.to_datetime(pd.Series(datas), errors="coerce").to_numpy().astype("datetime64[D]")
+        nat = np.isnat(d)
+        k = np.clip((d - self.inicio).astype(np.int64), 0, len(self.fator) - 1)
+        out = self.fator[k]
+        out[nat] = np.nan
+        return out
+
+    def accrued(self, inicio, ref=None) -> np.ndarray:
+        """Rentabilidade acumulada de `inicio` até `ref` (padrão: última data do índice)."""
+        fim = self.fator[-1] if ref is None else self.lookup(ref)
+        return fim / self.lookup(inicio) - 1
+
+
+def build_cdi_index(cdi: pd.DataFrame) -> CdiIndex:
+    """
+    Monta o CdiIndex a partir de [data, cdi_aa]. Apesar do nome da coluna, a
+    série 12 do SGS já é a taxa diária (% a.d.): cada observação rende
+    1 + taxa/100, sem conversão de base anual.
+    """
+    cdi = cdi.dropna(subset=["data", "cdi_aa"]).sort_values("data")
+    dias = cdi["data"].to_numpy().astype("datetime64[D]")
+    fator_diario = 1 + cdi["cdi_aa"].to_numpy(dtype=float) / 100.0
+    acumulado = np.cumprod(fator_diario)
+
+    # acum[j] = fator após j observações; cada dia corrido aponta para quantas
+    # observações o antecedem (até o dia seguinte à última)
+    acum = np.concatenate([[1.0], acumulado])
+    calendario = np.arange(dias[0], dias[-1] + np.timedelta64(2, "D"))
+    fator = acum[np.searchsorted(dias, calendario, side="left")]
+
+    serie = pd.DataFrame({
+        "data": cdi["data"].dt.date.to_numpy(),
+        "cdi_aa": cdi["cdi_aa"].to_numpy(dtype=float),
+        "fator_diario": fator_diario,
+        "fator_acumulado": acumulado,
+    })
+    return CdiIndex(inicio=dias[0], fator=fator, serie=serie)
+
+
+def save_cdi_index(con, idx: CdiIndex) -> None:
+    """Mantém analytics.dim_cdi_indice (uma linha por data do CDI) em dia."""
+    con.execute(text("""
+        CREATE TABLE IF NOT EXISTS analytics.dim_cdi_indice (
+          data             DATE PRIMARY KEY,
+          cdi_aa           NUMERIC(10,6),
+          fator_diario     DOUBLE PRECISION,
+          fator_acumulado  DOUBLE PRECISION
+        );
+    """))
+    con.execute(text("""
+        INSERT INTO analytics.dim_cdi_indice (data, cdi_aa, fator_diario, fator_acumulado)
+        VALUES (:data, :cdi_aa, :fator_diario, :fator_acumulado)
+        ON CONFLICT (data) DO UPDATE SET
+          cdi_aa = EXCLUDED.cdi_aa,
+          fator_diario = EXCLUDED.fator_diario,
+          fator_acumulado = EXCLUDED.fator_acumulado
+        WHERE analytics.dim_cdi_indice.fator_acumulado IS DISTINCT FROM EXCLUDED.fator_acumulado
+    """), idx.serie.to_dict(orient="records"))
+    log(f" - analytics.dim_cdi_indice atualizado até {idx.serie['data'].iloc[-1]}.")
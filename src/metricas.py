@@ -0,0 +1,187 @@
+"""
+Instrumentação do ETL: spans de tempo por etapa e exportação das métricas.
+
+Cada `span(nome, **labels)` mede duração, linhas de entrada/saída, linhas
+inseridas, atualizadas (row_hash mudou) e ignoradas pelo ON CONFLICT e o
+pico de memória Python do processo até o fim do span (via tracemalloc,
+quando ligado com enable(trace_memory=True)). O pico é do processo, não da
+etapa: etapas do pipeline rodam em paralelo e o tracemalloc tem um único
+pico global, então ele só é zerado no início da execução (reset). Spans marcados
+com agregar=True (ex.: um por bloco de carga) são somados num único
+registro por nome+labels, para não gerar milhares de linhas nem séries.
+
+Exporta em JSON (`export_json`) e no formato textfile do Prometheus
+(`export_prometheus`, para o textfile collector do node_exporter).
+"""
+from __future__ import annotations
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows: sem getrusage, o pico de RSS não é exportado
+    resource = None
+
+_lock = threading.Lock()
+_local = threading.local()
+_spans: list[dict] = []
+_agregados: dict[tuple, dict] = {}
+_trace_memory = False
+_inicio_run = time.time()
+
+CAMPOS = ("linhas_in", "linhas_out", "inseridas", "atualizadas", "ignoradas")
+
+
+def enable(trace_memory: bool = True) -> None:
+    """Liga o rastreio de memória (tracemalloc tem custo: use só quando exportar)."""
+    global _trace_memory
+    _trace_memory = trace_memory
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    if trace_memory:
+        tracemalloc.reset_peak()
+
+
+def reset() -> None:
+    global _inicio_run
+    with _lock:
+        _spans.clear()
+        _agregados.clear()
+    _inicio_run = time.time()
+    if _trace_memory:
+        tracemalloc.reset_peak()
+
+
+def _stack() -> list[dict]:
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+@contextmanager
+def span(nome: str, agregar: bool = False, **labels):
+    """
+    Mede o bloco. O dict devolvido aceita linhas_in/linhas_out/inseridas/
+    atualizadas/ignoradas preenchidos pelo chamador durante o bloco.
+    """
+    stack = _stack()
+    reg = {"etapa": nome, "labels": {k: str(v) for k, v in labels.items()},
+           **{c: 0 for c in CAMPOS}, "pico_mem_processo_bytes": 0}
+    stack.append(reg)
+    t0 = time.perf_counter()
+    status = "ok"
+    try:
+        yield reg
+    except BaseException:
+        status = "erro"
+        raise
+    finally:
+        reg["duracao_s"] = time.perf_counter() - t0
+        stack.pop()
+        if _trace_memory:
+            reg["pico_mem_processo_bytes"] = tracemalloc.get_traced_memory()[1]
+        reg["status"] = status
+        _record(reg, agregar)
+
+
+def _record(reg: dict, agregar: bool) -> None:
+    with _lock:
+        if not agregar:
+            reg["fim"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+            _spans.append(reg)
+            return
+        key = (reg["etapa"], tuple(sorted(reg["labels"].items())))
+        acc = _agregados.setdefault(key, {
+            "etapa": reg["etapa"], "labels": reg["labels"], "blocos": 0, "duracao_s": 0.0,
+            **{c: 0 for c in CAMPOS}, "pico_mem_processo_bytes": 0, "status": "ok",
+        })
+        acc["blocos"] += 1
+        acc["duracao_s"] += reg["duracao_s"]
+        for c in CAMPOS:
+            acc[c] += int(reg[c])
+        acc["pico_mem_processo_bytes"] = max(acc["pico_mem_processo_bytes"], reg["pico_mem_processo_bytes"])
+        if reg["status"] != "ok":
+            acc["status"] = reg["status"]
+
+
+def _rss_max_bytes():
+    """Pico de RSS do processo, ou None onde o módulo resource não existe."""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def snapshot() -> dict:
+    with _lock:
+        return {
+            "inicio": datetime.fromtimestamp(_inicio_run, timezone.utc).isoformat(timespec="seconds"),
+            "rss_max_bytes": _rss_max_bytes(),
+            "etapas": [dict(s) for s in _spans],
+            "blocos": [dict(a) for a in _agregados.values()],
+        }
+
+
+def _atomic_write(path: Path, content: str) -> None:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(content, encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def export_json(path: Path) -> None:
+    _atomic_write(path, json.dumps(snapshot(), indent=2, ensure_ascii=False))
+
+
+def _prom_escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _prom_labels(reg: dict) -> str:
+    labels = {"etapa": reg["etapa"], **reg["labels"]}
+    return "{" + ",".join(f'{k}="{_prom_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+PROM_METRICAS = [
+    ("etl_stage_duration_seconds", "duracao_s", "Duração da etapa do ETL em segundos."),
+    ("etl_stage_rows_in", "linhas_in", "Linhas recebidas pela etapa."),
+    ("etl_stage_rows_out", "linhas_out", "Linhas produzidas pela etapa."),
+    ("etl_stage_rows_inserted", "inseridas", "Linhas efetivamente gravadas no destino."),
+    ("etl_stage_rows_updated", "atualizadas", "Linhas existentes reescritas por mudança de conteúdo (row_hash)."),
+    ("etl_stage_rows_skipped", "ignoradas", "Linhas descartadas pelo ON CONFLICT (já existentes e iguais)."),
+    ("etl_stage_process_peak_memory_bytes", "pico_mem_processo_bytes",
+     "Pico de memória Python do processo inteiro (tracemalloc) até o fim da etapa."),
+]
+
+
+def export_prometheus(path: Path) -> None:
+    snap = snapshot()
+    regs = snap["etapas"] + snap["blocos"]
+    linhas = []
+    for nome, campo, ajuda in PROM_METRICAS:
+        linhas += [f"# HELP {nome} {ajuda}", f"# TYPE {nome} gauge"]
+        linhas += [f"{nome}{_prom_labels(r)} {float(r[campo])}" for r in regs]
+    linhas += [
+        "# HELP etl_stage_chunks Nº de blocos somados no registro.",
+        "# TYPE etl_stage_chunks gauge",
+        *[f"etl_stage_chunks{_prom_labels(r)} {r['blocos']}" for r in snap["blocos"]],
+        "# HELP etl_stage_failed 1 se a etapa terminou com erro.",
+        "# TYPE etl_stage_failed gauge",
+        *[f"etl_stage_failed{_prom_labels(r)} {int(r['status'] != 'ok')}" for r in regs],
+        "# HELP etl_last_run_timestamp_seconds Fim da última execução do ETL (epoch).",
+        "# TYPE etl_last_run_timestamp_seconds gauge",
+        f"etl_last_run_timestamp_seconds {time.time():.0f}",
+    ]
+    if snap["rss_max_bytes"] is not None:
+        linhas += [
+            "# HELP etl_process_max_rss_bytes Pico de RSS do processo do ETL.",
+            "# TYPE etl_process_max_rss_bytes gauge",
+            f"etl_process_max_rss_bytes {snap['rss_max_bytes']}",
+        ]
+    _atomic_write(path, "\n".join(linhas) + "\n")
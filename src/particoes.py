@@ -0,0 +1,246 @@
+"""
+Partições mensais e índices de apoio dos fatos em analytics.
+
+Os fatos de PARTITIONED são particionados por mês (RANGE na coluna de data);
+as partições que faltam são criadas na carga, bloco a bloco
+(`partition_ready`) ou a partir da staging (`prepare_staged_partitions`), e
+anexadas com ATTACH PARTITION. `ensure_partitioned` converte uma tabela
+heap antiga e `drop_partitions_before` descarta meses inteiros com DROP.
+Os nomes das partições existentes ficam em cache por processo
+(`forget_partitions` o limpa quando o esquema é recriado).
+"""
+from __future__ import annotations
+from typing import Optional
+import pandas as pd
+from sqlalchemy import text
+
+from utils_db import log
+
+
+# Fatos particionados por mês (RANGE na coluna de data). fact_contrato fica
+# fora: é alvo das FKs de prêmios/resgates e do ON CONFLICT (id), e o
+# Postgres não garante unicidade de id entre partições sem a data na chave.
+# Nos particionados o id continua único pela carga: delete_moved remove a
+# versão antiga de um id cuja data mudou antes de gravar a nova.
+PARTITIONED = {
+    "fact_premio": "data_premio",
+    "fact_resgate": "data_resgate",
+}
+
+# índices de apoio (tabela, coluna, método); nos particionados valem para
+# todas as partições, inclusive as criadas depois
+FACT_INDEXES = [
+    ("fact_contrato", "cliente_id", "btree"),
+    ("fact_contrato", "data_inicio", "btree"),
+    ("fact_premio", "id", "btree"),
+    ("fact_premio", "contrato_id", "btree"),
+    ("fact_premio", "data_premio", "brin"),
+    ("fact_resgate", "id", "btree"),
+    ("fact_resgate", "contrato_id", "btree"),
+    ("fact_resgate", "data_resgate", "brin"),
+]
+
+_partitions_cache: dict[str, set] = {}
+
+
+def forget_partitions() -> None:
+    """Esquece as partições em cache (o esquema foi recriado)."""
+    _partitions_cache.clear()
+
+
+def conflict_key(table: str) -> tuple[str, ...]:
+    """Chave do ON CONFLICT: a PK das tabelas particionadas inclui a data."""
+    return ("id", PARTITIONED[table]) if table in PARTITIONED else ("id",)
+
+
+def delete_moved(con, schema: str, table: str, origem: str, params: Optional[dict] = None) -> int:
+    """
+    Com a data na PK, um id cuja data foi corrigida na fonte entraria como
+    segunda linha. Remove a versão gravada de cada id de `origem` (item de
+    FROM com alias s, com id e a coluna de partição) cuja data mudou; a
+    carga em seguida grava a corrigida. O mês antigo vai para
+    analytics.etl_alteracao (agregados). Retorna o nº de linhas removidas.
+    """
+    col = PARTITIONED.get(table)
+    if col is None:
+        return 0
+    return con.execute(text(f"""
+        WITH d AS (
+          DELETE FROM {schema}.{table} t
+          USING {origem}
+          WHERE t.id = s.id AND t.{col} <> s.{col}
+          RETURNING t.id, t.{col}
+        )
+        INSERT INTO analytics.etl_alteracao (tabela, id, mes)
+        SELECT :tabela, id, CAST(date_trunc('month', {col}) AS date) FROM d
+    """), {**(params or {}), "tabela": table}).rowcount
+
+
+def _partition_name(table: str, mes) -> str:
+    return f"{table}_p{mes:%Y_%m}"
+
+
+def _existing_partitions(con, table: str) -> set:
+    """Meses (1º dia) que já têm partição, pelo nome padronizado das filhas."""
+    if table not in _partitions_cache:
+        rows = con.execute(text("""
+            SELECT ch.relname
+            FROM pg_inherits i
+            JOIN pg_class ch    ON ch.oid = i.inhrelid
+            JOIN pg_class pa    ON pa.oid = i.inhparent
+            JOIN pg_namespace n ON n.oid = pa.relnamespace
+            WHERE n.nspname = 'analytics' AND pa.relname = :tab
+        """), {"tab": table}).scalars()
+        prefix = f"{table}_p"
+        _partitions_cache[table] = {
+            pd.Timestamp(f"{r[len(prefix):len(prefix) + 4]}-{r[-2:]}-01").date()
+            for r in rows if r.startswith(prefix)
+        }
+    return _partitions_cache[table]
+
+
+def ensure_partitions(con, table: str, meses) -> int:
+    """
+    Cria as partições mensais que faltam para `meses`. A filha é criada solta
+    e anexada com ATTACH PARTITION (SHARE UPDATE EXCLUSIVE no pai, não
+    bloqueia leitores). Retorna o nº de partições criadas.
+    """
+    existing = _existing_partitions(con, table)
+    novos = sorted(set(meses) - existing)
+    for mes in novos:
+        name = _partition_name(table, mes)
+        fim = (pd.Timestamp(mes) + pd.offsets.MonthBegin(1)).date()
+        con.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS analytics.{name}
+              (LIKE analytics.{table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS);
+            ALTER TABLE analytics.{table} ATTACH PARTITION analytics.{name}
+              FOR VALUES FROM ('{mes:%Y-%m-%d}') TO ('{fim:%Y-%m-%d}');
+        """))
+        existing.add(mes)
+    if novos:
+        faixa = " … ".join(dict.fromkeys(_partition_name(table, m) for m in (novos[0], novos[-1])))
+        log(f"   · analytics.{table}: {len(novos)} partição(ões) criada(s) ({faixa})")
+    return len(novos)
+
+
+def partition_ready(con, table: str, df: pd.DataFrame) -> pd.DataFrame:
+    """Descarta linhas sem data (não têm partição) e cria as partições do bloco."""
+    col = PARTITIONED.get(table)
+    if col is None or col not in df.columns:
+        return df
+    nulos = df[col].isna()
+    if nulos.any():
+        log(f" ! Aviso: {int(nulos.sum())} linha(s) de {table} sem {col} ignoradas (chave de partição).")
+        df = df.loc[~nulos]
+    ensure_partitions(con, table, touched_months(df[col]) - {None})
+    return df
+
+
+def _relkind(con, table: str) -> Optional[str]:
+    return con.execute(text("""
+        SELECT c.relkind FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'analytics' AND c.relname = :tab
+    """), {"tab": table}).scalar()
+
+
+def ensure_partitioned(con, table: str, col: str) -> None:
+    """
+    Converte analytics.<table> (heap) em tabela particionada por mês em `col`,
+    preservando colunas, defaults e FKs. Linhas sem data vão para
+    analytics.<table>_sem_data. Não faz nada se já for particionada.
+    """
+    if _relkind(con, table) != "r":
+        return
+    heap = f"{table}__heap"
+    constraints = con.execute(text("""
+        SELECT conname, contype, pg_get_constraintdef(oid)
+        FROM pg_constraint
+        WHERE conrelid = CAST(:rel AS regclass) AND contype IN ('p', 'f')
+    """), {"rel": f"analytics.{table}"}).fetchall()
+
+    con.execute(text(f"ALTER TABLE analytics.{table} RENAME TO {heap}"))
+    for conname, contype, _ in constraints:
+        if contype == "p":
+            con.execute(text(f"ALTER TABLE analytics.{heap} RENAME CONSTRAINT {conname} TO {heap}_pkey"))
+    con.execute(text(f"""
+        CREATE TABLE analytics.{table} (LIKE analytics.{heap} INCLUDING DEFAULTS)
+          PARTITION BY RANGE ({col});
+        ALTER TABLE analytics.{table} ADD CONSTRAINT {table}_pkey PRIMARY KEY (id, {col});
+    """))
+    for conname, contype, condef in constraints:
+        if contype == "f":
+            con.execute(text(f"ALTER TABLE analytics.{table} ADD CONSTRAINT {conname} {condef}"))
+
+    _partitions_cache.pop(table, None)
+    meses = con.execute(text(f"""
+        SELECT DISTINCT CAST(date_trunc('month', {col}) AS date)
+        FROM analytics.{heap} WHERE {col} IS NOT NULL
+    """)).scalars().all()
+    ensure_partitions(con, table, meses)
+    moved = con.execute(text(f"""
+        INSERT INTO analytics.{table} SELECT * FROM analytics.{heap} WHERE {col} IS NOT NULL
+    """)).rowcount
+    sem_data = con.execute(text(f"""
+        SELECT COUNT(*) FROM analytics.{heap} WHERE {col} IS NULL
+    """)).scalar()
+    if sem_data:
+        con.execute(text(f"""
+            CREATE TABLE analytics.{table}_sem_data AS
+            SELECT * FROM analytics.{heap} WHERE {col} IS NULL
+        """))
+        log(f" ! Aviso: {sem_data} linha(s) de {table} sem {col} movidas para analytics.{table}_sem_data.")
+    con.execute(text(f"DROP TABLE analytics.{heap}"))
+    log(f" - analytics.{table} particionada por mês em {col} ({moved} linhas migradas).")
+
+
+def ensure_fact_indexes(con) -> None:
+    for table, col, method in FACT_INDEXES:
+        suffix = "brin" if method == "brin" else "ix"
+        con.execute(text(f"""
+            CREATE INDEX IF NOT EXISTS {table}_{col}_{suffix}
+              ON analytics.{table} USING {method} ({col})
+        """))
+
+
+def drop_partitions_before(con, limite) -> list[str]:
+    """Remove as partições mensais anteriores a `limite` (DROP, sem DELETE)."""
+    limite = pd.Timestamp(limite).date()
+    removidas = []
+    for table in PARTITIONED:
+        existing = _existing_partitions(con, table)
+        for mes in sorted(m for m in existing if m < limite):
+            name = _partition_name(table, mes)
+            con.execute(text(f"DROP TABLE IF EXISTS analytics.{name}"))
+            existing.discard(mes)
+            removidas.append(name)
+    log(f" - {len(removidas)} partição(ões) anteriores a {limite:%Y-%m} removidas.")
+    return removidas
+
+
+def touched_months(values) -> set:
+    """Meses (1º dia) presentes em `values`; None se houver datas nulas."""
+    d = pd.to_datetime(pd.Series(values), errors="coerce")
+    meses = set(d.dropna().dt.to_period("M").dt.to_timestamp().dt.date.unique())
+    if d.isna().any():
+        meses.add(None)
+    return meses
+
+
+def prepare_staged_partitions(con, table: str, staging: str) -> str:
+    """Cria as partições dos meses presentes na staging; devolve o filtro do merge."""
+    col = PARTITIONED.get(table)
+    if col is None:
+        return "TRUE"
+    meses, nulos = set(), 0
+    for mes, n in con.execute(text(f"""
+        SELECT CAST(date_trunc('month', {col}) AS date), COUNT(*) FROM {staging} GROUP BY 1
+    """)).fetchall():
+        if mes is None:
+            nulos = n
+        else:
+            meses.add(mes)
+    if nulos:
+        log(f" ! Aviso: {nulos} linha(s) de {table} sem {col} ignoradas (chave de partição).")
+    ensure_partitions(con, table, meses)
+    return f"{col} IS NOT NULL"
@@ -0,0 +1,183 @@
+"""
+Agendador de etapas do ETL em forma de DAG.
+
+Cada `Etapa` declara as entradas que consome e as saídas que produz (valores
+no contexto compartilhado, ex.: o DataFrame lido de uma fonte) e, em `apos`,
+etapas que precisam terminar antes dela só por ordem (ex.: a carga de
+prêmios depois da de contratos, por causa da FK). `run` inicia cada etapa
+assim que as dependências terminam, numa pool de threads: a espera de rede
+do BCB sobrepõe o parse dos CSVs, e o parse sobrepõe a carga da dimensão.
+O trabalho pesado de CPU fica em processos dentro da própria etapa (ex.:
+o parse de fontes em shards).
+
+Etapas com banco=True usam a conexão/transação principal e rodam uma de
+cada vez (uma Connection do SQLAlchemy não é thread-safe).
+
+Seleção (--only/--from): `select` devolve as etapas pedidas mais as que
+produzem entradas delas — valores em memória precisam ser recalculados.
+Dependências de `apos` fora da seleção valem como já satisfeitas pelo
+estado atual do banco.
+"""
+from __future__ import annotations
+import fnmatch
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, Iterable, Optional
+
+
+@dataclass(frozen=True)
+class Etapa:
+    nome: str
+    fn: Callable[[dict], Optional[dict]]   # recebe o contexto; devolve {saída: valor}
+    entradas: tuple[str, ...] = ()         # valores exigidos: o produtor entra na seleção
+    saidas: tuple[str, ...] = ()
+    apos: tuple[str, ...] = ()             # etapas que, se selecionadas, rodam antes
+    banco: bool = False                    # usa a conexão principal (uma etapa por vez)
+
+
+def _produtores(etapas: Iterable[Etapa]) -> dict[str, str]:
+    prod: dict[str, str] = {}
+    for e in etapas:
+        for s in e.saidas:
+            if s in prod:
+                raise ValueError(f"Saída {s!r} produzida por {prod[s]} e por {e.nome}.")
+            prod[s] = e.nome
+    return prod
+
+
+def dependencies(etapas: list[Etapa]) -> dict[str, set[str]]:
+    """{etapa: etapas de que depende}, só entre as etapas dadas."""
+    nomes = {e.nome for e in etapas}
+    prod = _produtores(etapas)
+    deps = {}
+    for e in etapas:
+        faltando = [x for x in e.entradas if x not in prod]
+        if faltando:
+            raise ValueError(f"{e.nome}: entrada(s) sem etapa produtora: {faltando}")
+        deps[e.nome] = {prod[x] for x in e.entradas} | (set(e.apos) & nomes)
+    return deps
+
+
+def levels(etapas: list[Etapa]) -> list[list[str]]:
+    """Níveis topológicos do DAG (Kahn); erro se houver ciclo."""
+    pending = dependencies(etapas)
+    out = []
+    while pending:
+        ready = [n for n, d in pending.items() if not d & pending.keys()]
+        if not ready:
+            raise ValueError(f"Ciclo entre as etapas {sorted(pending)}")
+        out.append(ready)
+        for n in ready:
+            del pending[n]
+    return out
+
+
+def _match(nome: str, padroes) -> bool:
+    return any(fnmatch.fnmatchcase(nome, p) for p in padroes)
+
+
+def select(etapas: list[Etapa], only=None, desde: Optional[str] = None,
+           fixas=()) -> list[Etapa]:
+    """
+    Etapas a rodar, na ordem declarada. `only`: padrões fnmatch (ex.:
+    "leitura_*"); `desde`: padrão de etapa — ela e tudo que depende dela.
+    Sem os dois, todas. `fixas` e os produtores das entradas das escolhidas
+    entram sempre.
+    """
+    deps = dependencies(etapas)
+    nomes = [e.nome for e in etapas]
+    escolhidas = set(nomes)
+    if only:
+        escolhidas = {n for n in nomes if _match(n, only)}
+        if not escolhidas:
+            raise ValueError(f"--only não corresponde a nenhuma etapa: {', '.join(only)}")
+    if desde:
+        alcance = {n for n in nomes if _match(n, [desde])}
+        if not alcance:
+            raise ValueError(f"--from não corresponde a nenhuma etapa: {desde}")
+        mudou = True
+        while mudou:
+            novos = {n for n, d in deps.items() if d & alcance} - alcance
+            alcance |= novos
+            mudou = bool(novos)
+        escolhidas &= alcance
+    escolhidas |= set(fixas) & set(nomes)
+
+    por_nome = {e.nome: e for e in etapas}
+    prod = _produtores(etapas)
+    pilha = list(escolhidas)
+    while pilha:
+        for x in por_nome[pilha.pop()].entradas:
+            if prod[x] not in escolhidas:
+                escolhidas.add(prod[x])
+                pilha.append(prod[x])
+    return [e for e in etapas if e.nome in escolhidas]
+
+
+def describe(etapas: list[Etapa]) -> list[str]:
+    """Uma linha por etapa, por nível do DAG (para --list-stages)."""
+    deps = dependencies(etapas)
+    por_nome = {e.nome: e for e in etapas}
+    linhas = []
+    for i, nivel in enumerate(levels(etapas)):
+        for n in nivel:
+            e = por_nome[n]
+            extra = " [banco]" if e.banco else ""
+            depois = f" <- {', '.join(sorted(deps[n]))}" if deps[n] else ""
+            linhas.append(f"{i:>2}  {n}{extra}{depois}")
+    return linhas
+
+
+def run(etapas: list[Etapa], ctx: dict, log=print, max_workers: Optional[int] = None) -> dict:
+    """
+    Roda as etapas respeitando o DAG e grava as saídas em `ctx`. Após uma
+    falha nenhuma etapa nova começa; as que já rodam terminam e a primeira
+    exceção é relançada.
+    """
+    levels(etapas)  # valida (entradas com produtor, sem ciclos)
+    deps = dependencies(etapas)
+    pendentes = list(etapas)
+    feitas: set[str] = set()
+    rodando: dict = {}
+    banco_ocupado = False
+    erro: Optional[BaseException] = None
+
+    def executa(e: Etapa) -> tuple[dict, float]:
+        t0 = time.perf_counter()
+        saidas = e.fn(ctx) or {}
+        faltando = set(e.saidas) - saidas.keys()
+        if faltando:
+            raise RuntimeError(f"Etapa {e.nome} não produziu {sorted(faltando)}")
+        return saidas, time.perf_counter() - t0
+
+    with ThreadPoolExecutor(max_workers=max_workers or max(1, len(etapas))) as ex:
+        while pendentes or rodando:
+            if erro is None:
+                for e in list(pendentes):
+                    if deps[e.nome] <= feitas and not (e.banco and banco_ocupado):
+                        pendentes.remove(e)
+                        banco_ocupado = banco_ocupado or e.banco
+                        log(f"   > {e.nome}")
+                        rodando[ex.submit(executa, e)] = e
+            else:
+                pendentes.clear()
+            if not rodando:
+                break
+            prontas, _ = wait(rodando, return_when=FIRST_COMPLETED)
+            for f in prontas:
+                e = rodando.pop(f)
+                if e.banco:
+                    banco_ocupado = False
+                try:
+                    saidas, dt = f.result()
+                except BaseException as exc:
+                    log(f" ! Etapa {e.nome} falhou: {exc}")
+                    erro = erro or exc
+                    continue
+                ctx.update(saidas)
+                feitas.add(e.nome)
+                log(f"   < {e.nome} ({dt:.2f}s)")
+    if erro is not None:
+        raise erro
+    return ctx
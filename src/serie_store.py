@@ -0,0 +1,117 @@
+"""
+Armazenamento local das séries SGS do Banco Central em data/staging/sgs.
+
+Cada série fica num arquivo binário compacto (<id>.npz) com as datas em dias
+desde 1970 (int32, ordenadas), os valores (float64) e o instante da última
+consulta ao BCB. Novos pontos só são anexados após a última data, recortes
+por período usam busca binária e `is_fresh` aplica o TTL de cada série para
+decidir se vale ir à rede.
+"""
+from __future__ import annotations
+import os
+import time
+from datetime import timedelta
+from pathlib import Path
+from typing import Optional
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+STORE_DIR = ROOT / "data" / "staging" / "sgs"
+
+# TTL por série: CDI (12) é diário, IPCA (433) é mensal
+TTL = {
+    12: timedelta(hours=12),
+    433: timedelta(days=7),
+}
+DEFAULT_TTL = timedelta(days=1)
+
+_memo: dict[int, tuple[float, np.ndarray, np.ndarray, float]] = {}
+
+
+def _path(series_id: int) -> Path:
+    return STORE_DIR / f"{series_id}.npz"
+
+
+def _read(series_id: int) -> tuple[np.ndarray, np.ndarray, float]:
+    """(dias, valores, consultado_em) com memo por mtime do arquivo."""
+    path = _path(series_id)
+    if not path.exists():
+        return np.empty(0, dtype=np.int32), np.empty(0), 0.0
+    mtime = path.stat().st_mtime
+    hit = _memo.get(series_id)
+    if hit and hit[0] == mtime:
+        return hit[1], hit[2], hit[3]
+    with np.load(path) as z:
+        dias, valores, consultado = z["dias"], z["valores"], float(z["consultado_em"])
+    _memo[series_id] = (mtime, dias, valores, consultado)
+    return dias, valores, consultado
+
+
+def _write(series_id: int, dias: np.ndarray, valores: np.ndarray, consultado: float) -> None:
+    STORE_DIR.mkdir(parents=True, exist_ok=True)
+    path = _path(series_id)
+    tmp = path.with_suffix(".tmp")
+    with tmp.open("wb") as f:
+        np.savez(f, dias=dias, valores=valores, consultado_em=np.float64(consultado))
+    os.replace(tmp, path)
+    _memo[series_id] = (path.stat().st_mtime, dias, valores, consultado)
+
+
+def _to_days(values) -> np.ndarray:
+    return pd.to_datetime(values).values.astype("datetime64[D]").astype(np.int32)
+
+
+def _frame(dias: np.ndarray, valores: np.ndarray) -> pd.DataFrame:
+    return pd.DataFrame({
+        "data": pd.to_datetime(dias.astype("datetime64[D]")),
+        "valor": valores,
+    })
+
+
+def read_series(series_id: int, inicio=None, fim=None) -> pd.DataFrame:
+    """Série [data, valor], opcionalmente recortada em [inicio, fim] (inclusive)."""
+    dias, valores, _ = _read(series_id)
+    lo = 0 if inicio is None else np.searchsorted(dias, _to_days([inicio])[0], side="left")
+    hi = len(dias) if fim is None else np.searchsorted(dias, _to_days([fim])[0], side="right")
+    return _frame(dias[lo:hi], valores[lo:hi])
+
+
+def last_date(series_id: int) -> Optional[pd.Timestamp]:
+    dias, _, _ = _read(series_id)
+    return pd.Timestamp(dias[-1].astype("datetime64[D]")) if len(dias) else None
+
+
+def append_series(series_id: int, df: pd.DataFrame, fetched: bool = True) -> int:
+    """
+    Anexa os pontos de `df` ([data, valor]) posteriores à última data
+    armazenada. fetched=True registra a consulta (reinicia o TTL).
+    Retorna o nº de pontos novos.
+    """
+    dias, valores, consultado = _read(series_id)
+    novos = 0
+    if df is not None and not df.empty:
+        df = df.dropna(subset=["data", "valor"])
+        d = _to_days(df["data"])
+        v = df["valor"].to_numpy(dtype=float)
+        mask = d > dias[-1] if len(dias) else np.ones(len(d), dtype=bool)
+        d, v = d[mask], v[mask]
+        if len(d):
+            order = np.argsort(d, kind="stable")
+            d, v = d[order], v[order]
+            keep = np.r_[d[1:] != d[:-1], True]  # última ocorrência de cada data
+            d, v = d[keep], v[keep]
+            dias, valores = np.concatenate([dias, d]), np.concatenate([valores, v])
+            novos = len(d)
+    if novos or fetched:
+        _write(series_id, dias, valores, time.time() if fetched else consultado)
+    return novos
+
+
+def is_fresh(series_id: int, ttl: Optional[timedelta] = None) -> bool:
+    """True se a série foi consultada no BCB há menos que o TTL dela."""
+    dias, _, consultado = _read(series_id)
+    if not len(dias):
+        return False
+    ttl = ttl or TTL.get(series_id, DEFAULT_TTL)
+    return time.time() - consultado < ttl.total_seconds()
@@ -0,0 +1,172 @@
+"""
+Cache colunar (Parquet) dos CSVs brutos em data/staging.
+
+Cada CSV é convertido uma única vez em Parquet tipado (datas já como
+datetime64, strings sem espaços nas pontas) e comprimido. O arquivo em cache
+é identificado pelo SHA-256 do CSV de origem: se o bruto mudar, o cache
+antigo é ignorado e substituído. Sem pyarrow instalado, tudo cai de volta
+para a leitura direta do CSV.
+
+Com `parser` (ver esquema_fontes.ParserFonte) o CSV é lido como texto e o
+parser tipa/valida cada bloco; o Parquet guarda o resultado já tipado, com
+`parser.tag` no nome para separar versões do esquema.
+"""
+from __future__ import annotations
+import hashlib
+import os
+import re
+from pathlib import Path
+from typing import Iterator, Optional
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow é opcional
+    pa = pq = None
+
+ROOT = Path(__file__).resolve().parents[1]
+CACHE_DIR = ROOT / "data" / "staging"
+HASH_BLOCK = 1 << 20
+
+
+def available() -> bool:
+    return pq is not None
+
+
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with Path(path).open("rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _cache_stem(src: Path) -> str:
+    """
+    Chave do CSV no cache: diretório + nome, sem pontos. Shards de fontes
+    diferentes podem ter o mesmo nome (contratos/2024-05-01.csv.gz e
+    premios/2024-05-01.csv.gz) e não podem se sobrescrever.
+    """
+    src = Path(src)
+    return re.sub(r"[^0-9A-Za-z_-]", "_", f"{src.parent.name}-{src.name}")
+
+
+def cache_path(src: Path, sha: str, tag: str = "") -> Path:
+    return CACHE_DIR / f"{_cache_stem(src)}.{sha[:16]}{'.' + tag if tag else ''}.parquet"
+
+
+def _typed(df: pd.DataFrame, date_cols) -> pd.DataFrame:
+    for c in df.columns:
+        if df[c].dtype == "object":
+            df[c] = df[c].str.strip()
+    for c in date_cols:
+        if c in df.columns:
+            df[c] = pd.to_datetime(df[c], errors="coerce")
+    return df
+
+
+def _from_arrow(df: pd.DataFrame) -> pd.DataFrame:
+    """Nulos de texto voltam do Parquet como None; padroniza para NaN como no read_csv."""
+    obj = [c for c in df.columns if df[c].dtype == "object"]
+    if obj:
+        df[obj] = df[obj].where(df[obj].notna(), float("nan"))
+    return df
+
+
+def _publish(tmp: Path, dest: Path, src: Path, tag: str = "") -> None:
+    """Troca atômica do cache novo e remoção das versões antigas do mesmo CSV/tag."""
+    os.replace(tmp, dest)
+    for old in CACHE_DIR.glob(f"{_cache_stem(src)}.*.parquet"):
+        partes = old.name.split(".")
+        if old != dest and partes[2:-1] == ([tag] if tag else []):
+            old.unlink(missing_ok=True)
+
+
+def _read_csv(src: Path, parser=None, **kwargs):
+    if parser is not None:
+        kwargs.update(parser.read_kwargs)
+    return pd.read_csv(src, **kwargs)
+
+
+def _prepare(df: pd.DataFrame, date_cols, parser=None) -> pd.DataFrame:
+    return parser.parse(df) if parser is not None else _typed(df, date_cols)
+
+
+def _restore(df: pd.DataFrame, parser=None) -> pd.DataFrame:
+    df = _from_arrow(df)
+    return parser.restore(df) if parser is not None else df
+
+
+def read_staged(src: Path, date_cols=(), sha: Optional[str] = None, parser=None) -> pd.DataFrame:
+    """Lê o CSV inteiro via cache (memory-map do Parquet se o hash bater)."""
+    src = Path(src)
+    if not available():
+        return _prepare(_read_csv(src, parser), date_cols, parser)
+
+    tag = parser.tag if parser is not None else ""
+    dest = cache_path(src, sha or file_sha256(src), tag)
+    if dest.exists():
+        return _restore(pd.read_parquet(dest, memory_map=True), parser)
+
+    df = _prepare(_read_csv(src, parser), date_cols, parser)
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = dest.with_suffix(".tmp")
+    df.to_parquet(tmp, index=False, compression="zstd")
+    _publish(tmp, dest, src, tag)
+    return df
+
+
+def iter_staged(src: Path, chunk_rows: int, date_cols=(),
+                sha: Optional[str] = None, parser=None) -> Iterator[pd.DataFrame]:
+    """
+    Versão em blocos de read_staged. Com cache válido lê os row groups do
+    Parquet; senão lê o CSV em blocos e grava o Parquet no caminho. Se os
+    tipos mudarem entre blocos (ex.: inteiro que ganha NaN), desiste do cache
+    e segue só com o CSV.
+    """
+    src = Path(src)
+    if not available():
+        with _read_csv(src, parser, chunksize=chunk_rows) as reader:
+            for chunk in reader:
+                yield _prepare(chunk, date_cols, parser)
+        return
+
+    tag = parser.tag if parser is not None else ""
+    dest = cache_path(src, sha or file_sha256(src), tag)
+    if dest.exists():
+        pf = pq.ParquetFile(dest, memory_map=True)
+        for batch in pf.iter_batches(batch_size=chunk_rows):
+            yield _restore(batch.to_pandas(), parser)
+        return
+
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = dest.with_suffix(".tmp")
+    writer = None
+    complete = False
+    try:
+        with _read_csv(src, parser, chunksize=chunk_rows) as reader:
+            for chunk in reader:
+                chunk = _prepare(chunk, date_cols, parser)
+                if writer is not False:
+                    try:
+                        table = pa.Table.from_pandas(chunk, preserve_index=False)
+                        if writer is None:
+                            writer = pq.ParquetWriter(tmp, table.schema, compression="zstd")
+                        else:
+                            table = table.cast(writer.schema)
+                        writer.write_table(table)
+                    except (pa.ArrowInvalid, pa.ArrowTypeError, ValueError):
+                        if writer is not None:
+                            writer.close()
+                        tmp.unlink(missing_ok=True)
+                        writer = False
+                yield chunk
+        complete = True
+    finally:
+        if writer:
+            writer.close()
+            if complete:
+                _publish(tmp, dest, src, tag)
+            else:
+                tmp.unlink(missing_ok=True)
@@ -1,6 +1,34 @@
+import io
 import os
+import pandas as pd
 from sqlalchemy import create_engine
+
+COPY_SLICE = 100_000
+INT_TYPES = {"smallint", "integer", "bigint"}
+
 def get_engine():
     host=os.getenv("PG_HOST","localhost"); port=os.getenv("PG_PORT","5432")
     db=os.getenv("PG_DB","brasilcap"); user=os.getenv("PG_USER","postgres"); pwd=os.getenv("PG_PASSWORD","postgres")
-    return create_engine(f"postgresql+psycopg2://{user}:{pwd}@{host}:{port}/{db}", pool_pre_ping=True)
\ No newline at end of file
+    return create_engine(f"postgresql+psycopg2://{user}:{pwd}@{host}:{port}/{db}", pool_pre_ping=True)
+
+def log(msg: str) -> None:
+    print(msg, flush=True)
+
+def copy_frame(cur, df: pd.DataFrame, dest: str, cols: list, types: dict) -> None:
+    """
+    Envia as colunas `cols` do DataFrame para `dest` com COPY ... FROM STDIN
+    (CSV) no cursor psycopg2 `cur`, em fatias de COPY_SLICE linhas — o buffer
+    em memória fica limitado ao tamanho da fatia. `types` ({coluna:
+    data_type} do destino) corrige inteiros que o pandas guardou como float.
+    """
+    sql = f"COPY {dest} ({', '.join(cols)}) FROM STDIN WITH (FORMAT csv, NULL '')"
+    for i in range(0, len(df), COPY_SLICE):
+        part = df.iloc[i:i + COPY_SLICE][cols].copy()
+        # inteiros com NaN viram float no pandas ("123.0" não é BIGINT válido)
+        for c in cols:
+            if types.get(c) in INT_TYPES and pd.api.types.is_float_dtype(part[c]):
+                part[c] = part[c].round().astype("Int64")
+        buf = io.StringIO()
+        part.to_csv(buf, index=False, header=False, date_format="%Y-%m-%d")
+        buf.seek(0)
+        cur.copy_expert(sql, buf)
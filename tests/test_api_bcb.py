@@ -0,0 +1,133 @@
+"""
+Cliente SGS (api_bcb) contra um servidor HTTP local que serve JSON fixo.
+
+BCB_SGS_URL aponta para o servidor antes do import do módulo; cada teste
+define, por série, a sequência de respostas (status, corpo) que o servidor
+devolve e confere as requisições recebidas.
+"""
+import importlib
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+import pytest
+import requests
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+
+class _SGS(BaseHTTPRequestHandler):
+    respostas: dict[int, list[tuple[int, object]]] = {}
+    recebidas: list[tuple[int, dict]] = []
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        sid = int(url.path.strip("/").split("/")[1])
+        self.recebidas.append((sid, {k: v[0] for k, v in parse_qs(url.query).items()}))
+        fila = self.respostas.get(sid) or [(404, {"erro": "série não encontrada"})]
+        status, corpo = fila.pop(0) if len(fila) > 1 else fila[0]
+        dados = json.dumps(corpo).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def servidor():
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _SGS)
+    t = threading.Thread(target=srv.serve_forever, daemon=True)
+    t.start()
+    yield f"http://127.0.0.1:{srv.server_address[1]}/sgs/{{sid}}/dados"
+    srv.shutdown()
+    srv.server_close()
+
+
+@pytest.fixture
+def bcb(servidor, monkeypatch):
+    monkeypatch.setenv("BCB_SGS_URL", servidor)
+    import api_bcb
+    api_bcb = importlib.reload(api_bcb)
+    monkeypatch.setattr(api_bcb, "BACKOFF", 0)
+    api_bcb._session = None
+    _SGS.respostas, _SGS.recebidas = {}, []
+    yield api_bcb
+    api_bcb._session = None
+
+
+def _pontos(*pares):
+    return [{"data": d, "valor": v} for d, v in pares]
+
+
+def test_base_vem_de_bcb_sgs_url(bcb, servidor):
+    assert bcb.BASE == servidor == os.environ["BCB_SGS_URL"]
+
+
+def test_retenta_em_5xx(bcb):
+    _SGS.respostas[12] = [(503, {}), (502, {}), (200, _pontos(("02/01/2024", "0.043739")))]
+    df = bcb._get_series(12, strict=True)
+    assert len(_SGS.recebidas) == 3
+    assert df["valor"].tolist() == [0.043739]
+    assert df["data"].tolist() == [pd.Timestamp("2024-01-02")]
+
+
+def test_5xx_persistente(bcb):
+    _SGS.respostas[12] = [(500, {})]
+    with pytest.raises(requests.HTTPError):
+        bcb._get_series(12, strict=True)
+    assert len(_SGS.recebidas) == bcb.MAX_RETRIES + 1
+
+    _SGS.recebidas.clear()
+    assert bcb._get_series(12).empty  # sem strict: vazio, sem exceção
+    assert bcb.get_many({12: None}, strict=True) == {}
+
+
+def test_404_e_sem_dados(bcb):
+    _SGS.respostas[433] = [(404, {"erro": "sem dados"})]
+    assert bcb._get_series(433, strict=True).empty
+    assert len(_SGS.recebidas) == 1  # 404 não é retentado
+    assert bcb._get_series(433).empty
+
+
+def test_incremental_envia_data_inicial_e_junta_com_cache(bcb):
+    cache = pd.DataFrame({
+        "data": pd.to_datetime(["2024-01-02", "2024-01-03"]),
+        "valor": [0.043739, 0.043739],
+    })
+    _SGS.respostas[12] = [(200, _pontos(("04/01/2024", "0.043739"), ("05/01/2024", "0.041957")))]
+
+    df = bcb.get_series_incremental(12, cache, strict=True)
+
+    (sid, params), = _SGS.recebidas
+    assert sid == 12
+    assert params["dataInicial"] == "04/01/2024"
+    assert params["formato"] == "json"
+    assert "dataFinal" in params
+    assert df["data"].dt.strftime("%Y-%m-%d").tolist() == [
+        "2024-01-02", "2024-01-03", "2024-01-04", "2024-01-05"]
+    assert df["valor"].iloc[-1] == 0.041957
+
+
+def test_incremental_sem_cache_baixa_tudo(bcb):
+    _SGS.respostas[433] = [(200, _pontos(("01/01/2024", "0.42"), ("01/02/2024", "0.83")))]
+    df = bcb.get_series_incremental(433, None)
+    (_, params), = _SGS.recebidas
+    assert "dataInicial" not in params
+    assert len(df) == 2
+
+
+def test_get_many_em_paralelo(bcb):
+    _SGS.respostas[12] = [(200, _pontos(("02/01/2024", "0.043739")))]
+    _SGS.respostas[433] = [(200, _pontos(("01/01/2024", "0.42")))]
+    res = bcb.get_many({12: None, 433: None}, strict=True)
+    assert sorted(res) == [12, 433]
+    assert sorted(sid for sid, _ in _SGS.recebidas) == [12, 433]
@@ -0,0 +1,130 @@
+"""
+Parser guiado pelo esquema (esquema_fontes.parse): códigos de motivo das
+linhas reprovadas, dtypes das válidas e a quarentena por arquivo e SHA.
+
+Os blocos são montados como o staging_cache os lê: tudo texto, "" é nulo.
+"""
+import sys
+from decimal import Decimal
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import esquema_fontes
+from esquema_fontes import parse
+
+
+def _bloco(**colunas):
+    return pd.DataFrame(colunas, dtype=str)
+
+
+def _motivos(rejeitadas):
+    return dict(zip(rejeitadas["id"], rejeitadas["motivo"]))
+
+
+def test_contratos_validos_ganham_dtypes_compactos():
+    df, rejeitadas = parse("fact_contrato", _bloco(
+        id=["1", "2"], cliente_id=["10", "11"], valor_mensal=["100.5", " 20 "],
+        data_inicio=["2024-01-15", ""], status=["ATIVO", "CANCELADO"], tipo_titulo=["Mensal", ""],
+    ))
+    assert rejeitadas.empty
+    assert str(df["id"].dtype) == "int64"
+    assert str(df["cliente_id"].dtype) == "int64"
+    assert str(df["data_inicio"].dtype) == "datetime64[ns]"
+    assert isinstance(df["status"].dtype, pd.CategoricalDtype)
+    assert list(df["status"].cat.categories) == list(esquema_fontes.STATUS_CONTRATO)
+    assert df["data_inicio"].isna().tolist() == [False, True]
+    assert df["tipo_titulo"].isna().tolist() == [False, True]
+    valores = df["valor_mensal"].tolist()
+    if esquema_fontes.pa is not None:
+        assert str(df["valor_mensal"].dtype) == "decimal128(12, 2)[pyarrow]"
+        assert valores == [Decimal("100.50"), Decimal("20.00")]
+    else:
+        assert valores == [100.5, 20.0]
+
+
+def test_clientes_int_opcional_e_anulavel():
+    df, rejeitadas = parse("dim_cliente", _bloco(
+        id=["1", "2"], nome=[" Ana ", ""], estado=["SP", "RJ"], idade=["30", ""],
+        faixa_etaria=["26–35", "60+"], renda_mensal=["1000", "2000.1"], data_inicio=["2020-02-01", "2021-03-04"],
+    ))
+    assert rejeitadas.empty
+    assert str(df["idade"].dtype) == "Int16"
+    assert df["idade"].isna().tolist() == [False, True]
+    assert df["nome"].tolist()[0] == "Ana" and pd.isna(df["nome"].tolist()[1])
+
+
+def test_codigos_de_motivo():
+    df, rejeitadas = parse("fact_premio", _bloco(
+        id=["1", "2", "3", "4", "5", "6", "x7", "8"],
+        contrato_id=["1", "", "1", "1", "1", "1", "1", "0"],
+        data_premio=["2024-01-01", "2024-01-01", "2024-13-01", "2024-01-01", "2024-01-01",
+                     "2024-01-01", "2024-01-01", ""],
+        valor=["10", "10", "10", "-1", "1,50", "10.123", "10", "10"],
+    ))
+    assert df["id"].tolist() == [1]
+    motivos = _motivos(rejeitadas)
+    assert motivos == {
+        "2": "obrigatorio_ausente:contrato_id",
+        "3": "data_invalida:data_premio",
+        "4": "fora_da_faixa:valor",
+        "5": "valor_invalido:valor",
+        "6": "valor_invalido:valor",
+        "x7": "int_invalido:id",
+        "8": "fora_da_faixa:contrato_id;obrigatorio_ausente:data_premio",  # na ordem das colunas
+    }
+    # as reprovadas mantêm o texto original
+    assert rejeitadas.set_index("id").loc["5", "valor"] == "1,50"
+
+
+def test_dominio_e_faixa_de_inteiros():
+    _, rejeitadas = parse("dim_cliente", _bloco(
+        id=["1", "2", "3"], nome=["a", "b", "c"], estado=["SP", "XX", "SP"], idade=["30", "30", "200"],
+        faixa_etaria=["26–35", "26–35", "60+"], renda_mensal=["1", "1", "1"],
+        data_inicio=["2020-01-01", "2020-01-01", "2020-01-01"],
+    ))
+    assert _motivos(rejeitadas) == {"2": "fora_do_dominio:estado", "3": "fora_da_faixa:idade"}
+
+
+@pytest.mark.parametrize("valor, aceito", [
+    ("9999999999.99", True),      # 10 dígitos inteiros: cabe no NUMERIC(12,2)
+    ("0.1", True),
+    ("10000000000", False),       # 11 dígitos estouraria o COPY
+    ("1e3", False),
+    (".5", False),
+])
+def test_dinheiro_limitado_ao_numeric_12_2(valor, aceito):
+    df, rejeitadas = parse("fact_contrato", _bloco(
+        id=["1"], cliente_id=["1"], valor_mensal=[valor], data_inicio=["2024-01-01"],
+        status=["ATIVO"], tipo_titulo=["Mensal"],
+    ))
+    if aceito:
+        assert rejeitadas.empty and len(df) == 1
+    else:
+        assert df.empty
+        assert rejeitadas["motivo"].iloc[0].startswith("valor_invalido:valor_mensal")
+
+
+def test_coluna_obrigatoria_ausente_no_csv():
+    with pytest.raises(ValueError, match="contrato_id"):
+        parse("fact_resgate", _bloco(id=["1"], data_resgate=["2024-01-01"], valor=["1"]))
+
+
+def test_quarentena_um_csv_por_arquivo_e_sha(tmp_path, monkeypatch):
+    monkeypatch.setattr(esquema_fontes, "QUARANTINE_DIR", tmp_path)
+    ruim = _bloco(id=["1"], contrato_id=[""], data_premio=["2024-01-01"], valor=["1"])
+
+    for _ in range(2):  # reler o mesmo arquivo regrava o CSV em vez de duplicar
+        parser = esquema_fontes.ParserFonte("fact_premio", "premios.csv", sha="ab" * 32)
+        parser.parse(ruim)
+        parser.parse(ruim)  # bloco seguinte do mesmo parse: acrescenta
+    esquema_fontes.ParserFonte("fact_premio", "premios.csv", sha="cd" * 32).parse(ruim)
+
+    arquivos = sorted(p.name for p in (tmp_path / "premios").iterdir())
+    assert arquivos == [f"premios.{'ab' * 8}.csv", f"premios.{'cd' * 8}.csv"]
+    gravado = pd.read_csv(tmp_path / "premios" / arquivos[0])
+    assert len(gravado) == 2
+    assert set(gravado["arquivo"]) == {"premios.csv"}
@@ -0,0 +1,52 @@
+"""
+Índice acumulado do CDI (indice_cdi): fatores por dia corrido a partir das
+taxas diárias da série 12 e a rentabilidade acumulada entre datas.
+"""
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from indice_cdi import build_cdi_index
+
+# sexta, segunda e terça: o fim de semana não tem observação
+CDI = pd.DataFrame({
+    "data": pd.to_datetime(["2024-01-05", "2024-01-08", "2024-01-09"]),
+    "cdi_aa": [0.05, 0.04, 0.03],
+})
+
+
+def test_fatores_por_dia_corrido():
+    idx = build_cdi_index(CDI)
+    assert idx.inicio == np.datetime64("2024-01-05")
+    assert idx.fim == np.datetime64("2024-01-10")  # dia seguinte à última observação
+    f1, f2, f3 = 1.0005, 1.0004, 1.0003
+    # fator[k]: acumulado das taxas anteriores ao dia inicio + k
+    np.testing.assert_allclose(idx.fator, [1.0, f1, f1, f1, f1 * f2, f1 * f2 * f3])
+    np.testing.assert_allclose(idx.serie["fator_acumulado"], [f1, f1 * f2, f1 * f2 * f3])
+    assert idx.serie["data"].tolist() == [pd.Timestamp(d).date() for d in CDI["data"]]
+
+
+def test_ordena_e_descarta_nulos():
+    bagunca = pd.concat([CDI.iloc[::-1], pd.DataFrame({"data": [pd.NaT], "cdi_aa": [1.0]})])
+    np.testing.assert_allclose(build_cdi_index(bagunca).fator, build_cdi_index(CDI).fator)
+
+
+def test_accrued_entre_datas():
+    idx = build_cdi_index(CDI)
+    f1, f2, f3 = 1.0005, 1.0004, 1.0003
+    inicio = pd.Series(pd.to_datetime(["2024-01-05", "2024-01-06", "2024-01-08", "2024-01-10"]))
+    np.testing.assert_allclose(idx.accrued(inicio), [f1 * f2 * f3 - 1, f2 * f3 - 1, f2 * f3 - 1, 0.0])
+    np.testing.assert_allclose(idx.accrued(["2024-01-05"], ref=["2024-01-09"]), [f1 * f2 - 1])
+
+
+def test_accrued_fora_do_intervalo_e_datas_nulas():
+    idx = build_cdi_index(CDI)
+    antes, depois, nula = idx.accrued(["2023-12-01", "2025-01-01", None])
+    assert antes == pytest.approx(idx.fator[-1] - 1)  # usa a ponta do índice
+    assert depois == pytest.approx(0.0)
+    assert np.isnan(nula)
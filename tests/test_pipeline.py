@@ -0,0 +1,123 @@
+"""
+Agendador de etapas (pipeline): seleção por --only/--from e execução do DAG.
+
+As etapas são funções puras sobre o contexto; `_dag` monta um grafo pequeno
+com entradas (valores em memória) e `apos` (só ordem), como o do ETL.
+"""
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import pipeline
+from pipeline import Etapa
+
+
+def _dag(log=None):
+    def passo(nome, saidas=()):
+        def fn(ctx):
+            if log is not None:
+                log.append(nome)
+            return {s: nome for s in saidas}
+        return fn
+
+    return [
+        Etapa("marcas", passo("marcas", ("marcas",)), saidas=("marcas",), banco=True),
+        Etapa("leitura_a", passo("leitura_a", ("frame_a",)), entradas=("marcas",), saidas=("frame_a",)),
+        Etapa("leitura_b", passo("leitura_b", ("frame_b",)), entradas=("marcas",), saidas=("frame_b",)),
+        Etapa("carga_a", passo("carga_a"), entradas=("frame_a",), banco=True),
+        Etapa("carga_b", passo("carga_b"), entradas=("frame_b",), apos=("carga_a",), banco=True),
+        Etapa("kpi", passo("kpi", ("kpi",)), saidas=("kpi",), apos=("carga_a", "carga_b"), banco=True),
+        Etapa("relatorio", passo("relatorio"), entradas=("kpi",)),
+    ]
+
+
+def _nomes(etapas):
+    return [e.nome for e in etapas]
+
+
+def test_select_sem_filtro_devolve_todas_na_ordem():
+    assert _nomes(pipeline.select(_dag())) == _nomes(_dag())
+
+
+def test_only_inclui_produtores_das_entradas():
+    # carga_b precisa do frame (leitura_b) e este das marcas; carga_a (só `apos`)
+    # vale como já feita pelo banco e fica de fora
+    assert _nomes(pipeline.select(_dag(), only=["carga_b"])) == ["marcas", "leitura_b", "carga_b"]
+    assert _nomes(pipeline.select(_dag(), only=["leitura_*"])) == ["marcas", "leitura_a", "leitura_b"]
+
+
+def test_from_pega_dependentes_e_produtores():
+    assert _nomes(pipeline.select(_dag(), desde="carga_b")) == [
+        "marcas", "leitura_b", "carga_b", "kpi", "relatorio"]
+    # kpi só depende de carga_a por `apos`: ela não volta para a seleção
+    assert _nomes(pipeline.select(_dag(), desde="kpi")) == ["kpi", "relatorio"]
+
+
+def test_only_e_from_combinados_e_fixas():
+    sel = pipeline.select(_dag(), only=["kpi", "relatorio"], desde="carga_a", fixas=("marcas",))
+    assert _nomes(sel) == ["marcas", "kpi", "relatorio"]
+
+
+@pytest.mark.parametrize("kwargs", [{"only": ["nada_*"]}, {"desde": "nada"}])
+def test_padrao_sem_etapa_e_erro(kwargs):
+    with pytest.raises(ValueError):
+        pipeline.select(_dag(), **kwargs)
+
+
+def test_ciclo_e_saida_duplicada_sao_erro():
+    ciclo = [Etapa("a", lambda ctx: None, apos=("b",)), Etapa("b", lambda ctx: None, apos=("a",))]
+    with pytest.raises(ValueError, match="Ciclo"):
+        pipeline.levels(ciclo)
+    dup = [Etapa("a", lambda ctx: {"x": 1}, saidas=("x",)), Etapa("b", lambda ctx: {"x": 2}, saidas=("x",))]
+    with pytest.raises(ValueError, match="produzida"):
+        pipeline.select(dup)
+
+
+def test_run_respeita_dependencias_e_grava_saidas():
+    ordem = []
+    ctx = pipeline.run(_dag(ordem), {}, log=lambda msg: None)
+    assert sorted(ordem) == sorted(_nomes(_dag()))
+    for antes, depois in [("marcas", "leitura_a"), ("leitura_b", "carga_b"), ("carga_a", "carga_b"),
+                          ("carga_b", "kpi"), ("kpi", "relatorio")]:
+        assert ordem.index(antes) < ordem.index(depois)
+    assert ctx["frame_a"] == "leitura_a" and ctx["kpi"] == "kpi"
+
+
+def test_run_falha_propaga_e_nao_inicia_dependentes():
+    ordem = []
+
+    def quebra(ctx):
+        raise RuntimeError("arquivo corrompido")
+
+    etapas = [Etapa("leitura_b", quebra, entradas=("marcas",), saidas=("frame_b",))
+              if e.nome == "leitura_b" else e for e in _dag(ordem)]
+    mensagens = []
+    with pytest.raises(RuntimeError, match="arquivo corrompido"):
+        pipeline.run(etapas, {}, log=mensagens.append)
+    assert "carga_b" not in ordem and "kpi" not in ordem and "relatorio" not in ordem
+    assert any("leitura_b falhou" in m for m in mensagens)
+
+
+def test_run_etapa_sem_saida_declarada_falha():
+    with pytest.raises(RuntimeError, match="não produziu"):
+        pipeline.run([Etapa("a", lambda ctx: {}, saidas=("x",))], {}, log=lambda msg: None)
+
+
+def test_run_etapas_de_banco_uma_por_vez():
+    ativas, pico, trava = [0], [0], threading.Lock()
+
+    def banco(ctx):
+        with trava:
+            ativas[0] += 1
+            pico[0] = max(pico[0], ativas[0])
+        threading.Event().wait(0.02)
+        with trava:
+            ativas[0] -= 1
+
+    etapas = [Etapa(f"carga_{i}", banco, banco=True) for i in range(4)]
+    pipeline.run(etapas, {}, log=lambda msg: None)
+    assert pico[0] == 1
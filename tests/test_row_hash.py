@@ -0,0 +1,75 @@
+"""
+row_hash (etl_capitalizacao.with_row_hash): o mesmo conteúdo de origem dá o
+mesmo hash venha o bloco do INSERT em lotes (objetos date, Decimal), do COPY
+(datetime64) ou do cache colunar (decimal do Arrow).
+
+`TIPOS` imita information_schema.columns de analytics.fact_contrato.
+"""
+import sys
+from datetime import date
+from decimal import Decimal
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import etl_capitalizacao as etl
+
+TIPOS = {
+    "id": "bigint", "cliente_id": "bigint", "valor_mensal": "numeric", "data_inicio": "date",
+    "status": "text", "tipo_titulo": "text", "rentabilidade_estim": "double precision",
+    "row_hash": "bigint",
+}
+
+
+def _contratos(datas, valores, **extra):
+    return pd.DataFrame({
+        "id": [1, 2], "cliente_id": [10, 20], "valor_mensal": valores, "data_inicio": datas,
+        "status": ["ATIVO", "CANCELADO"], "tipo_titulo": ["Mensal", "Anual"], **extra,
+    })
+
+
+def _hashes(df):
+    return etl.with_row_hash(df, "fact_contrato", TIPOS)["row_hash"].tolist()
+
+
+VALORES = [Decimal("100.50"), Decimal("20.00")]
+
+
+def test_date_e_datetime64_dao_o_mesmo_hash():
+    como_date = _contratos([date(2024, 1, 15), None], VALORES)
+    como_datetime64 = etl.coerce_dates(_contratos(["2024-01-15", None], VALORES), ["data_inicio"], as_date=False)
+    assert str(como_datetime64["data_inicio"].dtype) == "datetime64[ns]"
+    assert _hashes(como_date) == _hashes(como_datetime64)
+
+
+def test_decimal_python_e_decimal_arrow_dao_o_mesmo_hash():
+    pa = pytest.importorskip("pyarrow")
+    datas = [date(2024, 1, 15), date(2024, 2, 1)]
+    arrow = pd.Series(VALORES, dtype=pd.ArrowDtype(pa.decimal128(12, 2)))
+    assert _hashes(_contratos(datas, VALORES)) == _hashes(_contratos(datas, arrow))
+    assert _hashes(_contratos(datas, VALORES)) == _hashes(_contratos(datas, [100.5, 20.0]))
+
+
+def test_categoria_e_texto_dao_o_mesmo_hash():
+    datas = [date(2024, 1, 15), date(2024, 2, 1)]
+    texto = _contratos(datas, VALORES)
+    categoria = texto.assign(status=texto["status"].astype("category"))
+    assert _hashes(texto) == _hashes(categoria)
+
+
+def test_hash_muda_com_a_fonte_e_ignora_colunas_derivadas():
+    datas = [date(2024, 1, 15), date(2024, 2, 1)]
+    base = _hashes(_contratos(datas, VALORES))
+    outro_valor = _hashes(_contratos(datas, [Decimal("100.51"), Decimal("20.00")]))
+    assert outro_valor[0] != base[0] and outro_valor[1] == base[1]
+    # rentabilidade_estim vem do CDI (--bcb), não da fonte
+    assert _hashes(_contratos(datas, VALORES, rentabilidade_estim=[0.1, 0.2])) == base
+
+
+def test_sem_row_hash_no_destino_devolve_o_bloco_intacto():
+    df = _contratos([date(2024, 1, 15), None], VALORES)
+    tipos = {k: v for k, v in TIPOS.items() if k != "row_hash"}
+    assert etl.with_row_hash(df, "fact_contrato", tipos) is df
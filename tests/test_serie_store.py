@@ -0,0 +1,75 @@
+"""
+Armazenamento local das séries SGS (serie_store) num STORE_DIR temporário:
+append só após a última data, recorte por período e TTL.
+"""
+import sys
+import time
+from datetime import timedelta
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import serie_store
+
+
+@pytest.fixture(autouse=True)
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(serie_store, "STORE_DIR", tmp_path)
+    monkeypatch.setattr(serie_store, "_memo", {})
+    return tmp_path
+
+
+def _serie(*pares):
+    return pd.DataFrame({"data": pd.to_datetime([d for d, _ in pares]), "valor": [v for _, v in pares]})
+
+
+def _datas(df):
+    return df["data"].dt.strftime("%Y-%m-%d").tolist()
+
+
+def test_serie_nova_e_ordenada_sem_datas_repetidas(store):
+    novos = serie_store.append_series(12, _serie(
+        ("2024-01-03", 3.0), ("2024-01-02", 2.0), ("2024-01-03", 3.5), ("2024-01-04", None)))
+    assert novos == 2
+    df = serie_store.read_series(12)
+    assert _datas(df) == ["2024-01-02", "2024-01-03"]
+    assert df["valor"].tolist() == [2.0, 3.5]  # última ocorrência de cada data
+    assert (store / "12.npz").exists()
+    assert serie_store.last_date(12) == pd.Timestamp("2024-01-03")
+
+
+def test_append_so_depois_da_ultima_data():
+    serie_store.append_series(12, _serie(("2024-01-02", 2.0), ("2024-01-03", 3.0)))
+    novos = serie_store.append_series(12, _serie(("2024-01-03", 99.0), ("2024-01-01", 99.0), ("2024-01-05", 5.0)))
+    assert novos == 1
+    df = serie_store.read_series(12)
+    assert _datas(df) == ["2024-01-02", "2024-01-03", "2024-01-05"]
+    assert df["valor"].tolist() == [2.0, 3.0, 5.0]
+
+
+def test_recorte_inclusivo():
+    serie_store.append_series(433, _serie(("2024-01-01", 1.0), ("2024-02-01", 2.0), ("2024-03-01", 3.0)))
+    assert _datas(serie_store.read_series(433, inicio="2024-02-01")) == ["2024-02-01", "2024-03-01"]
+    assert _datas(serie_store.read_series(433, fim="2024-02-01")) == ["2024-01-01", "2024-02-01"]
+    assert _datas(serie_store.read_series(433, "2024-01-15", "2024-02-15")) == ["2024-02-01"]
+
+
+def test_serie_ausente():
+    assert serie_store.read_series(12).empty
+    assert serie_store.last_date(12) is None
+    assert not serie_store.is_fresh(12)
+
+
+def test_ttl_e_consulta_sem_pontos_novos(monkeypatch):
+    serie_store.append_series(12, _serie(("2024-01-02", 2.0)), fetched=False)
+    assert not serie_store.is_fresh(12)  # sem consulta registrada
+
+    serie_store.append_series(12, _serie(("2024-01-02", 2.0)))  # consultou, nada novo: reinicia o TTL
+    assert serie_store.is_fresh(12)
+    agora = time.time()
+    monkeypatch.setattr(serie_store.time, "time", lambda: agora + serie_store.TTL[12].total_seconds() + 1)
+    assert not serie_store.is_fresh(12)
+    assert serie_store.is_fresh(12, ttl=timedelta(days=1))